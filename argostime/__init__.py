@@ -21,24 +21,32 @@
 """
 
 # Configure the logger before anything else, so it can be used in decorators!
-import logging
-logging.basicConfig(
-    filename="argostime.log",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(processName)s - %(levelname)s - %(module)s - %(funcName)s - %(message)s"
-)
+from argostime.log import configure_logging
+configure_logging()
 
+import importlib.util
+import logging
 import os.path
-
-import configparser
+from typing import Optional
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from jinja2 import FileSystemBytecodeCache
 
-db: SQLAlchemy = SQLAlchemy()
+from argostime import database
+from argostime.config import get_config
+
+db: SQLAlchemy = SQLAlchemy(session_options={"class_": database.RoutingSession})
+
+# Written at deploy time by save_commit.py, so the .git directory isn't read on startup
+COMMIT_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "../commit.txt"))
 
 def get_current_commit() -> str:
     """Return the hexadecimal hash of the current running commit."""
+    if os.path.exists(COMMIT_FILE):
+        with open(COMMIT_FILE, "r") as file_commit:
+            return file_commit.read().strip()
+
     git_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.git"))
     with open(os.path.join(git_path, "HEAD"), "r") as file_head:
         hexsha = file_head.read().strip()
@@ -47,12 +55,15 @@ def get_current_commit() -> str:
                 hexsha = file_ref.read().strip()
     return hexsha
 
-def create_app():
-    """Return a flask object for argostime, initialize logger and db."""
+def create_app(create_schema: Optional[bool] = None):
+    """Return a flask object for argostime, initialize logger and db.
+
+    The tables are only created if create_schema is True, or if it is None and
+    create_schema is set in the [argostime] section of argostime.conf.
+    """
     logging.getLogger("matplotlib.font_manager").disabled = True
 
-    config = configparser.ConfigParser()
-    config.read("argostime.conf")
+    config = get_config()
     app = Flask(__name__)
 
     logging.debug("Found sections %s in config", config.sections())
@@ -65,15 +76,42 @@ def create_app():
             database=config["mariadb"]["database"]
         )
         logging.debug(app.config["SQLALCHEMY_DATABASE_URI"])
+    elif "postgresql" in config:
+        if importlib.util.find_spec("psycopg2") is None:
+            raise ImportError("Using PostgreSQL needs psycopg2, install it with "
+                              "pip install -r requirements_postgresql.txt")
+        app.config["SQLALCHEMY_DATABASE_URI"] = "postgresql+psycopg2://{user}:{password}@{server}/{database}".format(
+            user=config["postgresql"]["user"],
+            password=config["postgresql"]["password"],
+            server=config["postgresql"]["server"],
+            database=config["postgresql"]["database"]
+        )
+        logging.debug(app.config["SQLALCHEMY_DATABASE_URI"])
     else:
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db'
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = database.engine_options()
 
     app.config["GIT_CURRENT_COMMIT"] = get_current_commit()
 
+    # Keep compiled templates, so a new worker doesn't compile them again
+    template_cache: str = config.get("argostime", "template_cache", fallback="template_cache")
+    os.makedirs(template_cache, exist_ok=True)
+    app.jinja_options = {
+        **app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(template_cache)
+    }
+
     db.init_app(app)
 
+    from . import profiling
+    profiling.init_app(app)
+
+    if create_schema is None:
+        create_schema = config.getboolean("argostime", "create_schema", fallback=False)
+
     with app.app_context():
+        database.init_app(app, db.engines, database.replica_uri())
         from . import routes
-        db.create_all()
+        if create_schema:
+            db.create_all()
         return app
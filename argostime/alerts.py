@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+    alerts.py
+
+    Price alerts: watches of offers and products that are checked whenever a price
+    is stored, and the delivery of the notifications they trigger.
+
+    A watch belongs to one offer, or to a product and then to all of its offers.
+    It is triggered when the new price of an offer is below its threshold, when
+    the offer goes on sale or when the price is lower than ever before. A watch is
+    triggered when its condition becomes true, not again for every crawl while it
+    stays true.
+
+    check_watches() only reads the watches of the offer and its product through
+    their indexes, so storing a price doesn't get slower as more watches are
+    added. The triggered watches are stored as Notifications, which are sent by
+    deliver_notifications() after a crawl run, all notifications of a contact in
+    one message. The sink that sends them is set in the [alerts] section: a file,
+    an SMTP server or a webhook. Other sinks can be added to SINKS.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from email.message import EmailMessage
+from enum import Enum
+import json
+import logging
+import smtplib
+from sys import maxsize
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from argostime import db
+from argostime.config import get_config
+from argostime.models import Notification, Price, ProductOffer, Watch
+from argostime.models import get_effective_price_or_none
+
+__config = get_config()
+
+SINK: str = __config.get("alerts", "sink", fallback="file")
+ALERT_FILE: str = __config.get("alerts", "file", fallback="alerts.jsonl")
+SMTP_SERVER: str = __config.get("alerts", "smtp_server", fallback="localhost")
+SMTP_PORT: int = __config.getint("alerts", "smtp_port", fallback=1025)
+SENDER: str = __config.get("alerts", "sender", fallback="argostime@localhost")
+WEBHOOK_URL: Optional[str] = __config.get("alerts", "webhook_url", fallback=None)
+BATCH_SIZE: int = __config.getint("alerts", "batch_size", fallback=100)
+TIMEOUT: float = __config.getfloat("alerts", "timeout", fallback=10)
+
+
+class WatchKind(Enum):
+    """Kind of a Watch"""
+    # The price is lower than the threshold of the watch
+    BELOW = "below"
+    # The offer is on sale
+    SALE = "sale"
+    # The price is lower than the minimum price of the offer so far
+    LOW = "low"
+
+
+def check_watches(offer: ProductOffer, price: Price,
+                  previous: Optional[Price]) -> List[Notification]:
+    """Add a Notification for every watch of the offer or its product that is
+    triggered by price, the new price of the offer, which was previous before.
+
+    Must be called before the minimum price of the offer is updated.
+    """
+    watches: List[Watch] = db.session.scalars(
+        db.select(Watch).where(db.or_(
+            Watch.product_offer_id == offer.id,
+            Watch.product_id == offer.product_id
+        ))
+    ).all()
+    if not watches:
+        return []
+
+    new_price: Optional[float] = get_effective_price_or_none(price)
+    if new_price is None:
+        return []
+    previous_price: Optional[float] = get_effective_price_or_none(previous)
+
+    def triggered(watch: Watch) -> bool:
+        kind = WatchKind(watch.kind)
+        if kind == WatchKind.BELOW:
+            return new_price < watch.threshold and (
+                previous_price is None or previous_price >= watch.threshold)
+        if kind == WatchKind.SALE:
+            return price.on_sale and (previous is None or not previous.on_sale)
+        # Without a previous price, every price would be the lowest ever
+        return (previous_price is not None and offer.minimum_price is not None
+                and offer.minimum_price < maxsize and new_price < offer.minimum_price)
+
+    now = datetime.now()
+    notifications: List[Notification] = [
+        Notification(watch_id=watch.id, product_offer_id=offer.id, price=new_price, created=now)
+        for watch in watches if triggered(watch)
+    ]
+    db.session.add_all(notifications)
+    if notifications:
+        logging.info("Price %s of %s triggered %d watches", new_price, offer, len(notifications))
+    return notifications
+
+
+def describe(notification: Notification) -> str:
+    """Return the message of a notification."""
+    watch: Watch = notification.watch
+    offer: ProductOffer = notification.product_offer
+    product: str = offer.product.name
+    shop: str = offer.webshop.name
+    kind = WatchKind(watch.kind)
+
+    if kind == WatchKind.BELOW:
+        message = (f"{product} kost bij {shop} nu €{notification.price:.2f}, "
+                   f"minder dan €{watch.threshold:.2f}")
+    elif kind == WatchKind.SALE:
+        message = f"{product} is bij {shop} in de aanbieding voor €{notification.price:.2f}"
+    else:
+        message = (f"{product} is bij {shop} nog nooit zo goedkoop geweest: "
+                   f"€{notification.price:.2f}")
+    return f"{message} ({offer.url})"
+
+
+class AlertSink(ABC):
+    """Sends the notifications of a contact."""
+
+    @abstractmethod
+    def send(self, contact: str, notifications: List[Notification]) -> None:
+        """Send the notifications to contact in one message, raise OSError if that fails."""
+
+
+class FileSink(AlertSink):
+    """Appends every notification to a file as a line of JSON."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, contact: str, notifications: List[Notification]) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            for notification in notifications:
+                file.write(json.dumps({
+                    "contact": contact,
+                    "created": notification.created.isoformat(),
+                    "product_offer_id": notification.product_offer_id,
+                    "price": notification.price,
+                    "message": describe(notification),
+                }) + "\n")
+
+
+class SMTPSink(AlertSink):
+    """Sends an e-mail to the contact, for example through a local SMTP server."""
+
+    def __init__(self, server: str, port: int, sender: str):
+        self.server = server
+        self.port = port
+        self.sender = sender
+
+    def send(self, contact: str, notifications: List[Notification]) -> None:
+        message = EmailMessage()
+        message["Subject"] = f"Argostimè: {len(notifications)} prijsmelding(en)"
+        message["From"] = self.sender
+        message["To"] = contact
+        message.set_content("\n".join(describe(notification) for notification in notifications))
+        with smtplib.SMTP(self.server, self.port, timeout=TIMEOUT) as smtp:
+            smtp.send_message(message)
+
+
+class WebhookSink(AlertSink):
+    """Posts the notifications of a contact as JSON to a URL."""
+
+    def __init__(self, url: Optional[str]):
+        self.url = url
+
+    def send(self, contact: str, notifications: List[Notification]) -> None:
+        if self.url is None:
+            raise OSError("No webhook_url in the [alerts] section")
+        response = requests.post(self.url, timeout=TIMEOUT, json={
+            "contact": contact,
+            "notifications": [
+                {
+                    "kind": notification.watch.kind,
+                    "product_offer_id": notification.product_offer_id,
+                    "price": notification.price,
+                    "message": describe(notification),
+                }
+                for notification in notifications
+            ],
+        })
+        response.raise_for_status()
+
+
+# The sinks by name, as used in the [alerts] section
+SINKS: Dict[str, Callable[[], AlertSink]] = {
+    "file": lambda: FileSink(ALERT_FILE),
+    "smtp": lambda: SMTPSink(SMTP_SERVER, SMTP_PORT, SENDER),
+    "webhook": lambda: WebhookSink(WEBHOOK_URL),
+}
+
+
+def deliver_notifications(sink: Optional[AlertSink] = None,
+                          batch_size: int = BATCH_SIZE) -> int:
+    """Send the notifications that have not been sent yet, in batches of batch_size.
+
+    Uses the sink configured in the [alerts] section, unless another one is given.
+    Notifications that could not be sent are tried again the next time. Returns
+    the number of notifications sent.
+    """
+    if sink is None:
+        sink = SINKS[SINK]()
+
+    sent: int = 0
+    last_id: int = 0
+    while True:
+        notifications: List[Notification] = db.session.scalars(
+            db.select(Notification)
+                .where(Notification.sent.is_(None), Notification.id > last_id)
+                .order_by(Notification.id)
+                .limit(batch_size)
+        ).all()
+        if not notifications:
+            break
+        last_id = notifications[-1].id
+
+        per_contact: Dict[str, List[Notification]] = {}
+        for notification in notifications:
+            per_contact.setdefault(notification.watch.contact, []).append(notification)
+
+        now = datetime.now()
+        for contact, contact_notifications in per_contact.items():
+            try:
+                sink.send(contact, contact_notifications)
+            except OSError as exception:
+                logging.error("Could not send %d notifications to %s: %s",
+                              len(contact_notifications), contact, exception)
+                continue
+            for notification in contact_notifications:
+                notification.sent = now
+            sent += len(contact_notifications)
+        db.session.commit()
+
+    if sent > 0:
+        logging.info("Sent %d notifications", sent)
+    return sent
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+    config.py
+
+    The configuration in argostime.conf, which is parsed only once per process.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import configparser
+import functools
+
+CONFIG_FILE = "argostime.conf"
+
+
+@functools.lru_cache(maxsize=None)
+def get_config() -> configparser.ConfigParser:
+    """Return the parsed argostime.conf.
+
+    The same object is returned to every module, so it must not be modified.
+    """
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    return config
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+    crawl_metrics.py
+
+    Metrics of the crawls per shop: the latency of requests, the size of responses,
+    the time spent parsing, the results by outcome and the number of retries.
+
+    The metrics of a process are written as a JSON summary at the end of every
+    update run. The /metrics route of the web app shows the latest summary, together
+    with the depth of the crawl queue, in the Prometheus text format.
+
+    This module does not import any crawler code, so the web app can use it.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import bisect
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import urllib.parse
+
+from argostime.config import get_config
+from argostime.exceptions import CircuitOpenException, CrawlerException
+from argostime.exceptions import PageNotFoundException, WebsiteNotImplementedException
+
+__config = get_config()
+
+METRICS_FILE: str = __config.get("crawler", "metrics_file", fallback="crawl_metrics.json")
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PARSE_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+BYTES_BUCKETS: Tuple[float, ...] = (1e3, 1e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+
+
+class Outcome(Enum):
+    """Result of crawling a URL"""
+    OK = "ok"
+    NOT_FOUND = "not_found"
+    CRAWLER_EXCEPTION = "crawler_exception"
+    NOT_IMPLEMENTED = "not_implemented"
+    DEFERRED = "deferred"
+    ERROR = "error"
+
+    @classmethod
+    def from_exception(cls, exception: Exception) -> "Outcome":
+        """Return the outcome of a crawl that raised exception."""
+        if isinstance(exception, PageNotFoundException):
+            return cls.NOT_FOUND
+        if isinstance(exception, CircuitOpenException):
+            return cls.DEFERRED
+        if isinstance(exception, CrawlerException):
+            return cls.CRAWLER_EXCEPTION
+        if isinstance(exception, WebsiteNotImplementedException):
+            return cls.NOT_IMPLEMENTED
+        return cls.ERROR
+
+
+@dataclass
+class Histogram:
+    """Number of observations per bucket, the last bucket counts everything above
+    the highest bound."""
+    bounds: Tuple[float, ...]
+    counts: List[int] = field(default_factory=list)
+    total: float = 0
+    count: int = 0
+
+    def __post_init__(self):
+        if not self.counts:
+            self.counts = [0] * (len(self.bounds) + 1)
+
+    def observe(self, value: float) -> None:
+        """Add an observation."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        """Add the observations of other, which must have the same bounds."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.count += other.count
+
+    def to_json(self) -> Dict[str, Any]:
+        """Return the histogram as a JSON serializable dict."""
+        return {"bounds": list(self.bounds), "counts": self.counts,
+                "sum": self.total, "count": self.count}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "Histogram":
+        """Return the histogram stored by to_json()."""
+        return cls(tuple(data["bounds"]), list(data["counts"]), data["sum"], data["count"])
+
+
+@dataclass
+class ShopMetrics:
+    """Metrics of the crawls of one shop."""
+    request_seconds: Histogram = field(default_factory=lambda: Histogram(LATENCY_BUCKETS))
+    response_bytes: Histogram = field(default_factory=lambda: Histogram(BYTES_BUCKETS))
+    parse_seconds: Histogram = field(default_factory=lambda: Histogram(PARSE_BUCKETS))
+    outcomes: Dict[str, int] = field(default_factory=dict)
+    retries: int = 0
+
+    def merge(self, other: "ShopMetrics") -> None:
+        """Add the metrics of other."""
+        self.request_seconds.merge(other.request_seconds)
+        self.response_bytes.merge(other.response_bytes)
+        self.parse_seconds.merge(other.parse_seconds)
+        for outcome, count in other.outcomes.items():
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + count
+        self.retries += other.retries
+
+    def to_json(self) -> Dict[str, Any]:
+        """Return the metrics as a JSON serializable dict."""
+        return {
+            "request_seconds": self.request_seconds.to_json(),
+            "response_bytes": self.response_bytes.to_json(),
+            "parse_seconds": self.parse_seconds.to_json(),
+            "outcomes": dict(self.outcomes),
+            "retries": self.retries,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "ShopMetrics":
+        """Return the metrics stored by to_json()."""
+        return cls(
+            Histogram.from_json(data["request_seconds"]),
+            Histogram.from_json(data["response_bytes"]),
+            Histogram.from_json(data["parse_seconds"]),
+            dict(data["outcomes"]),
+            data["retries"],
+        )
+
+
+@dataclass
+class _CrawlTimer:
+    fetch_seconds: float = 0
+
+
+_shops: Dict[str, ShopMetrics] = {}
+_lock = threading.Lock()
+_started: datetime = datetime.now()
+_crawl_timer: ContextVar[Optional[_CrawlTimer]] = ContextVar("crawl_timer", default=None)
+
+
+def shop_label(url: str) -> str:
+    """Return the name of the shop of url as used in the metrics."""
+    return urllib.parse.urlparse(url).netloc.removeprefix("www.")
+
+
+def _shop(url: str) -> ShopMetrics:
+    """Return the metrics of the shop of url, the caller must hold _lock."""
+    return _shops.setdefault(shop_label(url), ShopMetrics())
+
+
+def record_request(url: str, seconds: float) -> None:
+    """Record the latency of a request, including failed ones."""
+    with _lock:
+        _shop(url).request_seconds.observe(seconds)
+
+
+def record_response(url: str, size: int, seconds: float) -> None:
+    """Record the size of a response and the total time fetch() spent on it."""
+    with _lock:
+        _shop(url).response_bytes.observe(size)
+    timer = _crawl_timer.get()
+    if timer is not None:
+        timer.fetch_seconds += seconds
+
+
+def record_retry(url: str) -> None:
+    """Record that a request to url is retried."""
+    with _lock:
+        _shop(url).retries += 1
+
+
+def record_crawl(url: str, outcome: Outcome, parse_seconds: Optional[float] = None) -> None:
+    """Record the outcome of a crawl, and the time the crawler spent on other things
+    than fetching pages."""
+    with _lock:
+        shop = _shop(url)
+        shop.outcomes[outcome.value] = shop.outcomes.get(outcome.value, 0) + 1
+        if parse_seconds is not None:
+            shop.parse_seconds.observe(parse_seconds)
+
+
+@contextmanager
+def measure_crawl(url: str) -> Iterator[None]:
+    """Record the outcome and the parse time of the crawl of url run in this block."""
+    timer = _CrawlTimer()
+    token = _crawl_timer.set(timer)
+    start = time.perf_counter()
+    outcome: Outcome = Outcome.OK
+    try:
+        yield
+    except Exception as exception:
+        outcome = Outcome.from_exception(exception)
+        raise
+    finally:
+        _crawl_timer.reset(token)
+        parse_seconds = max(0.0, time.perf_counter() - start - timer.fetch_seconds)
+        record_crawl(url, outcome, parse_seconds if outcome == Outcome.OK else None)
+
+
+def reset_metrics() -> None:
+    """Forget all metrics and start a new run."""
+    global _started  # pylint: disable=W0603
+
+    with _lock:
+        _shops.clear()
+        _started = datetime.now()
+
+
+def summary() -> Dict[str, Any]:
+    """Return the metrics of this process as a JSON serializable dict."""
+    with _lock:
+        return {
+            "started": _started.isoformat(),
+            "finished": datetime.now().isoformat(),
+            "shops": {name: shop.to_json() for name, shop in sorted(_shops.items())},
+        }
+
+
+def merge_summary(other: Dict[str, Any]) -> None:
+    """Add the metrics of another process, as returned by its summary()."""
+    global _started  # pylint: disable=W0603
+
+    with _lock:
+        _started = min(_started, datetime.fromisoformat(other["started"]))
+        for name, data in other["shops"].items():
+            _shops.setdefault(name, ShopMetrics()).merge(ShopMetrics.from_json(data))
+
+
+def write_summary(path: str = METRICS_FILE) -> None:
+    """Write the summary of this run to path, replacing the previous one."""
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(summary(), file, indent=4)
+    os.replace(temporary_path, path)
+    logging.info("Wrote the crawl metrics of this run to %s", path)
+
+
+def load_summary(path: str = METRICS_FILE) -> Optional[Dict[str, Any]]:
+    """Return the summary written by the latest run, or None if there is none."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except ValueError as exception:
+        logging.error("Could not read the crawl metrics in %s: %s", path, exception)
+        return None
+
+
+def _labels(**labels: str) -> str:
+    escaped = (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in labels.values()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def _render_histogram(lines: List[str], name: str, histograms: Dict[str, Histogram]) -> None:
+    for shop, histogram in histograms.items():
+        cumulative: int = 0
+        for bound, count in zip(histogram.bounds + (float("inf"),), histogram.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            lines.append(f"{name}_bucket{_labels(shop=shop, le=le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(shop=shop)} {histogram.total}")
+        lines.append(f"{name}_count{_labels(shop=shop)} {histogram.count}")
+
+
+def render_prometheus(
+    metrics: Optional[Dict[str, Any]],
+    queue_depth: Optional[Dict[Tuple[str, str], int]] = None
+    ) -> str:
+    """Return the metrics in the Prometheus text exposition format.
+
+    metrics is a summary as returned by summary() or load_summary(), queue_depth
+    the number of crawl jobs per (hostname, status).
+    """
+    lines: List[str] = []
+    shops: Dict[str, ShopMetrics] = {}
+    if metrics is not None:
+        shops = {name: ShopMetrics.from_json(data) for name, data in metrics["shops"].items()}
+        finished = datetime.fromisoformat(metrics["finished"]).timestamp()
+        lines += [
+            "# HELP argostime_crawl_run_timestamp_seconds End of the run the metrics are from.",
+            "# TYPE argostime_crawl_run_timestamp_seconds gauge",
+            f"argostime_crawl_run_timestamp_seconds {finished}",
+        ]
+
+    for name, help_text, attribute in (
+            ("argostime_crawl_request_duration_seconds",
+             "Latency of requests to the shop.", "request_seconds"),
+            ("argostime_crawl_response_bytes",
+             "Size of the responses of the shop.", "response_bytes"),
+            ("argostime_crawl_parse_duration_seconds",
+             "Time spent by the crawler on other things than fetching pages.",
+             "parse_seconds")):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        _render_histogram(lines, name, {
+            shop: getattr(metrics_of_shop, attribute) for shop, metrics_of_shop in shops.items()
+        })
+
+    lines += [
+        "# HELP argostime_crawl_results_total Crawls by outcome.",
+        "# TYPE argostime_crawl_results_total counter",
+    ]
+    for shop, metrics_of_shop in shops.items():
+        for outcome, count in sorted(metrics_of_shop.outcomes.items()):
+            lines.append(f"argostime_crawl_results_total{_labels(shop=shop, outcome=outcome)} "
+                         f"{count}")
+
+    lines += [
+        "# HELP argostime_crawl_retries_total Retried requests.",
+        "# TYPE argostime_crawl_retries_total counter",
+    ]
+    for shop, metrics_of_shop in shops.items():
+        lines.append(f"argostime_crawl_retries_total{_labels(shop=shop)} {metrics_of_shop.retries}")
+
+    lines += [
+        "# HELP argostime_crawl_queue_jobs Crawl jobs in the queue by status.",
+        "# TYPE argostime_crawl_queue_jobs gauge",
+    ]
+    for (hostname, status), count in sorted((queue_depth or {}).items()):
+        lines.append(f"argostime_crawl_queue_jobs{_labels(shop=hostname, status=status)} {count}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+    crawl_queue.py
+
+    Queue of crawl jobs in the database, so any number of crawl workers on one or
+    more machines can share the work of updating the prices.
+
+    A worker claims a job by taking a lease on it. On MariaDB the job is selected
+    with SELECT ... FOR UPDATE SKIP LOCKED, so workers never wait for each other's
+    rows. On every database the claim itself is a conditional UPDATE that only
+    succeeds if the job is still free, which is all SQLite needs. Jobs of a worker
+    that died become available again once their lease expires, unless they were
+    already claimed max_attempts times, then they fail.
+
+    The limits per host are stored in CrawlHost rows: at most host_concurrency jobs
+    of a host run at the same time, and after every crawl the host is left alone for
+    a random delay between host_delay_min and host_delay_max seconds.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from datetime import datetime, timedelta
+from enum import Enum
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, current_app
+import requests
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from argostime import db
+from argostime.config import get_config
+from argostime.crawler import CrawlResult, crawl_url
+from argostime.crawler.circuit_breaker import RESET_TIMEOUT
+from argostime.exceptions import CircuitOpenException, CrawlerException
+from argostime.exceptions import PageNotFoundException, WebsiteNotImplementedException
+from argostime.models import CrawlHost, CrawlJob, ProductOffer
+from argostime.products import store_crawl_results
+
+__config = get_config()
+
+LEASE_TIMEOUT: float = __config.getfloat("queue", "lease_timeout", fallback=600)
+HOST_CONCURRENCY: int = __config.getint("queue", "host_concurrency", fallback=1)
+HOST_DELAY_MIN: float = __config.getfloat("queue", "host_delay_min", fallback=1)
+HOST_DELAY_MAX: float = __config.getfloat("queue", "host_delay_max", fallback=180)
+MAX_ATTEMPTS: int = __config.getint("queue", "max_attempts", fallback=3)
+RETRY_DELAY: float = __config.getfloat("queue", "retry_delay", fallback=900)
+
+
+class JobStatus(Enum):
+    """Status of a CrawlJob"""
+    PENDING = "pending"
+    CLAIMED = "claimed"
+    # Crawled, the result waits in the queue of a ResultWriter
+    STORING = "storing"
+    DEFERRED = "deferred"
+    DONE = "done"
+    FAILED = "failed"
+
+
+OPEN_STATUSES = (JobStatus.PENDING.value, JobStatus.CLAIMED.value, JobStatus.STORING.value,
+                 JobStatus.DEFERRED.value)
+# Jobs that were handed to a worker or a ResultWriter, until their lease expires
+LEASED_STATUSES = (JobStatus.CLAIMED.value, JobStatus.STORING.value)
+
+
+def default_worker_name() -> str:
+    """Return a name for this worker that is unique across machines."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _claimable(now: datetime):
+    """Return the condition for jobs that may be claimed at time now."""
+    return db.or_(
+        db.and_(
+            CrawlJob.status.in_([JobStatus.PENDING.value, JobStatus.DEFERRED.value]),
+            CrawlJob.not_before <= now
+        ),
+        db.and_(
+            CrawlJob.status.in_(LEASED_STATUSES),
+            CrawlJob.lease_expires < now,
+            CrawlJob.attempts < MAX_ATTEMPTS
+        )
+    )
+
+
+def _fail_abandoned_jobs(now: datetime) -> None:
+    """Fail the jobs whose lease expired after their last attempt.
+
+    A job that keeps killing the workers that claim it is not handed out forever.
+    """
+    result = db.session.execute(
+        db.update(CrawlJob)
+            .where(CrawlJob.status.in_(LEASED_STATUSES))
+            .where(CrawlJob.lease_expires < now)
+            .where(CrawlJob.attempts >= MAX_ATTEMPTS)
+            .values(status=JobStatus.FAILED.value, lease_expires=None)
+    )
+    db.session.commit()
+    if result.rowcount > 0:
+        logging.error("%d crawl jobs failed, their lease expired after %d attempts",
+                      result.rowcount, MAX_ATTEMPTS)
+
+
+def _supports_skip_locked() -> bool:
+    return db.engine.dialect.name in ("mysql", "mariadb", "postgresql")
+
+
+def get_crawl_host(hostname: str) -> CrawlHost:
+    """Return the CrawlHost for hostname, adding it if needed."""
+    host: CrawlHost = db.session.scalar(
+        db.select(CrawlHost).where(CrawlHost.hostname == hostname))
+    if host is not None:
+        return host
+
+    host = CrawlHost(hostname=hostname, version=0, next_request=datetime.now())
+    db.session.add(host)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker added it at the same time
+        db.session.rollback()
+        host = db.session.scalar(db.select(CrawlHost).where(CrawlHost.hostname == hostname))
+    return host
+
+
+def enqueue_due_offers() -> int:
+    """Add a job for every offer that is due according to the scheduler and has no
+    open job yet.
+
+    Returns the number of jobs added.
+    """
+    now = datetime.now()
+    open_offer_ids = set(db.session.scalars(
+        db.select(CrawlJob.product_offer_id).where(CrawlJob.status.in_(OPEN_STATUSES))
+    ).all())
+    jobs: Dict[int, CrawlJob] = {
+        job.product_offer_id: job for job in db.session.scalars(db.select(CrawlJob)).all()
+    }
+
+    added: int = 0
+    offer: ProductOffer
+    for offer in db.session.scalars(
+            db.select(ProductOffer)
+                .where(db.or_(ProductOffer.next_crawl.is_(None), ProductOffer.next_crawl <= now))
+            ).all():
+        if offer.id in open_offer_ids:
+            continue
+
+        job = jobs.get(offer.id)
+        if job is None:
+            job = CrawlJob(product_offer_id=offer.id, hostname=offer.webshop.hostname)
+            db.session.add(job)
+        job.status = JobStatus.PENDING.value
+        job.not_before = now
+        job.worker = None
+        job.lease_expires = None
+        job.attempts = 0
+        get_crawl_host(job.hostname)
+        added += 1
+
+    db.session.commit()
+    logging.info("Added %d crawl jobs to the queue", added)
+    return added
+
+
+def claim_job(worker: str) -> Optional[CrawlJob]:
+    """Claim the next job that may be crawled now, or return None if there is none."""
+    now = datetime.now()
+    _fail_abandoned_jobs(now)
+    hosts = db.session.execute(
+        db.select(CrawlHost.id, CrawlHost.hostname, CrawlHost.version)
+            .where(CrawlHost.next_request <= now)
+    ).all()
+    db.session.rollback()
+    random.shuffle(hosts)
+
+    for host_id, hostname, version in hosts:
+        active: int = db.session.scalar(
+            db.select(db.func.count(CrawlJob.id))
+                .where(CrawlJob.hostname == hostname)
+                .where(CrawlJob.status == JobStatus.CLAIMED.value)
+                .where(CrawlJob.lease_expires >= now)
+        )
+        if active >= HOST_CONCURRENCY:
+            db.session.rollback()
+            continue
+
+        query = db.select(CrawlJob.id) \
+            .where(CrawlJob.hostname == hostname) \
+            .where(_claimable(now)) \
+            .order_by(CrawlJob.not_before) \
+            .limit(1)
+        if _supports_skip_locked():
+            query = query.with_for_update(skip_locked=True)
+        job_id: Optional[int] = db.session.scalar(query)
+        if job_id is None:
+            db.session.rollback()
+            continue
+
+        # Both updates only succeed if no other worker claimed this job, or another
+        # job of this host, since we looked.
+        host_claim = db.session.execute(
+            db.update(CrawlHost)
+                .where(CrawlHost.id == host_id)
+                .where(CrawlHost.version == version)
+                .values(version=version + 1)
+        )
+        job_claim = db.session.execute(
+            db.update(CrawlJob)
+                .where(CrawlJob.id == job_id)
+                .where(_claimable(now))
+                .values(
+                    status=JobStatus.CLAIMED.value,
+                    worker=worker,
+                    lease_expires=now + timedelta(seconds=LEASE_TIMEOUT),
+                    attempts=CrawlJob.attempts + 1
+                )
+        )
+        if host_claim.rowcount != 1 or job_claim.rowcount != 1:
+            logging.debug("Lost the race for a job of %s", hostname)
+            db.session.rollback()
+            continue
+
+        db.session.commit()
+        job: CrawlJob = db.session.get(CrawlJob, job_id, populate_existing=True)
+        logging.debug("%s claimed %s", worker, job)
+        return job
+
+    return None
+
+
+def _finish_job(job_id: int, worker: str, status: JobStatus, delay: float = 0,
+                commit: bool = True) -> None:
+    """Set the status of a claimed job, unless the lease was lost to another worker.
+
+    A job that is being stored keeps its lease, so it is crawled again if its result
+    is never stored.
+    """
+    now = datetime.now()
+    result = db.session.execute(
+        db.update(CrawlJob)
+            .where(CrawlJob.id == job_id)
+            .where(CrawlJob.worker == worker)
+            .values(
+                status=status.value,
+                not_before=now + timedelta(seconds=delay),
+                lease_expires=now + timedelta(seconds=LEASE_TIMEOUT)
+                    if status == JobStatus.STORING else None
+            )
+    )
+    if result.rowcount != 1:
+        logging.warning("%s lost the lease on crawl job %d", worker, job_id)
+    if commit:
+        db.session.commit()
+
+
+def _retry_status(attempts: int) -> JobStatus:
+    """Return the status of a failed job that was tried attempts times."""
+    return JobStatus.PENDING if attempts < MAX_ATTEMPTS else JobStatus.FAILED
+
+
+def _release_host(hostname: str, delay: float) -> None:
+    """Leave hostname alone for delay seconds."""
+    db.session.execute(
+        db.update(CrawlHost)
+            .where(CrawlHost.hostname == hostname)
+            .values(next_request=datetime.now() + timedelta(seconds=delay))
+    )
+    db.session.commit()
+
+
+# Offer id, crawl result, job id and worker
+_QueuedResult = Tuple[int, CrawlResult, Optional[int], Optional[str]]
+
+
+class ResultWriter:
+    """Stores the crawl results of all workers from a single thread.
+
+    SQLite allows one write transaction at a time, so workers that store their own
+    results mostly wait for each other. Instead they can put their results in the
+    queue of this writer, which stores them in batches of batch_size per commit.
+    When max_queued results are waiting, put() blocks until the writer catches up.
+
+    The jobs of the results are marked done in the same commit. If a batch can't be
+    stored, its jobs are retried like jobs whose crawl failed.
+    """
+
+    def __init__(self, batch_size: int = 50, max_queued: int = 1000):
+        self.batch_size = batch_size
+        self.stored: int = 0
+        self._results: multiprocessing.Queue = multiprocessing.Queue(max_queued)
+        self._thread: Optional[threading.Thread] = None
+
+    def put(self, offer_id: int, result: CrawlResult, job_id: Optional[int] = None,
+            worker: Optional[str] = None) -> None:
+        """Queue the result of a crawl to be stored, from any process.
+
+        The job of the crawl, claimed by worker, is marked done once it is stored.
+        """
+        self._results.put((offer_id, result, job_id, worker))
+
+    def _store(self, batch: List[_QueuedResult]) -> None:
+        try:
+            results: List[Tuple[ProductOffer, CrawlResult]] = []
+            for offer_id, result, job_id, worker in batch:
+                offer: Optional[ProductOffer] = db.session.get(ProductOffer, offer_id)
+                if offer is not None:
+                    results.append((offer, result))
+                if job_id is not None and worker is not None:
+                    _finish_job(job_id, worker, JobStatus.DONE, commit=False)
+            store_crawl_results(results)
+            db.session.commit()
+            self.stored += len(batch)
+        except Exception as exception:  # pylint: disable=W0703
+            # The thread must keep running, or the workers block on a full queue
+            logging.exception("Could not store %d crawl results: %s", len(batch), repr(exception))
+            db.session.rollback()
+            self._retry(batch)
+
+    def _retry(self, batch: List[_QueuedResult]) -> None:
+        try:
+            for _, _, job_id, worker in batch:
+                job: Optional[CrawlJob] = db.session.get(CrawlJob, job_id) \
+                    if job_id is not None else None
+                if job is not None and worker is not None:
+                    _finish_job(job_id, worker, _retry_status(job.attempts), RETRY_DELAY,
+                                commit=False)
+            db.session.commit()
+        except SQLAlchemyError as exception:
+            # Their leases expire, after which they are crawled again
+            logging.error("Could not retry the jobs of %d crawl results: %s",
+                          len(batch), exception)
+            db.session.rollback()
+
+    def _run(self, app: Flask) -> None:
+        with app.app_context():
+            stopped: bool = False
+            while not stopped:
+                batch = [self._results.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._results.get_nowait())
+                    except queue.Empty:
+                        break
+                stopped = None in batch
+                self._store([item for item in batch if item is not None])
+            db.session.remove()
+        logging.info("Stored %d crawl results", self.stored)
+
+    def start(self) -> None:
+        """Start storing the queued results in a thread of this process."""
+        self._thread = threading.Thread(
+            target=self._run, args=(current_app._get_current_object(),),  # pylint: disable=W0212
+            name="ResultWriter"
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Store all results queued so far and stop the thread."""
+        self._results.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+
+def run_job(job: CrawlJob, worker: str, writer: Optional[ResultWriter] = None) -> JobStatus:
+    """Crawl the offer of a claimed job, store the price and return the new status.
+
+    If a writer is given, the price is stored by the writer instead, and the job
+    is done once the writer stored it.
+    """
+    offer: ProductOffer = job.product_offer
+    host_delay: float = random.uniform(HOST_DELAY_MIN, HOST_DELAY_MAX)
+    status: JobStatus = JobStatus.DONE
+    delay: float = 0
+
+    logging.info("Crawling %s", offer)
+    try:
+        result: CrawlResult = crawl_url(offer.url)
+    except CircuitOpenException:
+        logging.info("Deferred %s, the circuit breaker of its shop is open", offer)
+        status = JobStatus.DEFERRED
+        delay = host_delay = RESET_TIMEOUT
+    except PageNotFoundException:
+        logging.error("Received a PageNotFoundException for %s", offer)
+        status = JobStatus.FAILED
+    except (CrawlerException, requests.RequestException) as exception:
+        logging.error("Received %s while crawling %s", repr(exception), offer)
+        status = _retry_status(job.attempts)
+        delay = RETRY_DELAY
+    except WebsiteNotImplementedException:
+        logging.error("Disabled website for existing product %s", offer)
+        status = JobStatus.FAILED
+    except Exception as exception: # pylint: disable=W0703
+        # A bug in a crawler must not take the worker down with it
+        logging.exception("Received %s while crawling %s", repr(exception), offer)
+        status = _retry_status(job.attempts)
+        delay = RETRY_DELAY
+    else:
+        if writer is None:
+            offer.add_crawl_result(result)
+        else:
+            # Before the writer can mark it done
+            status = JobStatus.STORING
+            _finish_job(job.id, worker, status)
+            writer.put(offer.id, result, job.id, worker)
+
+    if status == JobStatus.DEFERRED and job.attempts >= MAX_ATTEMPTS:
+        status = JobStatus.FAILED
+
+    if status != JobStatus.STORING:
+        _finish_job(job.id, worker, status, delay)
+    _release_host(job.hostname, host_delay)
+    return status
+
+
+def has_open_jobs() -> bool:
+    """Return True if any job is waiting or being crawled."""
+    return db.session.scalar(
+        db.select(db.func.count(CrawlJob.id)).where(CrawlJob.status.in_(OPEN_STATUSES))
+    ) > 0
+
+
+def queue_status() -> Dict[str, int]:
+    """Return the number of jobs per status."""
+    return dict(db.session.execute(
+        db.select(CrawlJob.status, db.func.count(CrawlJob.id)).group_by(CrawlJob.status)
+    ).all())
+
+
+def run_worker(worker: str, poll_interval: float = 10, exit_when_empty: bool = True,
+               writer: Optional[ResultWriter] = None) -> int:
+    """Claim and run jobs until the queue is empty, return the number of jobs run.
+
+    If exit_when_empty is False, the worker keeps polling for new jobs forever.
+    The prices are stored by writer, if given.
+    """
+    logging.info("Starting crawl worker %s", worker)
+    jobs_run: int = 0
+
+    while True:
+        job = claim_job(worker)
+        if job is None:
+            if exit_when_empty and not has_open_jobs():
+                break
+            time.sleep(poll_interval)
+            continue
+
+        run_job(job, worker, writer)
+        jobs_run += 1
+
+    logging.info("Crawl worker %s ran %d jobs", worker, jobs_run)
+    return jobs_run
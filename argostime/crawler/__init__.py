@@ -23,5 +23,4 @@
 """
 
 from argostime.crawler.crawl_utils import CrawlResult, enabled_shops
-from argostime.crawler.crawl_url import crawl_url
-from argostime.crawler.shop import *
+from argostime.crawler.crawl_url import crawl_url, crawl_urls, has_batch_crawler
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+    crawler/circuit_breaker.py
+
+    Circuit breakers that stop crawling a shop after repeated failures, and the
+    budget for retrying failed requests.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from enum import Enum
+import logging
+import threading
+import time
+from typing import Callable, Dict, List
+import urllib.parse
+
+from argostime.config import get_config
+
+DEFAULT_FAILURE_THRESHOLD: int = 5
+DEFAULT_RESET_TIMEOUT: float = 300
+MAX_RESET_TIMEOUT: float = 3600
+# Seconds after which a probe that never reported back no longer blocks a new one
+DEFAULT_PROBE_TIMEOUT: float = 120
+DEFAULT_RETRY_BUDGET: int = 50
+DEFAULT_MAX_RETRIES: int = 2
+DEFAULT_RETRY_BACKOFF: float = 1
+
+__config = get_config()
+
+FAILURE_THRESHOLD: int = __config.getint(
+    "crawler", "breaker_threshold", fallback=DEFAULT_FAILURE_THRESHOLD)
+RESET_TIMEOUT: float = __config.getfloat(
+    "crawler", "breaker_reset_timeout", fallback=DEFAULT_RESET_TIMEOUT)
+
+
+class BreakerState(Enum):
+    """State of a circuit breaker"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """Circuit breaker for the requests to a single shop.
+
+    The breaker opens after failure_threshold consecutive failures. While it is open
+    no requests are sent, until reset_timeout seconds have passed. Then a single probe
+    request is allowed: if it succeeds the breaker closes, otherwise it opens again
+    with a doubled reset_timeout. A probe that didn't succeed or fail within
+    probe_timeout seconds is given up, and the next request is a new probe.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+        probe_timeout: float = DEFAULT_PROBE_TIMEOUT
+        ):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.initial_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.probe_timeout = probe_timeout
+
+        self.state: BreakerState = BreakerState.CLOSED
+        self.consecutive_failures: int = 0
+        self.opened_at: float = 0
+        self.probe_started: float = 0
+        self.requests: int = 0
+        self.failures: int = 0
+        self.times_opened: int = 0
+        self.deferred: List[str] = []
+
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """Return True if requests are refused and no probe is due yet."""
+        with self._lock:
+            return self._refuses()
+
+    def _refuses(self) -> bool:
+        if self.state == BreakerState.HALF_OPEN:
+            return self.clock() - self.probe_started < self.probe_timeout
+        return self.state == BreakerState.OPEN \
+            and self.clock() - self.opened_at < self.reset_timeout
+
+    def allow_request(self) -> bool:
+        """Return True if a request may be sent now.
+
+        If the breaker is open and the reset timeout passed, or the previous probe
+        timed out, the breaker goes to half open and this request is the probe.
+        """
+        with self._lock:
+            if self._refuses():
+                return False
+            if self.state == BreakerState.HALF_OPEN:
+                logging.warning("Probe of %s timed out, probing again", self.host)
+            elif self.state == BreakerState.OPEN:
+                logging.info("Probing %s after %.0f seconds", self.host, self.reset_timeout)
+            if self.state != BreakerState.CLOSED:
+                self.state = BreakerState.HALF_OPEN
+                self.probe_started = self.clock()
+            self.requests += 1
+            return True
+
+    def record_success(self) -> None:
+        """Record a request that got a usable response."""
+        with self._lock:
+            if self.state != BreakerState.CLOSED:
+                logging.info("Closing circuit breaker of %s", self.host)
+            self.state = BreakerState.CLOSED
+            self.consecutive_failures = 0
+            self.reset_timeout = self.initial_reset_timeout
+
+    def record_failure(self) -> None:
+        """Record a request that failed with any exception, or got a 5xx or 429 response."""
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+
+            if self.state == BreakerState.HALF_OPEN:
+                self.reset_timeout = min(self.reset_timeout * 2, MAX_RESET_TIMEOUT)
+                self._open()
+            elif self.state == BreakerState.CLOSED \
+                    and self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self) -> None:
+        logging.warning(
+            "Opening circuit breaker of %s after %d consecutive failures, probing again in "
+            "%.0f seconds", self.host, self.consecutive_failures, self.reset_timeout)
+        self.state = BreakerState.OPEN
+        self.opened_at = self.clock()
+        self.times_opened += 1
+
+    def defer(self, url: str) -> None:
+        """Record that url was not crawled because the breaker is open."""
+        with self._lock:
+            self.deferred.append(url)
+
+
+class RetryBudget:
+    """Number of retries that may be spent on failed requests during a run."""
+
+    def __init__(self, budget: int = DEFAULT_RETRY_BUDGET):
+        self.budget = budget
+        self.spent: int = 0
+        self._lock = threading.Lock()
+
+    def spend(self) -> bool:
+        """Take a retry from the budget, return False if it is used up."""
+        with self._lock:
+            if self.spent >= self.budget:
+                return False
+            self.spent += 1
+            return True
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_host(url: str) -> str:
+    """Return the host of url as used to find its circuit breaker."""
+    return urllib.parse.urlparse(url).netloc.removeprefix("www.")
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    """Return the circuit breaker for the shop of url, creating it if needed.
+
+    The thresholds are set by breaker_threshold and breaker_reset_timeout in the
+    [crawler] section of argostime.conf.
+    """
+    host = breaker_host(url)
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host, FAILURE_THRESHOLD, RESET_TIMEOUT)
+        return _breakers[host]
+
+
+def defer_if_open(url: str) -> bool:
+    """Return True and record url as deferred if the breaker of its shop is open."""
+    breaker = get_breaker(url)
+    if breaker.is_open():
+        breaker.defer(url)
+        return True
+    return False
+
+
+def reset_breakers() -> None:
+    """Forget the state of all circuit breakers."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def log_breaker_report() -> None:
+    """Log the state of every circuit breaker that saw failures during this run."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+
+    for breaker in breakers:
+        if breaker.failures == 0 and not breaker.deferred:
+            continue
+        logging.info(
+            "Circuit breaker of %s is %s: %d requests, %d failures, opened %d times, "
+            "%d urls deferred",
+            breaker.host,
+            breaker.state.value,
+            breaker.requests,
+            breaker.failures,
+            breaker.times_opened,
+            len(breaker.deferred)
+            )
+        for url in breaker.deferred:
+            logging.debug("Deferred %s", url)
@@ -25,11 +25,22 @@
 """
 
 import logging
+from typing import Dict, List
 import urllib.parse
 
+import requests
+
+from argostime.crawl_metrics import Outcome, measure_crawl, record_crawl
+from argostime.exceptions import CircuitOpenException
+from argostime.exceptions import CrawlerException
+from argostime.exceptions import NotModifiedException
+from argostime.exceptions import PageNotFoundException
 from argostime.exceptions import WebsiteNotImplementedException
+from argostime.profiling import profile_crawl
 
-from argostime.crawler.crawl_utils import CrawlResult, enabled_shops
+from argostime.crawler.circuit_breaker import defer_if_open, get_breaker
+from argostime.crawler.crawl_utils import BatchCrawlerFunc, CrawlResult, ShopDict, enabled_shops
+from argostime.crawler.fetch import get_http_cache
 
 
 def crawl_url(url: str) -> CrawlResult:
@@ -37,6 +48,7 @@ def crawl_url(url: str) -> CrawlResult:
 
     Returns a CrawlResult object.
     May raise any of the following exceptions:
+        CircuitOpenException, if the shop failed too often and is not crawled for now
         CrawlerException
         PageNotFoundException
         WebsiteNotImplementedException
@@ -44,13 +56,123 @@ def crawl_url(url: str) -> CrawlResult:
     logging.debug("Crawling %s", url)
     hostname: str = urllib.parse.urlparse(url).netloc
 
-    if hostname not in enabled_shops:
-        raise WebsiteNotImplementedException(url)
+    with measure_crawl(url), profile_crawl(hostname):
+        if hostname not in enabled_shops:
+            raise WebsiteNotImplementedException(url)
+
+        if defer_if_open(url):
+            raise CircuitOpenException(url)
 
-    # Note: This is a function call! The called function is the corresponding crawler
-    # registered using the "@register_crawler" decorator in the "shop" directory.
-    result: CrawlResult = enabled_shops[hostname]["crawler"](url)
-    result.check()
+        try:
+            result = _crawl_shop(url, enabled_shops[hostname])
+        except CircuitOpenException:
+            get_breaker(url).defer(url)
+            raise
 
     logging.debug("Crawl resulted in %s", result)
     return result
+
+
+def _crawl_shop(url: str, shop: ShopDict) -> CrawlResult:
+    http_cache = get_http_cache()
+
+    if http_cache is None or not shop["cacheable"]:
+        # Note: This is a function call! The called function is the corresponding crawler
+        # registered using the "@register_crawler" decorator in the "shop" directory.
+        result: CrawlResult = shop["crawler"](url)
+        result.check()
+    else:
+        with http_cache.crawl(url, shop["hostname"]) as entry:
+            try:
+                result = shop["crawler"](url)
+            except NotModifiedException as exception:
+                result = http_cache.record_hit(entry, exception)
+            else:
+                result.check()
+                http_cache.record_miss(entry, result)
+
+    return result
+
+
+def has_batch_crawler(url: str) -> bool:
+    """Return True if the shop of url registered a crawler for multiple URLs at once."""
+    hostname: str = urllib.parse.urlparse(url).netloc
+    return hostname in enabled_shops and enabled_shops[hostname]["batch_crawler"] is not None
+
+
+def crawl_urls(urls: List[str]) -> Dict[str, CrawlResult]:
+    """Crawl multiple product URLs
+
+    URLs of shops with a batch crawler are crawled together, other URLs are crawled
+    one by one with crawl_url(). URLs of shops that are cached by the HTTP cache are
+    always crawled one by one, so every URL gets its own conditional request. Returns
+    a dict with the CrawlResult of every URL that was crawled successfully, failures
+    are logged and left out.
+    """
+    urls_per_shop: Dict[str, List[str]] = {}
+    for url in urls:
+        hostname: str = urllib.parse.urlparse(url).netloc
+        urls_per_shop.setdefault(hostname, []).append(url)
+
+    results: Dict[str, CrawlResult] = {}
+    for hostname, shop_urls in urls_per_shop.items():
+        shop = enabled_shops.get(hostname)
+        batch_crawler = shop["batch_crawler"] if shop is not None else None
+        if batch_crawler is not None and shop["cacheable"] and get_http_cache() is not None:
+            batch_crawler = None
+
+        if batch_crawler is None:
+            for url in shop_urls:
+                try:
+                    results[url] = crawl_url(url)
+                except CircuitOpenException:
+                    logging.debug("Deferred %s, the circuit breaker is open", url)
+                except (CrawlerException, PageNotFoundException, WebsiteNotImplementedException,
+                        requests.RequestException) as exception:
+                    logging.error("Received %s while crawling %s", repr(exception), url)
+            continue
+
+        results.update(_crawl_batch(hostname, shop_urls, batch_crawler))
+
+    return results
+
+
+def _crawl_batch(hostname: str, urls: List[str],
+                 batch_crawler: BatchCrawlerFunc) -> Dict[str, CrawlResult]:
+    """Crawl the urls of a shop with its batch crawler, failures are logged and left out."""
+    logging.debug("Crawling %d urls of %s in a batch", len(urls), hostname)
+    try:
+        if get_breaker(urls[0]).is_open():
+            raise CircuitOpenException(urls[0])
+        with profile_crawl(hostname):
+            batch_results: Dict[str, CrawlResult] = batch_crawler(urls)
+    except CircuitOpenException:
+        logging.debug("Deferred %d urls of %s, the circuit breaker is open", len(urls), hostname)
+        for url in urls:
+            get_breaker(url).defer(url)
+            record_crawl(url, Outcome.DEFERRED)
+        return {}
+    except Exception as exception: # pylint: disable=W0703
+        # Counts as a failed crawl of every URL of the batch
+        logging.error("Received %s while crawling %d urls of %s in a batch",
+                      repr(exception), len(urls), hostname)
+        for url in urls:
+            record_crawl(url, Outcome.from_exception(exception))
+        return {}
+
+    results: Dict[str, CrawlResult] = {}
+    for url, result in batch_results.items():
+        try:
+            result.check()
+        except CrawlerException as exception:
+            logging.error("Batch crawl of %s gave an invalid result %s", url, exception)
+            record_crawl(url, Outcome.CRAWLER_EXCEPTION)
+            continue
+        record_crawl(url, Outcome.OK)
+        results[url] = result
+
+    missing: int = len(urls) - len([url for url in urls if url in results])
+    if missing > 0:
+        logging.info("Batch crawl of %s gave no result for %d urls", hostname, missing)
+
+    return results
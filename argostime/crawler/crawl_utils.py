@@ -23,16 +23,36 @@
     along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
 """
 
-import configparser
+from dataclasses import dataclass
+from datetime import datetime
+import functools
+import importlib
 import logging
 import re
-from typing import Callable, Dict, Optional, TypedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict
+import urllib.parse
 
+from bs4 import BeautifulSoup, FeatureNotFound
+
+from argostime.config import get_config
 from argostime.exceptions import CrawlerException
 
-__config = configparser.ConfigParser()
-__config.read("argostime.conf")
-__voor_regex = re.compile("voor")
+__config = get_config()
+
+
+def parse_ean(value: Any) -> Optional[int]:
+    """Return an EAN found by a crawler as an int, or None if it isn't an EAN.
+
+    Shops give EANs as numbers or as strings, sometimes with leading zeros, which
+    are dropped so that the same EAN of different shops is equal.
+    """
+    if value is None:
+        return None
+    digits = str(value).strip()
+    if not digits.isdigit() or not 8 <= len(digits) <= 14 or int(digits) == 0:
+        logging.debug("Ignoring invalid EAN %s", value)
+        return None
+    return int(digits)
 
 
 class CrawlResult:
@@ -47,6 +67,8 @@ class CrawlResult:
     normal_price: float = -1.0
     discount_price: float = -1.0
     on_sale: bool = False
+    # Time until which the shop guarantees the price, for example the end of a sale
+    valid_until: Optional[datetime] = None
 
     def __init__(
         self,
@@ -58,6 +80,7 @@ class CrawlResult:
         discount_price: float=-1.0,
         on_sale: bool=False,
         ean: Optional[int]=None,
+        valid_until: Optional[datetime]=None,
         ):
         self.url = url
         self.product_name = product_name
@@ -67,12 +90,14 @@ class CrawlResult:
         self.discount_price = discount_price
         self.on_sale = on_sale
         self.ean = ean
+        self.valid_until = valid_until
 
     def __str__(self) -> str:
         string = f"CrawlResult(product_name={self.product_name},"\
             f"product_description={self.product_description},"\
             f"product_code={self.product_code},price={self.normal_price},"\
-            f"discount={self.discount_price},sale={self.on_sale},ean={self.ean}"
+            f"discount={self.discount_price},sale={self.on_sale},ean={self.ean}"\
+            f",valid_until={self.valid_until}"
 
         return string
 
@@ -86,6 +111,7 @@ class CrawlResult:
           - product_code
         If on_sale is True, discount_price must be non-negative and non-zero.
         If on_sale is False, normal_price must be non-negative and non-zero.
+        The ean is converted to an int, or to None if it isn't a valid EAN.
         """
 
         # Check if url, product name and product code fields are set
@@ -102,16 +128,98 @@ class CrawlResult:
         if self.normal_price < 0 and not self.on_sale:
             raise CrawlerException("No normal price given for item not on sale!")
 
+        self.ean = parse_ean(self.ean)
+
+
+# Parser backends that can be used by parse_html(). They all build a BeautifulSoup
+# tree, so crawlers can use the same find()/select() API regardless of the backend.
+# lxml and html5lib are optional dependencies.
+PARSER_BACKENDS = ("html.parser", "lxml", "html5lib")
+DEFAULT_PARSER = "html.parser"
 
 CrawlerFunc = Callable[[str], CrawlResult]
-ShopDict = TypedDict("ShopDict", {"name": str, "hostname": str, "crawler": CrawlerFunc})
-enabled_shops: Dict[str, ShopDict] = {}
+BatchCrawlerFunc = Callable[[List[str]], Dict[str, CrawlResult]]
+ShopDict = TypedDict(
+    "ShopDict",
+    {
+        "name": str,
+        "hostname": str,
+        "crawler": CrawlerFunc,
+        "batch_crawler": Optional[BatchCrawlerFunc],
+        "cacheable": bool,
+        "parser": str,
+    }
+)
+
+
+class ShopRegistry(Dict[str, ShopDict]):
+    """The registered shops by hostname.
+
+    The module of a shop is imported from SHOP_MODULES the first time its hostname
+    is looked up, which registers its crawlers. Hostnames of shops that are not
+    known or disabled are not in the registry.
+    """
+
+    def _load(self, hostname: str) -> None:
+        if super().__contains__(hostname):
+            return
+
+        # Imported here, the shop modules import this module
+        # pylint: disable=C0415
+        from argostime.crawler.shop import SHOP_MODULES
+
+        module: Optional[str] = SHOP_MODULES.get(hostname.removeprefix("www."))
+        if module is not None:
+            logging.debug("Loading the crawler of %s from %s", hostname, module)
+            importlib.import_module(f"argostime.crawler.shop.{module}")
+
+    def __contains__(self, hostname: object) -> bool:
+        if isinstance(hostname, str):
+            self._load(hostname)
+        return super().__contains__(hostname)
 
+    def __missing__(self, hostname: str) -> ShopDict:
+        self._load(hostname)
+        if not super().__contains__(hostname):
+            raise KeyError(hostname)
+        return super().__getitem__(hostname)
 
-def register_crawler(name: str, host: str, use_www: bool = True) -> Callable[[CrawlerFunc], None]:
-    """Decorator to register a new crawler function."""
+    def get(self, hostname: str, default: Optional[ShopDict] = None) -> Optional[ShopDict]:
+        return self[hostname] if hostname in self else default
 
-    def decorate(func: Callable[[str], CrawlResult]) -> None:
+    def load_all(self) -> None:
+        """Import the modules of all shops."""
+        # pylint: disable=C0415
+        from argostime.crawler.shop import SHOP_MODULES
+
+        for hostname in SHOP_MODULES:
+            self._load(hostname)
+
+
+enabled_shops: ShopRegistry = ShopRegistry()
+
+
+def register_crawler(
+    name: str,
+    host: str,
+    use_www: bool = True,
+    cacheable: bool = True,
+    parser: str = DEFAULT_PARSER
+    ) -> Callable[[CrawlerFunc], CrawlerFunc]:
+    """Decorator to register a new crawler function.
+
+    Set cacheable to False if the result of the crawler does not only depend on the
+    contents of the page, for example because it compares dates with the current date.
+    Results of such crawlers are never served from the HTTP cache.
+
+    parser is the default HTML parser backend used by parse_html() for this shop, it
+    can be overridden in the [parsers] section of argostime.conf.
+    """
+    if parser not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend {parser}")
+
+
+    def decorate(func: CrawlerFunc) -> CrawlerFunc:
         """
         This function will be called when you put the "@register_crawler" decorator above
         a function defined in a file in the "shop" directory! The argument will be the
@@ -120,22 +228,190 @@ def register_crawler(name: str, host: str, use_www: bool = True) -> Callable[[Cr
         if "argostime" in __config and "disabled_shops" in __config["argostime"]:
             if host in __config["argostime"]["disabled_shops"]:
                 logging.debug("Shop %s is disabled", host)
-                return
+                return func
 
         shop_info: ShopDict = {
             "name": name,
             "hostname": host,
             "crawler": func,
+            "batch_crawler": None,
+            "cacheable": cacheable,
+            "parser": parser,
         }
 
         enabled_shops[host] = shop_info
         if use_www:
             enabled_shops[f"www.{host}"] = shop_info
         logging.debug("Shop %s is enabled", host)
+        return func
 
     return decorate
 
 
+def register_batch_crawler(host: str) -> Callable[[BatchCrawlerFunc], BatchCrawlerFunc]:
+    """Decorator to register a function crawling multiple URLs of a shop at once.
+
+    The shop must already be registered with register_crawler. The decorated function
+    gets a list of URLs and returns a dict with a CrawlResult for every URL it could
+    crawl, URLs which failed are left out.
+    """
+
+    def decorate(func: BatchCrawlerFunc) -> BatchCrawlerFunc:
+        if host not in enabled_shops:
+            logging.debug("Not registering batch crawler for disabled shop %s", host)
+            return func
+
+        # The www. alias shares the same dict, so this registers both hostnames
+        enabled_shops[host]["batch_crawler"] = func
+        logging.debug("Batch crawler for shop %s is enabled", host)
+        return func
+
+    return decorate
+
+
+@functools.cache
+def parser_available(backend: str) -> bool:
+    """Return True if the given parser backend is installed."""
+    try:
+        BeautifulSoup("", backend)
+    except FeatureNotFound:
+        return False
+    return True
+
+
+def get_parser_backend(url: str) -> str:
+    """Return the name of the parser backend to use for pages of the shop of url.
+
+    The backend is looked up in the [parsers] section of argostime.conf by the
+    hostname of the shop, then the default key of that section, and finally the
+    backend the crawler was registered with. Backends that are not installed fall
+    back to html.parser.
+    """
+    hostname: str = urllib.parse.urlparse(url).netloc
+    backend: str = DEFAULT_PARSER
+
+    if hostname in enabled_shops:
+        shop_info = enabled_shops[hostname]
+        backend = shop_info["parser"]
+        hostname = shop_info["hostname"]
+
+    if "parsers" in __config:
+        backend = __config["parsers"].get(
+            hostname, __config["parsers"].get("default", backend))
+
+    return _usable_backend(backend)
+
+
+@functools.lru_cache(maxsize=None)
+def _usable_backend(backend: str) -> str:
+    """Return backend, or html.parser if it is unknown or not installed.
+
+    Cached, so the fallback is only logged once per backend.
+    """
+    if backend not in PARSER_BACKENDS:
+        logging.error("Unknown parser backend %s, using %s", backend, DEFAULT_PARSER)
+        return DEFAULT_PARSER
+
+    if not parser_available(backend):
+        logging.warning("Parser backend %s is not installed, using %s", backend, DEFAULT_PARSER)
+        return DEFAULT_PARSER
+
+    return backend
+
+
+def parse_html(markup: str, url: str, backend: Optional[str] = None) -> BeautifulSoup:
+    """Parse markup of a page at url with the parser backend configured for its shop."""
+    if backend is None:
+        backend = get_parser_backend(url)
+    return BeautifulSoup(markup, backend)
+
+
+@dataclass(frozen=True)
+class Promotion:
+    """A parsed promotional message, the effective price is factor * price + amount."""
+    kind: str
+    factor: float
+    amount: float = 0
+
+    def apply(self, price: float) -> float:
+        """Return the effective price of one item with this promotion."""
+        return self.factor * price + self.amount
+
+
+PromotionRule = Callable[[Dict[str, str]], Tuple[float, float]]
+
+_ORDINAL = r"(?P<n>\d+)(?:e|de|ste)(?:artikel)?"
+_AMOUNT = r"€?(?P<amount>\d+(?:[.,]\d+)?)(?:,-)?"
+_PERCENTAGE = r"(?P<percentage>\d+(?:[.,]\d+)?)%"
+
+
+def _number(groups: Dict[str, str], name: str, default: float = 1) -> float:
+    value: Optional[str] = groups.get(name)
+    if value is None:
+        return default
+    return float(value.replace(",", "."))
+
+
+# The grammar of promotional messages, tried in order on the normalized message.
+# Every rule returns the (factor, amount) of the effective price.
+PROMOTION_GRAMMAR: List[Tuple[str, "re.Pattern[str]", PromotionRule]] = [
+    # 1+1 gratis, 2+3 gratis, 1+1
+    ("N+M gratis", re.compile(r"(?P<n>\d+)\+(?P<m>\d+)(?:gratis)?"),
+        lambda g: (_number(g, "n") / (_number(g, "n") + _number(g, "m")), 0)),
+    # 6=5
+    ("N=M", re.compile(r"(?P<n>\d+)=(?P<m>\d+)"),
+        lambda g: (_number(g, "m") / _number(g, "n"), 0)),
+    # 3 halen, 2 betalen
+    ("N halen M betalen", re.compile(r"(?P<n>\d+)halen,?(?P<m>\d+)betalen"),
+        lambda g: (_number(g, "m") / _number(g, "n"), 0)),
+    # 2e halve prijs
+    ("Ne halve prijs", re.compile(_ORDINAL + r"halveprijs"),
+        lambda g: ((_number(g, "n") - 0.5) / _number(g, "n"), 0)),
+    # 2e gratis
+    ("Ne gratis", re.compile(_ORDINAL + r"gratis"),
+        lambda g: ((_number(g, "n") - 1) / _number(g, "n"), 0)),
+    # 2e artikel 70%, 3e 25% korting
+    ("Ne artikel X%", re.compile(_ORDINAL + _PERCENTAGE + r"(?:korting)?"),
+        lambda g: ((_number(g, "n") - _number(g, "percentage") / 100) / _number(g, "n"), 0)),
+    # 2e voor €1
+    ("Ne voor €Y", re.compile(_ORDINAL + r"voor" + _AMOUNT),
+        lambda g: ((_number(g, "n") - 1) / _number(g, "n"),
+                   _number(g, "amount") / _number(g, "n"))),
+    # 15% korting
+    ("X% korting", re.compile(_PERCENTAGE + r"korting"),
+        lambda g: (1 - _number(g, "percentage") / 100, 0)),
+    # van 3.49 voor 2.79
+    ("Van €X voor €Y", re.compile(r"van€?\d+(?:[.,]\d+)?voor" + _AMOUNT),
+        lambda g: (0, _number(g, "amount"))),
+    # 2 voor €5, voor 2.49
+    ("N voor €Y", re.compile(r"(?P<n>\d+)?(?:stuks)?voor" + _AMOUNT),
+        lambda g: (0, _number(g, "amount") / _number(g, "n"))),
+]
+
+
+def normalize_promotional_message(message: str) -> str:
+    """Return message in lower case without whitespace and footnote marks, as matched
+    by the grammar."""
+    return "".join(message.split()).lower().rstrip("*!")
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_promotion(normalized_message: str) -> Optional[Promotion]:
+    """Return the Promotion of a normalized message, or None if it didn't match."""
+    for kind, pattern, rule in PROMOTION_GRAMMAR:
+        match = pattern.fullmatch(normalized_message)
+        if match is None:
+            continue
+        try:
+            factor, amount = rule(match.groupdict())
+        except ZeroDivisionError:
+            return None
+        if factor < 0 or amount < 0:
+            return None
+        return Promotion(kind, factor, amount)
+    return None
+
+
 def parse_promotional_message(message: str, price: float) -> float:
     """Parse a given promotional message, and returns the calculated effective price.
 
@@ -147,49 +423,13 @@ def parse_promotional_message(message: str, price: float) -> float:
 
     logging.debug("Parsing promotion %s", message)
 
-    # Remove all whitespace from the message
-    message_no_whitespace = "".join(message.split())
-
-    message_no_whitespace = message_no_whitespace.lower()
+    message_no_whitespace = normalize_promotional_message(message)
 
     logging.debug("Promotion yielded sanitized input %s", message_no_whitespace)
 
-    if message_no_whitespace == "1+1gratis":
-        return 1/2 * price
-    elif message_no_whitespace == "2+2gratis":
-        return 1/2 * price
-    elif message_no_whitespace == "2+1gratis":
-        return 2/3 * price
-    elif message_no_whitespace == "3+1gratis":
-        return 3/4 * price
-    elif message_no_whitespace == "5+1gratis":
-        return 5/6 * price
-    elif message_no_whitespace == "2ehalveprijs":
-        return 3/4 * price
-    elif message_no_whitespace == "50%korting":
-        return 1/2 * price
-    elif message_no_whitespace == "2eartikel70%":
-        return 0.85 * price
-    elif message_no_whitespace == "15%korting":
-        return 0.85 * price
-    elif message_no_whitespace == "1+1":
-        return 1/2 * price
-    elif message_no_whitespace == "6=5":
-        return 5/6 * price
-    elif message_no_whitespace == "2egratis":
-        return 1/2 * price
-    elif message_no_whitespace == "2+3gratis":
-        return 0.4 * price
-    elif "voor" in message_no_whitespace:
-        msg_split = __voor_regex.split(message_no_whitespace)
-        try:
-            if msg_split[0] == '':
-                return float(msg_split[1])
-            return float(msg_split[1]) / float(msg_split[0])
-        except ArithmeticError as exception:
-            logging.error("Calculation error parsing %s %s", message_no_whitespace, exception)
-        except IndexError as exception:
-            logging.error("IndexError in message %s", message_no_whitespace)
-
-    logging.error("Promotion text did not match any known promotion")
-    return -1
+    promotion = parse_promotion(message_no_whitespace)
+    if promotion is None:
+        logging.error("Promotion text did not match any known promotion")
+        return -1
+
+    return promotion.apply(price)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+    crawler/extract.py
+
+    Extract JSON-LD objects, meta tags and script variables from a page in a single
+    pass over the HTML tokens, without building a document tree.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+import json
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+@dataclass
+class PageData:
+    """Data extracted from a page by PageExtractor."""
+    json_ld: List[Any] = field(default_factory=list)
+    meta: Dict[str, str] = field(default_factory=dict)
+    script_variables: Dict[str, str] = field(default_factory=dict)
+
+
+class _StopParsing(Exception):
+    """Raised from a handler to stop tokenizing once all requested data is found."""
+
+
+class PageExtractor(HTMLParser):
+    """Streaming extractor for the data crawlers usually need from a product page.
+
+    json_ld is the number of <script type="application/ld+json"> blocks to collect,
+    optionally only blocks that have all attributes in json_ld_attrs.
+    meta is a collection of meta tag names or properties to collect the content of.
+    script_variables is a collection of JavaScript variable names, the expression
+    assigned to them in an inline script is collected as a string.
+
+    Data can be passed in chunks with feed(), which returns True as soon as all
+    requested data has been found. The remainder of the page is then ignored.
+    """
+
+    def __init__(
+        self,
+        json_ld: int = 0,
+        json_ld_attrs: Optional[Dict[str, str]] = None,
+        meta: Iterable[str] = (),
+        script_variables: Iterable[str] = ()
+        ):
+        super().__init__()
+        self.data = PageData()
+
+        self._json_ld_count = json_ld
+        self._json_ld_attrs = json_ld_attrs or {}
+        self._meta = set(meta)
+        self._script_variables = {
+            name: re.compile(
+                rf"(?:\bvar|\blet|\bconst|\bwindow\.)\s*{re.escape(name)}\s*=\s*(.+);")
+            for name in script_variables
+        }
+
+        self._in_script = False
+        self._script_is_json_ld = False
+        self._script_text: List[str] = []
+
+        self.done = self._all_found()
+
+    def _all_found(self) -> bool:
+        return len(self.data.json_ld) >= self._json_ld_count \
+            and self._meta.issubset(self.data.meta.keys()) \
+            and self.data.script_variables.keys() >= self._script_variables.keys()
+
+    def _check_done(self) -> None:
+        if self._all_found():
+            self.done = True
+            raise _StopParsing
+
+    def feed(self, data: str) -> bool:
+        """Tokenize the next chunk of the page, return True if all data was found."""
+        if self.done:
+            return True
+        try:
+            super().feed(data)
+        except _StopParsing:
+            pass
+        return self.done
+
+    def close(self) -> None:
+        if self.done:
+            return
+        try:
+            super().close()
+        except _StopParsing:
+            pass
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        attributes = dict(attrs)
+
+        if tag == "meta":
+            key = attributes.get("property") or attributes.get("name") \
+                or attributes.get("itemprop")
+            content = attributes.get("content")
+            if key in self._meta and content is not None and key not in self.data.meta:
+                self.data.meta[key] = content
+                self._check_done()
+        elif tag == "script":
+            self._in_script = True
+            self._script_text = []
+            self._script_is_json_ld = attributes.get("type") == "application/ld+json" \
+                and all(attributes.get(key) == value for key, value in self._json_ld_attrs.items())
+
+    def handle_data(self, data: str) -> None:
+        if self._in_script:
+            self._script_text.append(data)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag != "script" or not self._in_script:
+            return
+
+        self._in_script = False
+        text = "".join(self._script_text)
+
+        if self._script_is_json_ld:
+            if len(self.data.json_ld) < self._json_ld_count:
+                try:
+                    self.data.json_ld.append(json.loads(text))
+                except json.decoder.JSONDecodeError:
+                    logging.error("Could not decode JSON-LD block %.200s", text)
+        else:
+            for name, pattern in self._script_variables.items():
+                if name in self.data.script_variables:
+                    continue
+                match = pattern.search(text)
+                if match is not None:
+                    self.data.script_variables[name] = match.group(1)
+
+        self._check_done()
+
+
+def extract_page_data(
+    markup: str,
+    json_ld: int = 0,
+    json_ld_attrs: Optional[Dict[str, str]] = None,
+    meta: Iterable[str] = (),
+    script_variables: Iterable[str] = ()
+    ) -> PageData:
+    """Extract the requested data from markup, see PageExtractor for the arguments."""
+    extractor = PageExtractor(json_ld, json_ld_attrs, meta, script_variables)
+    extractor.feed(markup)
+    extractor.close()
+    return extractor.data
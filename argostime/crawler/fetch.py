@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+    crawler/fetch.py
+
+    HTTP layer shared by all crawlers. Crawlers should use fetch() instead of
+    calling requests directly, so connections are reused and responses can be
+    answered from the HTTP cache.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import codecs
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from argostime.config import get_config
+from argostime.crawl_metrics import record_request, record_response, record_retry
+from argostime.exceptions import CircuitOpenException
+
+from argostime.crawler.circuit_breaker import DEFAULT_MAX_RETRIES, DEFAULT_RETRY_BACKOFF
+from argostime.crawler.circuit_breaker import DEFAULT_RETRY_BUDGET
+from argostime.crawler.circuit_breaker import RetryBudget, get_breaker
+from argostime.crawler.extract import PageExtractor
+from argostime.crawler.http_cache import HTTPCache, current_entry
+from argostime.crawler.replay import Corpus, RecordingAdapter, ReplayAdapter, StandInAdapter
+from argostime.crawler.replay import MissingResponse, RecordedResponse, ResponseCaptured
+from argostime.crawler.replay import captured_responses
+
+__config = get_config()
+
+DEFAULT_TIMEOUT: float = 10
+DEFAULT_HTTP_CACHE_MAX_SIZE: int = 64 * 1024 * 1024
+STREAM_CHUNK_SIZE: int = 16 * 1024
+MAX_RETRY_DELAY: float = 60
+
+# Responses that mean the shop is in trouble or wants us to slow down
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+MAX_RETRIES: int = __config.getint("crawler", "max_retries", fallback=DEFAULT_MAX_RETRIES)
+RETRY_BACKOFF: float = __config.getfloat(
+    "crawler", "retry_backoff", fallback=DEFAULT_RETRY_BACKOFF)
+
+retry_budget: RetryBudget = RetryBudget(
+    __config.getint("crawler", "retry_budget", fallback=DEFAULT_RETRY_BUDGET))
+
+session: requests.Session = requests.Session()
+
+_http_cache: Optional[HTTPCache] = None
+
+
+def _use_adapter(adapter: BaseAdapter) -> None:
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def use_network() -> None:
+    """Send requests of crawlers to the shops, the default."""
+    _use_adapter(HTTPAdapter())
+
+
+def use_recording(corpus: str) -> None:
+    """Send requests of crawlers to the shops and record all responses in corpus."""
+    logging.info("Recording responses in %s", corpus)
+    _use_adapter(RecordingAdapter(Corpus(corpus)))
+
+
+def use_replay(corpus: str) -> None:
+    """Answer requests of crawlers from the responses recorded in corpus."""
+    logging.info("Replaying responses from %s", corpus)
+    _use_adapter(ReplayAdapter(Corpus(corpus)))
+
+
+def use_stand_in(base_url: str) -> None:
+    """Send requests of crawlers to the replay_server.py listening at base_url."""
+    logging.info("Sending requests to stand-in server %s", base_url)
+    _use_adapter(StandInAdapter(base_url))
+
+
+if "crawler" in __config:
+    if "record" in __config["crawler"]:
+        use_recording(__config["crawler"]["record"])
+    elif "replay" in __config["crawler"]:
+        use_replay(__config["crawler"]["replay"])
+    elif "stand_in" in __config["crawler"]:
+        use_stand_in(__config["crawler"]["stand_in"])
+
+
+def get_http_cache() -> Optional[HTTPCache]:
+    """Return the HTTP cache configured in argostime.conf, or None if it is disabled.
+
+    The cache is enabled by setting http_cache to a file path in the [crawler] section.
+    """
+    global _http_cache  # pylint: disable=W0603
+
+    if _http_cache is None and "crawler" in __config and "http_cache" in __config["crawler"]:
+        max_size = __config["crawler"].getint("http_cache_max_size", DEFAULT_HTTP_CACHE_MAX_SIZE)
+        _http_cache = HTTPCache(__config["crawler"]["http_cache"], max_size)
+        logging.debug("Using HTTP cache %s of at most %d bytes", _http_cache.path, max_size)
+
+    return _http_cache
+
+
+def _read_partial(
+    response: requests.Response,
+    stop_at: Optional[str],
+    max_bytes: Optional[int],
+    extractor: Optional[PageExtractor]
+    ) -> None:
+    """Read the body of a streamed response until the crawler has what it needs.
+
+    The connection is closed afterwards, and the part of the body that was read
+    is available as response.content and response.text.
+    """
+    body = bytearray()
+    encoding = response.encoding or "utf-8"
+    marker = stop_at.encode(encoding) if stop_at is not None else None
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+
+    try:
+        for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+            search_from = max(0, len(body) - len(marker) + 1) if marker is not None else 0
+            body += chunk
+
+            if extractor is not None and extractor.feed(decoder.decode(chunk)):
+                break
+            if marker is not None:
+                position = body.find(marker, search_from)
+                if position != -1:
+                    del body[position + len(marker):]
+                    break
+            if max_bytes is not None and len(body) >= max_bytes:
+                del body[max_bytes:]
+                break
+    finally:
+        response.close()
+
+    if extractor is not None:
+        extractor.feed(decoder.decode(b"", final=True))
+        extractor.close()
+
+    content_length = response.headers.get("Content-Length")
+    logging.debug(
+        "Read %d of %s bytes of %s",
+        len(body),
+        content_length if content_length is not None else "unknown",
+        response.url
+        )
+    response._content = bytes(body)  # pylint: disable=W0212
+
+
+def _retry_delay(attempt: int, response: Optional[requests.Response]) -> float:
+    """Return the number of seconds to wait before retry number attempt."""
+    delay: float = RETRY_BACKOFF * 2 ** attempt
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get("Retry-After", 0)))
+        except ValueError:
+            # Retry-After may also be a date, the backoff will have to do
+            pass
+    return min(delay, MAX_RETRY_DELAY)
+
+
+def _send(url: str, headers: Dict[str, str], stream: bool, **kwargs: Any) -> requests.Response:
+    """Send a GET request through the circuit breaker of the shop, retrying failures.
+
+    Failed requests are retried with exponential backoff as long as the breaker is
+    closed and the retry budget of this run lasts. Raises CircuitOpenException if
+    the breaker refuses the request.
+    """
+    captured = captured_responses()
+    if captured is not None:
+        if url in captured.responses:
+            request = requests.Request("GET", url, headers=headers).prepare()
+            return captured.responses[url].to_response(request)
+        if not captured.capture:
+            raise MissingResponse(url)
+
+    breaker = get_breaker(url)
+    attempt: int = 0
+
+    while True:
+        if not breaker.allow_request():
+            raise CircuitOpenException(url)
+
+        response: Optional[requests.Response] = None
+        start = time.perf_counter()
+        try:
+            response = session.get(url, headers=headers, stream=stream, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as exception:
+            record_request(url, time.perf_counter() - start)
+            breaker.record_failure()
+            if attempt >= MAX_RETRIES or breaker.is_open() or not retry_budget.spend():
+                raise
+            logging.info("Retrying %s after %s", url, repr(exception))
+        except BaseException:
+            # Not worth a retry, but a probe must still be resolved
+            record_request(url, time.perf_counter() - start)
+            breaker.record_failure()
+            raise
+        else:
+            record_request(url, time.perf_counter() - start)
+            if response.status_code not in RETRY_STATUS_CODES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if attempt >= MAX_RETRIES or breaker.is_open() or not retry_budget.spend():
+                return response
+            logging.info("Retrying %s after status code %d", url, response.status_code)
+            response.close()
+
+        record_retry(url)
+        time.sleep(_retry_delay(attempt, response))
+        attempt += 1
+
+
+def fetch(
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    stop_at: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    extractor: Optional[PageExtractor] = None,
+    **kwargs: Any
+    ) -> requests.Response:
+    """Send a GET request for url and return the response.
+
+    Accepts the same keyword arguments as requests.get(). If the page is being crawled
+    with the HTTP cache enabled, a conditional request is sent and NotModifiedException
+    is raised if the page did not change since the last crawl.
+
+    Crawlers that only need the start of a page can stop the download early: the body
+    is streamed and the connection closed as soon as stop_at has been received, max_bytes
+    have been read, or the given extractor has found everything it looks for. The
+    extractor is fed the body while it is downloaded.
+
+    Requests go through the circuit breaker of the shop: CircuitOpenException is raised
+    without sending anything if the shop failed too often, and connection errors, 5xx
+    and 429 responses are retried with exponential backoff.
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    request_headers: Dict[str, str] = dict(headers or {})
+    start = time.perf_counter()
+
+    entry = current_entry()
+    if entry is not None:
+        request_headers.update(entry.conditional_headers(url))
+
+    streamed: bool = stop_at is not None or max_bytes is not None or extractor is not None
+    response: requests.Response = _send(url, request_headers, streamed, **kwargs)
+
+    if streamed:
+        try:
+            if response.status_code == 200:
+                _read_partial(response, stop_at, max_bytes, extractor)
+            else:
+                response.close()
+                response._content = b""  # pylint: disable=W0212
+        except BaseException:
+            get_breaker(url).record_failure()
+            raise
+
+    captured = captured_responses()
+    if captured is None or captured.capture:
+        # Responses answered from captured ones were recorded when they were captured
+        record_response(url, len(response.content), time.perf_counter() - start)
+    if captured is not None and captured.capture and url not in captured.responses:
+        captured.responses[url] = RecordedResponse.from_response(response)
+        raise ResponseCaptured(url)
+
+    if entry is not None:
+        entry.check_response(url, response)
+
+    return response
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+    crawler/http_cache.py
+
+    On-disk cache of HTTP validators and crawl results, used to send conditional
+    requests and to skip parsing pages that did not change since the last crawl.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from typing import Dict, Iterator, Optional
+
+import requests
+
+from argostime.exceptions import NotModifiedException
+
+from argostime.crawler.crawl_utils import CrawlResult
+
+
+@dataclass
+class CacheStatistics:
+    """Cache statistics of a single shop."""
+    hits: int = 0
+    misses: int = 0
+    not_modified: int = 0
+    bytes_saved: int = 0
+
+    def hit_rate(self) -> float:
+        """Return the fraction of crawls that were answered from the cache."""
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+
+@dataclass
+class CacheEntry:
+    """Validators of the response a crawl was based on, plus the crawl result."""
+    url: str
+    shop: str
+    fetch_url: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    digest: Optional[str] = None
+    body_size: int = 0
+    result: Optional[CrawlResult] = None
+    fetched: bool = field(default=False, repr=False)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Return the If-None-Match/If-Modified-Since headers for a request to url."""
+        headers: Dict[str, str] = {}
+        if self.result is None or url != self.fetch_url:
+            return headers
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def check_response(self, url: str, response: requests.Response) -> None:
+        """Record the validators of a response, raise NotModifiedException if unchanged.
+
+        Only the first request of a crawl is used to decide if the page changed.
+        """
+        if self.fetched:
+            return
+        self.fetched = True
+
+        if response.status_code == 304 and self.result is not None:
+            raise NotModifiedException(url, self.body_size)
+
+        if response.status_code != 200:
+            return
+
+        digest = hashlib.sha256(response.content).hexdigest()
+        unchanged = self.result is not None and url == self.fetch_url and digest == self.digest
+
+        self.fetch_url = url
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        self.digest = digest
+        self.body_size = len(response.content)
+
+        if unchanged:
+            raise NotModifiedException(url, 0)
+
+
+_current_entry: ContextVar[Optional[CacheEntry]] = ContextVar("current_entry", default=None)
+
+
+def current_entry() -> Optional[CacheEntry]:
+    """Return the cache entry of the crawl running in the current context, if any."""
+    return _current_entry.get()
+
+
+def _dump_result(result: CrawlResult) -> str:
+    """Serialize a CrawlResult to JSON."""
+    data = dict(vars(result))
+    if result.valid_until is not None:
+        data["valid_until"] = result.valid_until.isoformat()
+    return json.dumps(data)
+
+
+def _load_result(data: str) -> CrawlResult:
+    """Restore a CrawlResult serialized by _dump_result()."""
+    fields = json.loads(data)
+    if fields.get("valid_until") is not None:
+        fields["valid_until"] = datetime.fromisoformat(fields["valid_until"])
+    return CrawlResult(**fields)
+
+
+class HTTPCache:
+    """SQLite-backed store of cache entries, bounded in size with LRU eviction."""
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self.statistics: Dict[str, CacheStatistics] = {}
+
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "url TEXT PRIMARY KEY, fetch_url TEXT, etag TEXT, last_modified TEXT, "
+                "digest TEXT, body_size INTEGER, result TEXT, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, url: str, shop: str) -> CacheEntry:
+        """Return the stored entry for url, or an empty entry if there is none."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT fetch_url, etag, last_modified, digest, body_size, result "
+                "FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE entries SET last_used = ? WHERE url = ?", (time.time(), url))
+
+        if row is None:
+            return CacheEntry(url=url, shop=shop)
+
+        return CacheEntry(
+            url=url,
+            shop=shop,
+            fetch_url=row[0],
+            etag=row[1],
+            last_modified=row[2],
+            digest=row[3],
+            body_size=row[4],
+            result=_load_result(row[5]),
+        )
+
+    def put(self, entry: CacheEntry) -> None:
+        """Store an entry and evict the least recently used entries if needed."""
+        if entry.result is None or entry.digest is None:
+            return
+
+        result = _dump_result(entry.result)
+        size = len(entry.url) + len(entry.fetch_url or "") + len(entry.etag or "") \
+            + len(entry.last_modified or "") + len(entry.digest) + len(result)
+
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.url, entry.fetch_url, entry.etag, entry.last_modified, entry.digest,
+                 entry.body_size, result, size, time.time())
+            )
+            self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        total: int = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        evicted = 0
+        for url, size in connection.execute(
+                "SELECT url, size FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_size:
+                break
+            connection.execute("DELETE FROM entries WHERE url = ?", (url,))
+            total -= size
+            evicted += 1
+        logging.debug("Evicted %d entries from the HTTP cache", evicted)
+
+    def _statistics(self, shop: str) -> CacheStatistics:
+        return self.statistics.setdefault(shop, CacheStatistics())
+
+    @contextmanager
+    def crawl(self, url: str, shop: str) -> Iterator[CacheEntry]:
+        """Make the cache entry of url available to fetch() for the duration of a crawl."""
+        entry = self.get(url, shop)
+        token = _current_entry.set(entry)
+        try:
+            yield entry
+        finally:
+            _current_entry.reset(token)
+
+    def record_hit(self, entry: CacheEntry, exception: NotModifiedException) -> CrawlResult:
+        """Account for a crawl answered from the cache and return the stored result."""
+        assert entry.result is not None
+        statistics = self._statistics(entry.shop)
+        statistics.hits += 1
+        statistics.bytes_saved += exception.bytes_saved
+        if exception.bytes_saved > 0:
+            statistics.not_modified += 1
+        else:
+            # The body was downloaded again, keep the (possibly new) validators
+            self.put(entry)
+        logging.debug("HTTP cache hit for %s, saved %d bytes", entry.url, exception.bytes_saved)
+        return entry.result
+
+    def record_miss(self, entry: CacheEntry, result: CrawlResult) -> None:
+        """Account for a fully crawled page and store the new result."""
+        self._statistics(entry.shop).misses += 1
+        entry.result = result
+        self.put(entry)
+
+    def log_statistics(self) -> None:
+        """Log the hit rate and the number of bytes saved per shop."""
+        for shop, statistics in sorted(self.statistics.items()):
+            logging.info(
+                "HTTP cache for %s: %d hits, %d misses (hit rate %.1f%%), "
+                "%d not modified, %d bytes saved",
+                shop,
+                statistics.hits,
+                statistics.misses,
+                statistics.hit_rate() * 100,
+                statistics.not_modified,
+                statistics.bytes_saved
+                )
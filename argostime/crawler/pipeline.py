@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+    crawler/pipeline.py
+
+    Crawl many URLs in a pipeline of three stages connected by bounded queues:
+    fetch threads download the pages, a process pool runs the crawlers on the
+    downloaded pages, and the caller stores the results in batches.
+
+    The crawlers themselves are not split up. In the fetch stage a crawler runs
+    until it requests a page, which is downloaded and captured before the crawler is
+    stopped. In the parse stage the crawler runs again in another process, where its
+    requests are answered from the captured responses. Crawlers that need more than
+    one page go back to the fetch stage for every page they request.
+
+    The pipeline does not use the HTTP cache: a response that was not modified can
+    only be answered from the cached result in the process that sent the request.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+import urllib.parse
+
+from argostime.crawl_metrics import Outcome, record_crawl
+from argostime.exceptions import CircuitOpenException, CrawlerException
+from argostime.exceptions import PageNotFoundException, WebsiteNotImplementedException
+
+from argostime.crawler.circuit_breaker import defer_if_open, get_breaker
+from argostime.crawler.crawl_utils import CrawlResult, enabled_shops
+from argostime.crawler.replay import CapturedResponses, MissingResponse, ResponseCaptured
+from argostime.crawler.replay import use_captured_responses
+
+PersistFunc = Callable[[List[Tuple[str, CrawlResult]]], None]
+
+# Seconds to wait for new results before storing an incomplete batch
+PERSIST_TIMEOUT: float = 1
+
+
+@dataclass
+class StageMetrics:
+    """Counters of one stage of the pipeline."""
+    name: str
+    processed: int = 0
+    errors: int = 0
+    busy_seconds: float = 0
+    # Time spent waiting for a full queue of the next stage, the backpressure
+    blocked_seconds: float = 0
+    max_queue_size: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, busy: float = 0, blocked: float = 0, error: bool = False,
+            queue_size: int = 0) -> None:
+        """Account for one processed item."""
+        with self._lock:
+            self.processed += 1
+            self.errors += int(error)
+            self.busy_seconds += busy
+            self.blocked_seconds += blocked
+            self.max_queue_size = max(self.max_queue_size, queue_size)
+
+    def to_json(self) -> Dict[str, Any]:
+        """Return the counters as a JSON serializable dict."""
+        return {
+            "processed": self.processed,
+            "errors": self.errors,
+            "busy_seconds": self.busy_seconds,
+            "blocked_seconds": self.blocked_seconds,
+            "max_queue_size": self.max_queue_size,
+        }
+
+
+@dataclass
+class _Job:
+    url: str
+    captured: CapturedResponses = field(default_factory=CapturedResponses)
+
+
+@dataclass
+class _Outcome:
+    url: str
+    result: Optional[CrawlResult] = None
+    missing_url: Optional[str] = None
+    error: Optional[str] = None
+    kind: Outcome = Outcome.OK
+    parse_seconds: Optional[float] = None
+
+
+def _failure(url: str, exception: Exception) -> _Outcome:
+    return _Outcome(url, error=repr(exception), kind=Outcome.from_exception(exception))
+
+
+def _run_crawler(url: str) -> CrawlResult:
+    hostname: str = urllib.parse.urlparse(url).netloc
+    if hostname not in enabled_shops:
+        raise WebsiteNotImplementedException(url)
+    result: CrawlResult = enabled_shops[hostname]["crawler"](url)
+    result.check()
+    return result
+
+
+def _parse(url: str, captured: CapturedResponses) -> _Outcome:
+    """Run the crawler of url on the captured responses, in a process of the pool.
+
+    Exceptions are turned into an _Outcome, as not all of them can be pickled.
+    """
+    use_captured_responses(captured)
+    start = time.perf_counter()
+    try:
+        result = _run_crawler(url)
+        return _Outcome(url, result=result, parse_seconds=time.perf_counter() - start)
+    except MissingResponse as exception:
+        return _Outcome(url, missing_url=exception.url)
+    except (CrawlerException, PageNotFoundException) as exception:
+        return _failure(url, exception)
+    finally:
+        use_captured_responses(None)
+
+
+class _FetchQueue:
+    """Jobs waiting to be fetched, handed out per host within the limits of that host.
+
+    At most concurrency requests to a host run at the same time, and after every
+    request the host is left alone for a random delay between delay_min and
+    delay_max seconds. Fetch workers wait until a job of some host may be sent.
+    The jobs are not bounded: they are all known up front, and parse workers must
+    always be able to send a job back for another page.
+    """
+
+    def __init__(self, concurrency: int, delay_min: float, delay_max: float):
+        self.concurrency = concurrency
+        self.delay_min = delay_min
+        self.delay_max = delay_max
+        self.jobs: Dict[str, Deque[_Job]] = {}
+        self.active: Dict[str, int] = {}
+        self.next_request: Dict[str, float] = {}
+        self.closed: bool = False
+        self._condition = threading.Condition()
+
+    def put(self, job: _Job) -> None:
+        """Add a job to fetch."""
+        host = urllib.parse.urlparse(job.url).netloc
+        with self._condition:
+            self.jobs.setdefault(host, deque()).append(job)
+            self._condition.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[str, _Job]]:
+        """Wait for a job whose host may be sent a request now, and take a slot of it.
+
+        Returns the host and the job, or None once the queue is closed or after
+        timeout seconds.
+        """
+        deadline: Optional[float] = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while not self.closed:
+                now = time.monotonic()
+                wake: Optional[float] = deadline
+                for host, jobs in self.jobs.items():
+                    if not jobs or self.active.get(host, 0) >= self.concurrency:
+                        continue
+                    ready = self.next_request.get(host, 0)
+                    if ready <= now:
+                        self.active[host] = self.active.get(host, 0) + 1
+                        # Let the other hosts go first next time
+                        self.jobs[host] = self.jobs.pop(host)
+                        return host, jobs.popleft()
+                    wake = ready if wake is None else min(wake, ready)
+
+                if deadline is not None and now >= deadline:
+                    return None
+                self._condition.wait(None if wake is None else wake - now)
+            return None
+
+    def release(self, host: str) -> None:
+        """Give back the slot of a finished request to host."""
+        with self._condition:
+            self.active[host] -= 1
+            self.next_request[host] = \
+                time.monotonic() + random.uniform(self.delay_min, self.delay_max)
+            self._condition.notify()
+
+    def close(self) -> None:
+        """Stop all fetch workers."""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class CrawlPipeline:
+    """Crawl URLs with separate stages for fetching, parsing and storing the results."""
+
+    def __init__(
+        self,
+        fetch_workers: int = 8,
+        parse_workers: Optional[int] = None,
+        queue_size: int = 64,
+        batch_size: int = 50,
+        host_concurrency: int = 1,
+        host_delay_min: float = 0,
+        host_delay_max: float = 0
+        ):
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+
+        self.metrics: Dict[str, StageMetrics] = {
+            name: StageMetrics(name) for name in ("fetch", "parse", "persist")
+        }
+        self.failed: Dict[str, str] = {}
+
+        self._fetch_queue = _FetchQueue(host_concurrency, host_delay_min, host_delay_max)
+        self._parse_queue: "queue.Queue[Optional[_Job]]" = queue.Queue(queue_size)
+        self._persist_queue: "queue.Queue[_Outcome]" = queue.Queue(queue_size)
+        # The exception that stopped one of the stages, which ends the run
+        self._stage_error: Optional[BaseException] = None
+
+    def _put(self, target: queue.Queue, item: Any) -> float:
+        """Put item in target, return the seconds spent waiting for space."""
+        start = time.perf_counter()
+        target.put(item)
+        return time.perf_counter() - start
+
+    def _run_stage(self, stage: Callable[..., None], *args: Any) -> None:
+        """Run stage, storing the exception that stops it for the calling thread."""
+        try:
+            stage(*args)
+        except BaseException as exception:  # pylint: disable=W0703
+            logging.exception("Pipeline stage %s failed", threading.current_thread().name)
+            self._stage_error = exception
+
+    def _fetch_stage(self) -> None:
+        while True:
+            claimed = self._fetch_queue.get()
+            if claimed is None:
+                return
+            host, job = claimed
+
+            start = time.perf_counter()
+            outcome: Optional[_Outcome] = None
+            use_captured_responses(job.captured)
+            job.captured.capture = True
+            try:
+                if defer_if_open(job.url):
+                    outcome = _failure(job.url, CircuitOpenException(job.url))
+                else:
+                    # Runs until the crawler requests a page it has no response for yet
+                    outcome = _Outcome(job.url, result=_run_crawler(job.url))
+            except ResponseCaptured:
+                pass
+            except CircuitOpenException as exception:
+                get_breaker(job.url).defer(job.url)
+                outcome = _failure(job.url, exception)
+            except (CrawlerException, PageNotFoundException,
+                    WebsiteNotImplementedException) as exception:
+                outcome = _failure(job.url, exception)
+            except Exception as exception:  # pylint: disable=W0703
+                logging.exception("Fetching %s failed", job.url)
+                outcome = _failure(job.url, exception)
+            finally:
+                job.captured.capture = False
+                use_captured_responses(None)
+                self._fetch_queue.release(host)
+            busy = time.perf_counter() - start
+
+            if outcome is None:
+                blocked = self._put(self._parse_queue, job)
+            else:
+                blocked = self._put(self._persist_queue, outcome)
+            self.metrics["fetch"].add(busy, blocked, outcome is not None and outcome.error is not None,
+                                      self._parse_queue.qsize())
+
+    def _parse_stage(self, executor: ProcessPoolExecutor) -> None:
+        in_flight: Dict[Future, Tuple[_Job, float]] = {}
+        finished: bool = False
+
+        while not finished or in_flight:
+            # Keep at most twice the number of workers busy, so the parse queue
+            # fills up and slows down the fetch stage when parsing falls behind.
+            while not finished and len(in_flight) < 2 * self.parse_workers:
+                try:
+                    job = self._parse_queue.get(timeout=0.1 if in_flight else None)
+                except queue.Empty:
+                    break
+                if job is None:
+                    finished = True
+                    break
+                future = executor.submit(_parse, job.url, job.captured)
+                in_flight[future] = (job, time.perf_counter())
+
+            if not in_flight:
+                continue
+            done: Set[Future] = wait(in_flight, timeout=0.1, return_when=FIRST_COMPLETED)[0]
+            for future in done:
+                job, started = in_flight.pop(future)
+                busy = time.perf_counter() - started
+                try:
+                    outcome: _Outcome = future.result()
+                except Exception as exception:  # pylint: disable=W0703
+                    outcome = _failure(job.url, exception)
+
+                if outcome.missing_url is not None:
+                    logging.debug("%s needs %s as well", job.url, outcome.missing_url)
+                    self._fetch_queue.put(job)
+                    blocked = 0.0
+                else:
+                    blocked = self._put(self._persist_queue, outcome)
+                self.metrics["parse"].add(busy, blocked, outcome.error is not None,
+                                          self._persist_queue.qsize())
+
+    def run(self, urls: List[str], persist: PersistFunc) -> Dict[str, CrawlResult]:
+        """Crawl all urls and pass the results to persist in batches.
+
+        persist is called from the calling thread, so it can use the database
+        session of the caller. Returns the results, failures are logged and stored
+        in self.failed.
+        """
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+            # Start the processes before the threads, forking a process while other
+            # threads hold locks, like those of logging, can deadlock the process.
+            executor.submit(os.getpid).result()
+            return self._run(urls, persist, executor)
+
+    def _run(
+        self,
+        urls: List[str],
+        persist: PersistFunc,
+        executor: ProcessPoolExecutor
+        ) -> Dict[str, CrawlResult]:
+        for url in urls:
+            self._fetch_queue.put(_Job(url))
+
+        threads = [
+            threading.Thread(target=self._run_stage, args=(self._fetch_stage,),
+                             name=f"fetch-{i}", daemon=True)
+            for i in range(self.fetch_workers)
+        ]
+        threads.append(threading.Thread(
+            target=self._run_stage, args=(self._parse_stage, executor), name="parse",
+            daemon=True))
+        for thread in threads:
+            thread.start()
+
+        results: Dict[str, CrawlResult] = {}
+        batch: List[Tuple[str, CrawlResult]] = []
+        remaining: int = len(urls)
+        while (remaining > 0 and self._stage_error is None) or batch:
+            outcome: Optional[_Outcome] = None
+            if remaining > 0 and self._stage_error is None:
+                try:
+                    outcome = self._persist_queue.get(timeout=PERSIST_TIMEOUT)
+                except queue.Empty:
+                    pass
+
+            if outcome is not None:
+                remaining -= 1
+                record_crawl(outcome.url, outcome.kind, outcome.parse_seconds)
+                if outcome.result is not None:
+                    results[outcome.url] = outcome.result
+                    batch.append((outcome.url, outcome.result))
+                else:
+                    logging.error("Crawling %s failed with %s", outcome.url, outcome.error)
+                    self.failed[outcome.url] = outcome.error or ""
+
+            if batch and (len(batch) >= self.batch_size or outcome is None or remaining == 0):
+                start = time.perf_counter()
+                persist(batch)
+                self.metrics["persist"].add(time.perf_counter() - start,
+                                            queue_size=self._persist_queue.qsize())
+                batch = []
+
+        self._fetch_queue.close()
+        if self._stage_error is not None:
+            # The outcomes of the failed stage never arrive, the other stages may be
+            # blocked on its queue and are left behind as daemon threads
+            self.log_metrics()
+            raise self._stage_error
+        self._parse_queue.put(None)
+        for thread in threads:
+            thread.join()
+
+        self.log_metrics()
+        return results
+
+    def log_metrics(self) -> None:
+        """Log the counters of every stage."""
+        for metrics in self.metrics.values():
+            logging.info(
+                "Pipeline stage %s: %d processed, %d errors, %.1f s busy, %.1f s blocked, "
+                "at most %d waiting",
+                metrics.name,
+                metrics.processed,
+                metrics.errors,
+                metrics.busy_seconds,
+                metrics.blocked_seconds,
+                metrics.max_queue_size
+                )
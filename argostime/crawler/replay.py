@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+    crawler/replay.py
+
+    Record HTTP responses of crawls into a local corpus and replay them later, so
+    crawlers can be tested and benchmarked without contacting the shops.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import base64
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import timedelta
+import hashlib
+import io
+import json
+import logging
+import os
+from typing import Any, Dict, Iterator, List, Optional
+import urllib.parse
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Bump this when the format of recorded responses changes. Each version is stored
+# in its own subdirectory of the corpus, so old recordings are never misread.
+CORPUS_VERSION: int = 1
+
+# The recorded body is already decoded, so these headers no longer apply to it
+_DROPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+@dataclass
+class RecordedResponse:
+    """A response stored in the corpus."""
+    url: str
+    status_code: int
+    reason: str = "OK"
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+    def to_json(self) -> Dict[str, Any]:
+        """Return a JSON serializable dict, with the body as text where possible."""
+        data: Dict[str, Any] = {
+            "version": CORPUS_VERSION,
+            "url": self.url,
+            "status_code": self.status_code,
+            "reason": self.reason,
+            "headers": self.headers,
+        }
+        try:
+            data["text"] = self.body.decode("utf-8")
+        except UnicodeDecodeError:
+            data["body_base64"] = base64.b64encode(self.body).decode("ascii")
+        return data
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "RecordedResponse":
+        """Create a RecordedResponse from the output of to_json()."""
+        if "text" in data:
+            body = data["text"].encode("utf-8")
+        else:
+            body = base64.b64decode(data["body_base64"])
+        return cls(data["url"], data["status_code"], data["reason"], data["headers"], body)
+
+    @classmethod
+    def from_response(cls, response: requests.Response) -> "RecordedResponse":
+        """Create a RecordedResponse from a response received from a shop."""
+        headers = {
+            key: value for key, value in response.headers.items()
+            if key.lower() not in _DROPPED_HEADERS
+        }
+        return cls(response.url, response.status_code, response.reason or "", headers,
+                   response.content)
+
+    def to_response(self, request: requests.PreparedRequest) -> requests.Response:
+        """Create a response to request from the recording."""
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.reason = self.reason
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.headers["Content-Length"] = str(len(self.body))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(self.body)
+        response.url = request.url or self.url
+        response.request = request
+        response.elapsed = timedelta(0)
+        return response
+
+
+@dataclass
+class CapturedResponses:
+    """Responses of a single crawl, used to split crawls in a fetch and a parse step.
+
+    While capturing, fetch() sends the first request that has no response yet, adds
+    the response and raises ResponseCaptured to stop the crawler before it parses
+    anything. Otherwise fetch() only answers from the captured responses and raises
+    MissingResponse for other URLs.
+    """
+    responses: Dict[str, RecordedResponse] = field(default_factory=dict)
+    capture: bool = False
+
+
+class ResponseCaptured(Exception):
+    """Raised by fetch() to stop a crawler after capturing a response."""
+
+    def __init__(self, url: str):
+        self.url = url
+        super().__init__(url)
+
+
+class MissingResponse(Exception):
+    """Raised by fetch() if a crawler requests a URL that was not captured."""
+
+    def __init__(self, url: str):
+        self.url = url
+        super().__init__(url)
+
+
+_captured_responses: ContextVar[Optional[CapturedResponses]] = \
+    ContextVar("captured_responses", default=None)
+
+
+def captured_responses() -> Optional[CapturedResponses]:
+    """Return the captured responses of the crawl running in this context, if any."""
+    return _captured_responses.get()
+
+
+def use_captured_responses(captured: Optional[CapturedResponses]) -> None:
+    """Answer the requests of crawls in this context from captured, None to stop."""
+    _captured_responses.set(captured)
+
+
+class Corpus:
+    """Directory with recorded responses, one JSON file per URL."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _file_path(self, url: str) -> str:
+        hostname = urllib.parse.urlparse(url).netloc
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, f"v{CORPUS_VERSION}", hostname, f"{name}.json")
+
+    def load(self, url: str) -> Optional[RecordedResponse]:
+        """Return the recorded response for url, or None if it was not recorded."""
+        try:
+            with open(self._file_path(url), encoding="utf-8") as file:
+                return RecordedResponse.from_json(json.load(file))
+        except FileNotFoundError:
+            return None
+
+    def save(self, recording: RecordedResponse) -> None:
+        """Store a recorded response, replacing an earlier recording of the same URL."""
+        file_path = self._file_path(recording.url)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w", encoding="utf-8") as file:
+            json.dump(recording.to_json(), file, indent=4, ensure_ascii=False)
+        logging.debug("Recorded %s in %s", recording.url, file_path)
+
+    def page_urls(self) -> List[str]:
+        """Return the URLs of the product pages in the corpus.
+
+        These are listed in urls.txt, as some crawlers request other URLs than the
+        product page itself. Without that file all recorded URLs are returned.
+        """
+        try:
+            with open(os.path.join(self.path, "urls.txt"), encoding="utf-8") as file:
+                return [line.strip() for line in file if line.strip()]
+        except FileNotFoundError:
+            return [recording.url for recording in self]
+
+    def add_page(self, url: str) -> None:
+        """Add url to the product pages listed in urls.txt."""
+        os.makedirs(self.path, exist_ok=True)
+        urls_path = os.path.join(self.path, "urls.txt")
+        if os.path.exists(urls_path) and url in self.page_urls():
+            return
+        with open(urls_path, "a", encoding="utf-8") as file:
+            file.write(f"{url}\n")
+
+    def __iter__(self) -> Iterator[RecordedResponse]:
+        version_path = os.path.join(self.path, f"v{CORPUS_VERSION}")
+        if not os.path.isdir(version_path):
+            return
+        for hostname in sorted(os.listdir(version_path)):
+            for filename in sorted(os.listdir(os.path.join(version_path, hostname))):
+                if filename.endswith(".json"):
+                    with open(os.path.join(version_path, hostname, filename),
+                              encoding="utf-8") as file:
+                        yield RecordedResponse.from_json(json.load(file))
+
+
+# Headers of the conditional requests sent when the HTTP cache is enabled
+_CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Transport adapter that sends requests to the shops and records the responses.
+
+    Responses to conditional requests are only recorded if they contain the whole
+    page, a 304 Not Modified would replace the recorded page with an empty body.
+    """
+
+    def __init__(self, corpus: Corpus):
+        super().__init__()
+        self.corpus = corpus
+
+    def send(self, request, *args, **kwargs):  # pylint: disable=W0221
+        response = super().send(request, *args, **kwargs)
+        if response.status_code == 304 or (
+                response.status_code != 200
+                and any(header in request.headers for header in _CONDITIONAL_HEADERS)):
+            logging.debug("Not recording the %d response to a conditional request for %s",
+                          response.status_code, request.url)
+            return response
+
+        # Reading the content means streamed responses are downloaded completely,
+        # so the corpus contains the whole page.
+        self.corpus.save(RecordedResponse.from_response(response))
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter that answers requests from the corpus, without any network."""
+
+    def __init__(self, corpus: Corpus):
+        super().__init__()
+        self.corpus = corpus
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        # pylint: disable=R0913
+        recording = self.corpus.load(request.url)
+        if recording is None:
+            # Like replay_server.py, answer URLs that were never recorded with a 404
+            logging.warning("%s is not in the corpus", request.url)
+            recording = RecordedResponse(request.url, 404, "Not Recorded")
+        return recording.to_response(request)
+
+    def close(self) -> None:
+        pass
+
+
+class StandInAdapter(HTTPAdapter):
+    """Transport adapter that sends requests to a replay_server.py instead of the shop.
+
+    https://www.example.com/page?id=1 is requested as
+    {base_url}/https/www.example.com/page?id=1
+    """
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, request, *args, **kwargs):  # pylint: disable=W0221
+        original_url = request.url
+        parsed = urllib.parse.urlsplit(original_url)
+        request.url = f"{self.base_url}/{parsed.scheme}/{parsed.netloc}{parsed.path or '/'}"
+        if parsed.query:
+            request.url += f"?{parsed.query}"
+
+        response = super().send(request, *args, **kwargs)
+        response.url = original_url
+        request.url = original_url
+        return response
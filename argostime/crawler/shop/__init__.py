@@ -22,10 +22,23 @@
     along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
 """
 
-from os.path import dirname, basename, isfile, join
-import glob
-
-# Load all modules in the current directory, based on the answer from Anurag Uniyal:
-# https://stackoverflow.com/questions/1057431/how-to-load-all-modules-in-a-folder
-modules = glob.glob(join(dirname(__file__), "*.py"))
-__all__ = [basename(f)[:-3] for f in modules if isfile(f) and not f.endswith('__init__.py')]
+from typing import Dict
+
+# The module in this package with the crawler of every shop, by the hostname it is
+# registered with. Shop modules are only imported when a URL of their shop is
+# crawled, see crawl_utils.ShopRegistry. Add new shops here as well.
+SHOP_MODULES: Dict[str, str] = {
+    "ah.nl": "ah",
+    "brandzaak.nl": "brandzaak",
+    "ekoplaza.nl": "ekoplaza",
+    "etos.nl": "etos",
+    "gamma.nl": "intergamma",
+    "hema.nl": "hema",
+    "ikea.com": "ikea",
+    "jumbo.com": "jumbo",
+    "karwei.nl": "intergamma",
+    "pipa-shop.nl": "pipashop",
+    "praxis.nl": "praxis",
+    "simonlevelt.nl": "simonlevelt",
+    "store.steampowered.com": "steam",
+}
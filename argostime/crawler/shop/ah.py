@@ -22,47 +22,42 @@
     along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
 """
 
-from datetime import date
-import json
+from datetime import date, datetime, time, timedelta
 import logging
+from typing import Optional
 
 import requests
-from bs4 import BeautifulSoup
 
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
-from argostime.crawler.crawl_utils import CrawlResult, parse_promotional_message, register_crawler
+from argostime.crawler.crawl_utils import CrawlResult, parse_html, register_crawler
+from argostime.crawler.crawl_utils import parse_promotional_message
+from argostime.crawler.extract import extract_page_data
+from argostime.crawler.fetch import fetch
 
 
-@register_crawler("Albert Heijn", "ah.nl")
+@register_crawler("Albert Heijn", "ah.nl", cacheable=False)
 def crawl_ah(url: str) -> CrawlResult:
     """Crawler for ah.nl"""
-    response: requests.Response = requests.get(url)
+    response: requests.Response = fetch(url)
 
     if response.status_code != 200:
         logging.error("Got status code %d while getting url %s", response.status_code, url)
         raise PageNotFoundException(url)
 
-    soup = BeautifulSoup(response.text, "html.parser")
-
-    raw_json_match = soup.find(
-        "script",
-        attrs={ "type": "application/ld+json", "data-react-helmet": "true"}
+    page_data = extract_page_data(
+        response.text,
+        json_ld=1,
+        json_ld_attrs={"data-react-helmet": "true"}
         )
 
     result: CrawlResult = CrawlResult(url=url)
 
     try:
-        product_dict = json.loads(raw_json_match.text)
-    except json.decoder.JSONDecodeError as exception:
-        logging.error("Could not decode JSON %s, raising CrawlerException", raw_json_match)
-        raise CrawlerException from exception
-    except Exception as exception:
-        logging.error(
-            "Could not find a JSON to parse? Got Exception %s parsing %s",
-            exception,
-            raw_json_match)
+        product_dict = page_data.json_ld[0]
+    except IndexError as exception:
+        logging.error("Could not find a JSON to parse in %s, raising CrawlerException", url)
         raise CrawlerException from exception
 
     try:
@@ -100,14 +95,22 @@ def crawl_ah(url: str) -> CrawlResult:
             bonus_from = date(year=2000, month=1, day=1)
         try:
             bonus_until: date = date.fromisoformat(offer["priceValidUntil"])
+            # The bonus price holds until the end of its last day
+            valid_until: Optional[datetime] = \
+                datetime.combine(bonus_until + timedelta(days=1), time.min)
         except ValueError:
             logging.error(
                 "Failed to parse priceValidUntil %s, using fallback",
                 offer["priceValidUntil"]
                 )
             bonus_until = date(year=5000, month=12, day=31)
+            valid_until = None
 
         if date.today() >= bonus_from and date.today() <= bonus_until:
+            # The promotional message is not part of the JSON, so only now
+            # parse the complete page to find it.
+            soup = parse_html(response.text, url)
+
             # Try to find a promotional message
             promo_text_matches = soup.find_all(
                 "p",
@@ -148,6 +151,7 @@ def crawl_ah(url: str) -> CrawlResult:
             else:
                 result.discount_price = price
             result.on_sale = True
+            result.valid_until = valid_until
         else:
             # No valid bonus, so there's no valid price available.
             logging.info("No valid price found for %s", url)
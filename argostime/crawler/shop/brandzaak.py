@@ -26,46 +26,45 @@
 
 import logging
 
-import requests
-from bs4 import BeautifulSoup
 
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
 from argostime.crawler.crawl_utils import CrawlResult, register_crawler
+from argostime.crawler.extract import PageExtractor
+from argostime.crawler.fetch import fetch
 
 
 @register_crawler("Brandzaak", "brandzaak.nl")
 def crawl_brandzaak(url: str) -> CrawlResult:
     """Parse a product from brandzaak.nl"""
 
-    response = requests.get(url)
+    # The meta tags are in the head of the page, no need to download the rest
+    extractor = PageExtractor(meta=("title", "product:price:amount"))
+    response = fetch(url, stop_at="</head>", extractor=extractor)
 
     if response.status_code != 200:
         logging.error("Got status code %d while getting url %s", response.status_code, url)
         raise PageNotFoundException(url)
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    meta = extractor.data.meta
 
     result: CrawlResult = CrawlResult(url=url)
 
-    product_title = soup.find("meta", attrs={ "name": "title"})
-    product_price = soup.find("meta", attrs={ "property": "product:price:amount"})
-
     try:
-        result.product_name = product_title['content']
+        result.product_name = meta["title"]
     except KeyError as exception:
-        logging.error("Could not find product name in %s", product_title)
+        logging.error("Could not find product name in %s", meta)
         raise CrawlerException from exception
     try:
-        result.normal_price = float(product_price['content'])
+        result.normal_price = float(meta["product:price:amount"])
     except KeyError as exception:
-        logging.error("Could not find price in %s", product_price)
+        logging.error("Could not find price in %s", meta)
         raise CrawlerException from exception
     try:
-        result.product_code = product_title['content'].replace(" ", "-")
+        result.product_code = meta["title"].replace(" ", "-")
     except KeyError as exception:
-        logging.error("Could not find product code in %s", product_title)
+        logging.error("Could not find product code in %s", meta)
         raise CrawlerException from exception
 
     return result
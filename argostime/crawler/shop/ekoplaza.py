@@ -24,12 +24,11 @@
 
 import logging
 
-import requests
-
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
 from argostime.crawler.crawl_utils import CrawlResult, register_crawler
+from argostime.crawler.fetch import fetch
 
 
 @register_crawler("Ekoplaza", "ekoplaza.nl")
@@ -37,7 +36,7 @@ def crawl_ekoplaza(url: str) -> CrawlResult:
     """Ekoplaza crawler"""
 
     info = url.split('product/')[-1]
-    response = requests.get(
+    response = fetch(
         f'https://www.ekoplaza.nl/api/aspos/products/url/{info}', timeout=10)
 
     if response.status_code != 200:
@@ -26,14 +26,13 @@ import json
 import logging
 from typing import Dict
 
-import requests
-from bs4 import BeautifulSoup
 
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
-from argostime.crawler.crawl_utils import CrawlResult, register_crawler
+from argostime.crawler.crawl_utils import CrawlResult, parse_html, register_crawler
 from argostime.crawler.crawl_utils import parse_promotional_message
+from argostime.crawler.fetch import fetch
 
 
 @register_crawler("Etos", "etos.nl")
@@ -56,13 +55,13 @@ def crawl_etos(url: str) -> CrawlResult:
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:96.0) Gecko/20100101 Firefox/96.0"
     }
 
-    response = requests.get(url, timeout=10, headers=headers)
+    response = fetch(url, timeout=10, headers=headers)
 
     if response.status_code != 200:
         logging.error("Got status code %d while getting url %s", response.status_code, url)
         raise PageNotFoundException(url)
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = parse_html(response.text, url)
 
     result: CrawlResult = CrawlResult(url=url)
 
@@ -25,45 +25,41 @@
 import codecs
 import json
 import logging
-import re
-from typing import Optional
 
 import requests
-from bs4 import BeautifulSoup
 
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
 from argostime.crawler.crawl_utils import CrawlResult, register_crawler
+from argostime.crawler.extract import PageExtractor
+from argostime.crawler.fetch import fetch
 
 
 @register_crawler("HEMA", "hema.nl")
 def crawl_hema(url: str) -> CrawlResult:
     """Crawler for hema.nl"""
 
-    response: requests.Response = requests.get(url, timeout=10)
+    extractor = PageExtractor(script_variables=("gtmDataObj",))
+    response: requests.Response = fetch(url, timeout=10, extractor=extractor)
 
     if response.status_code != 200:
         logging.error("Got status code %d while getting url %s", response.status_code, url)
         raise PageNotFoundException(url)
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    script_variables = extractor.data.script_variables
 
     result: CrawlResult = CrawlResult(url=url)
 
-    matches = soup.find_all("script")
-    pattern = re.compile(r"var gtmDataObj = JSON\.parse\(.+\);")
-
-    for match in matches:
-        re_result: Optional[re.Match] = pattern.search(match.text)
+    try:
+        raw_json = script_variables["gtmDataObj"]
+    except KeyError as exception:
+        logging.error("Could not find a product json via %s", url)
+        raise CrawlerException from exception
 
-        if re_result is not None:
-            raw_json = re_result.group(0)
-            logging.debug("Found raw product json %s", raw_json)
-            break
+    logging.debug("Found raw product json %s", raw_json)
 
-    raw_json = raw_json.replace("var gtmDataObj = JSON.parse('", "")
-    raw_json = raw_json.replace("');", "")
+    raw_json = raw_json.removeprefix("JSON.parse('").removesuffix("')")
 
     raw_json = codecs.decode(raw_json, "unicode-escape")
 
@@ -26,12 +26,12 @@ import logging
 import re
 
 import requests
-from bs4 import BeautifulSoup
 
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
-from argostime.crawler.crawl_utils import CrawlResult, register_crawler
+from argostime.crawler.crawl_utils import CrawlResult, parse_html, register_crawler
+from argostime.crawler.fetch import fetch
 
 
 @register_crawler("IKEA", "ikea.com")
@@ -40,13 +40,13 @@ def crawl_ikea(url: str) -> CrawlResult:  # pylint: disable=R0915
 
     result: CrawlResult = CrawlResult(url=url)
 
-    response: requests.Response = requests.get(url, timeout=10)
+    response: requests.Response = fetch(url, timeout=10)
 
     if response.status_code != 200:
         logging.error("Got status code %d while getting url %s", response.status_code, url)
         raise PageNotFoundException(url)
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = parse_html(response.text, url)
 
     info_wrapper = soup.find(
         "div",
@@ -30,13 +30,14 @@ from bs4 import BeautifulSoup
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
-from argostime.crawler.crawl_utils import CrawlResult, register_crawler
+from argostime.crawler.crawl_utils import CrawlResult, parse_html, register_crawler
+from argostime.crawler.fetch import fetch
 
 
 def crawl_intergamma(url: str) -> CrawlResult:
     """Crawler for gamma.nl and karwei.nl"""
 
-    response: requests.Response = requests.get(url, timeout=10)
+    response: requests.Response = fetch(url, timeout=10)
     if response.status_code != 200:
         logging.error("Got status code %s while getting url %s", response.status_code, url)
         raise PageNotFoundException(url)
@@ -44,7 +45,7 @@ def crawl_intergamma(url: str) -> CrawlResult:
     # Use UTF-8 encoding instead of ISO-8859-1
     response.encoding = 'UTF-8'
 
-    soup: BeautifulSoup = BeautifulSoup(response.text, "html.parser")
+    soup: BeautifulSoup = parse_html(response.text, url)
     result: CrawlResult = CrawlResult()
 
     try:
@@ -22,16 +22,15 @@
     along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
 """
 
-import json
 import logging
 
-import requests
-from bs4 import BeautifulSoup
 
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
 from argostime.crawler.crawl_utils import CrawlResult, register_crawler
+from argostime.crawler.extract import PageExtractor
+from argostime.crawler.fetch import fetch
 
 
 @register_crawler("Jumbo", "jumbo.com")
@@ -57,28 +56,26 @@ def crawl_jumbo(url: str) -> CrawlResult:
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:96.0) Gecko/20100101 Firefox/96.0"
     }
 
-    response = requests.get(url, timeout=10, headers=headers)
+    # Only download the page until the product JSON has been found
+    extractor = PageExtractor(json_ld=1, json_ld_attrs={"data-n-head": "ssr"})
+    response = fetch(url, timeout=10, headers=headers, extractor=extractor)
 
     if response.status_code != 200:
         logging.error("Got status code %d while getting url %s", response.status_code, url)
         raise PageNotFoundException(url)
 
-    soup = BeautifulSoup(response.text, "html.parser")
-    product_json = soup.find("script", attrs={"type": "application/ld+json", "data-n-head": "ssr"})
-    raw_json = product_json.string
-
     result: CrawlResult = CrawlResult(url=url)
 
     try:
-        product = json.loads(raw_json)
-    except json.decoder.JSONDecodeError as exception:
-        logging.error("Could not decode JSON %s, raising CrawlerException", raw_json)
+        product = extractor.data.json_ld[0]
+    except IndexError as exception:
+        logging.error("Could not find product JSON in %s, raising CrawlerException", url)
         raise CrawlerException from exception
 
     if product["offers"]["@type"] == "AggregateOffer":
         offer = product["offers"]
     else:
-        logging.error("No price info available in %s, raising CrawlerException", raw_json)
+        logging.error("No price info available in %s, raising CrawlerException", product)
         raise CrawlerException()
 
     try:
@@ -90,7 +87,7 @@ def crawl_jumbo(url: str) -> CrawlResult:
     try:
         result.product_name = str(product["name"])
     except KeyError as exception:
-        logging.error("No product name found in %s", raw_json)
+        logging.error("No product name found in %s", product)
         raise CrawlerException from exception
 
     try:
@@ -101,19 +98,19 @@ def crawl_jumbo(url: str) -> CrawlResult:
     try:
         result.product_code = str(product["sku"])
     except KeyError as exception:
-        logging.error("No product code found in %s", raw_json)
+        logging.error("No product code found in %s", product)
         raise CrawlerException from exception
 
     try:
         result.discount_price = float(offer["lowPrice"])
         result.on_sale = True
     except KeyError:
-        logging.info("No discount / low price found in %s", raw_json)
+        logging.info("No discount / low price found in %s", product)
 
     try:
         result.normal_price = float(offer["highPrice"])
     except KeyError as exception:
-        logging.error("No normal price found in %s", raw_json)
+        logging.error("No normal price found in %s", product)
         raise CrawlerException from exception
 
     return result
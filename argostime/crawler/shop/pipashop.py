@@ -25,25 +25,24 @@
 import logging
 import re
 
-import requests
-from bs4 import BeautifulSoup
 
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
-from argostime.crawler.crawl_utils import CrawlResult, register_crawler
+from argostime.crawler.crawl_utils import CrawlResult, parse_html, register_crawler
+from argostime.crawler.fetch import fetch
 
 
 @register_crawler("Pipa Shop", "pipa-shop.nl")
 def crawl_pipashop(url: str) -> CrawlResult:
     """Crawler for pipa-shop.nl meme website."""
     result: CrawlResult = CrawlResult(url=url)
-    request = requests.get(url, timeout=10)
+    request = fetch(url, timeout=10)
 
     if request.status_code != 200:
         raise PageNotFoundException(url)
 
-    soup = BeautifulSoup(request.text, "html.parser")
+    soup = parse_html(request.text, url)
 
     try:
         price = re.sub(r"[^0-9.]", "", soup.select_one("div.product-price").text)
@@ -32,7 +32,8 @@ from bs4 import BeautifulSoup
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
-from argostime.crawler.crawl_utils import CrawlResult, register_crawler
+from argostime.crawler.crawl_utils import CrawlResult, parse_html, register_crawler
+from argostime.crawler.fetch import fetch
 
 
 def __fix_bad_json(bad_json: str) -> str:
@@ -43,12 +44,12 @@ def __fix_bad_json(bad_json: str) -> str:
 def crawl_praxis(url: str) -> CrawlResult:
     """Crawler for praxis.nl"""
 
-    response: requests.Response = requests.get(url, timeout=10)
+    response: requests.Response = fetch(url, timeout=10)
     if response.status_code != 200:
         logging.error("Got status code %s while getting url %s", response.status_code, url)
         raise PageNotFoundException(url)
 
-    soup: BeautifulSoup = BeautifulSoup(response.text, "html.parser")
+    soup: BeautifulSoup = parse_html(response.text, url)
     result: CrawlResult = CrawlResult()
 
     try:
@@ -26,36 +26,39 @@ import locale
 import logging
 
 import requests
-from bs4 import BeautifulSoup
 
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
 from argostime.crawler.crawl_utils import CrawlResult, register_crawler
+from argostime.crawler.extract import PageExtractor
+from argostime.crawler.fetch import fetch
 
 
 @register_crawler("Simon Lévelt", "simonlevelt.nl")
 def crawl_simonlevelt(url: str) -> CrawlResult:
     """Crawler for simonlevelt.nl"""
 
-    response: requests.Response = requests.get(url, timeout=10)
+    # The meta tags are in the head of the page, no need to download the rest
+    extractor = PageExtractor(meta=("product:product_link", "og:title", "product:price"))
+    response: requests.Response = fetch(url, timeout=10, stop_at="</head>", extractor=extractor)
 
     if response.status_code != 200:
         logging.debug("Got status code %d while getting url %s", response.status_code, url)
         raise PageNotFoundException(url)
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    meta = extractor.data.meta
 
     result = CrawlResult()
 
     try:
-        result.url = soup.find("meta", property="product:product_link").get("content")
-    except Exception as exception:
-        logging.info("Couldn't find url in soup, using given instead %s", exception)
+        result.url = meta["product:product_link"]
+    except KeyError as exception:
+        logging.info("Couldn't find url in page, using given instead %s", exception)
         result.url = url
 
     try:
-        name = soup.find("meta", property="og:title").get("content")
+        name = meta["og:title"]
         result.product_name = name
         result.product_code = name.replace(" ", "_")
     except Exception as exception:
@@ -65,9 +68,7 @@ def crawl_simonlevelt(url: str) -> CrawlResult:
     locale.setlocale(locale.LC_NUMERIC, "nl_NL.UTF-8")
 
     try:
-        result.normal_price = locale.atof(
-            soup.find("meta", property="product:price").get("content")
-            )
+        result.normal_price = locale.atof(meta["product:price"])
     except Exception as exception:
         logging.error("Could not find a price %s", exception)
         raise CrawlerException from exception
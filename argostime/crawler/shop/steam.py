@@ -25,12 +25,12 @@
 import logging
 
 import requests
-from bs4 import BeautifulSoup
 
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 
-from argostime.crawler.crawl_utils import CrawlResult, register_crawler
+from argostime.crawler.crawl_utils import CrawlResult, parse_html, register_crawler
+from argostime.crawler.fetch import fetch
 
 
 @register_crawler("Steam", "store.steampowered.com", False)
@@ -39,13 +39,13 @@ def crawl_steam(url: str) -> CrawlResult:
 
     result: CrawlResult = CrawlResult(url=url)
 
-    response: requests.Response = requests.get(url, timeout=10)
+    response: requests.Response = fetch(url, timeout=10)
 
     if response.status_code != 200:
         logging.error("Got status code %d while getting url %s", response.status_code, url)
         raise PageNotFoundException(url)
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = parse_html(response.text, url)
 
     # Find all the divs with class 'game_area_purchase_game'
     game_infos = soup.find_all(
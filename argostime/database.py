@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+    database.py
+
+    Engine options, read replica routing and query metrics of the database.
+
+    The options of the connection pool and a statement timeout are set in the
+    [database] section of argostime.conf. If a replica_server is set there, the
+    queries of GET requests to the web app are sent to that read-only replica of
+    the MariaDB database, while crawls, added products and everything else use the
+    primary server. A request that writes anything keeps reading from the primary,
+    so it sees its own changes.
+
+    The replica is only used while it is at most max_replica_lag seconds behind the
+    primary. Its lag is checked every replica_check_interval seconds; while it lags
+    behind, or can't be reached, all queries go to the primary.
+
+    The number and the duration of the queries per bind (primary or replica) are
+    counted and shown by /metrics.
+
+    Without MariaDB, the SQLite database is tuned for one writer next to many
+    readers with the pragmas in SQLITE_PRAGMAS, which can be overridden in the
+    [sqlite] section.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from dataclasses import dataclass
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from flask import Flask, current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import Select
+
+from argostime.config import get_config
+
+__config = get_config()
+
+REPLICA_SERVER: Optional[str] = __config.get("database", "replica_server", fallback=None)
+MAX_REPLICA_LAG: float = __config.getfloat("database", "max_replica_lag", fallback=10)
+REPLICA_CHECK_INTERVAL: float = __config.getfloat(
+    "database", "replica_check_interval", fallback=5)
+STATEMENT_TIMEOUT: Optional[float] = __config.getfloat(
+    "database", "statement_timeout", fallback=None)
+
+REPLICA = "replica"
+READ_METHODS = ("GET", "HEAD")
+
+# Set on every connection to a SQLite database, see https://sqlite.org/pragma.html.
+# In WAL mode readers don't block the writer and the writer doesn't block readers,
+# and with synchronous=NORMAL a commit doesn't wait for the disk. Writers wait up to
+# busy_timeout milliseconds for each other instead of failing with "database is
+# locked".
+DEFAULT_SQLITE_PRAGMAS: Dict[str, str] = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": "10000",
+    "mmap_size": str(256 * 1024 * 1024),
+    # Negative sizes are in KiB
+    "cache_size": str(-64 * 1024),
+}
+SQLITE_PRAGMAS: Dict[str, str] = {
+    **DEFAULT_SQLITE_PRAGMAS, **(__config["sqlite"] if "sqlite" in __config else {})
+}
+
+
+def engine_options() -> Dict[str, Any]:
+    """Return the options for create_engine() configured in the [database] section."""
+    options: Dict[str, Any] = {}
+    for name, get in (("pool_size", __config.getint),
+                      ("max_overflow", __config.getint),
+                      ("pool_timeout", __config.getfloat),
+                      ("pool_recycle", __config.getint),
+                      ("pool_pre_ping", __config.getboolean)):
+        if __config.has_option("database", name):
+            options[name] = get("database", name)
+
+    if STATEMENT_TIMEOUT is not None and "mariadb" in __config:
+        options["connect_args"] = {
+            "init_command": f"SET SESSION max_statement_time={STATEMENT_TIMEOUT:g}"
+        }
+    elif STATEMENT_TIMEOUT is not None and "postgresql" in __config:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={STATEMENT_TIMEOUT * 1000:.0f}"
+        }
+    return options
+
+
+@dataclass
+class BindMetrics:
+    """Queries sent to one bind."""
+    queries: int = 0
+    seconds: float = 0
+
+
+_metrics_lock = threading.Lock()
+_bind_metrics: Dict[str, BindMetrics] = {}
+_replica_fallbacks: int = 0
+
+
+def _count_query(bind: str, seconds: float) -> None:
+    with _metrics_lock:
+        metrics = _bind_metrics.setdefault(bind, BindMetrics())
+        metrics.queries += 1
+        metrics.seconds += seconds
+
+
+def _instrument(engine: Engine, bind: str) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(_conn, _cursor, _statement, _parameters, context, _many):
+        context.argostime_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(_conn, _cursor, _statement, _parameters, context, _many):
+        _count_query(bind, time.perf_counter() - context.argostime_query_start)
+
+
+def use_sqlite_pragmas(engine: Engine, pragmas: Dict[str, str]) -> None:
+    """Set the pragmas on every new connection of a SQLite engine."""
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def replica_lag(engine: Engine) -> Optional[float]:
+    """Return how many seconds the replica is behind, or None if it doesn't replicate."""
+    if engine.dialect.name not in ("mysql", "mariadb"):
+        return 0
+
+    with engine.connect() as connection:
+        status = connection.exec_driver_sql("SHOW SLAVE STATUS").mappings().first()
+    if status is None or status["Seconds_Behind_Master"] is None:
+        return None
+    return float(status["Seconds_Behind_Master"])
+
+
+class _ReplicaHealth:
+    """Whether the replica may be used, checked at most every REPLICA_CHECK_INTERVAL."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked: float = -REPLICA_CHECK_INTERVAL
+        self.usable: bool = False
+
+    def is_usable(self, engine: Engine) -> bool:
+        """Return whether the replica is close enough behind the primary."""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.checked < REPLICA_CHECK_INTERVAL:
+                return self.usable
+            # Other threads use the previous result during the check
+            self.checked = now
+
+        try:
+            lag = replica_lag(engine)
+        except SQLAlchemyError as exception:
+            logging.warning("Could not check the lag of the replica: %s", exception)
+            lag = None
+
+        usable = lag is not None and lag <= MAX_REPLICA_LAG
+        if usable != self.usable:
+            logging.warning("%s the replica, its lag is %s seconds",
+                            "Using" if usable else "Not using", lag)
+        self.usable = usable
+        return usable
+
+
+_replica_health = _ReplicaHealth()
+
+
+class RoutingSession(Session):
+    """Session that sends the reads of GET requests to the replica, if it is usable."""
+
+    def _reads_from_replica(self, clause: Any) -> bool:
+        if not has_request_context() or REPLICA not in current_app.extensions:
+            return False
+        if request.method not in READ_METHODS or g.get("argostime_wrote", False):
+            return False
+
+        if self._flushing or (clause is not None and not isinstance(clause, Select)):
+            # Stay on the primary for the rest of the request, to read this write back
+            g.argostime_wrote = True
+            return False
+        if clause is None:
+            return False
+
+        if not _replica_health.is_usable(current_app.extensions[REPLICA]):
+            global _replica_fallbacks  # pylint: disable=W0603
+            with _metrics_lock:
+                _replica_fallbacks += 1
+            return False
+        return True
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return current_app.extensions[REPLICA]
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_primary() -> None:
+    """Send all queries of the current request to the primary, for requests that
+    check what exists before they write, like adding a product."""
+    if has_request_context():
+        g.argostime_wrote = True
+
+
+def replica_uri() -> Optional[str]:
+    """Return the URI of the replica, with the credentials of the primary."""
+    if REPLICA_SERVER is None or "mariadb" not in __config:
+        return None
+    return "mysql+pymysql://{user}:{password}@{server}/{database}?charset=utf8mb4".format(
+        user=__config["mariadb"]["user"],
+        password=__config["mariadb"]["password"],
+        server=REPLICA_SERVER,
+        database=__config["mariadb"]["database"]
+    )
+
+
+def init_app(app: Flask, engines: Dict[Optional[str], Engine],
+             replica: Optional[str] = None) -> None:
+    """Create the engine of the replica at the given URI, if any, count the queries
+    sent to every engine and tune SQLite databases."""
+    for key, engine in engines.items():
+        _instrument(engine, key or "primary")
+        if engine.dialect.name == "sqlite" and SQLITE_PRAGMAS:
+            use_sqlite_pragmas(engine, SQLITE_PRAGMAS)
+
+    if replica is not None:
+        app.extensions[REPLICA] = create_engine(replica, **engine_options())
+        _instrument(app.extensions[REPLICA], REPLICA)
+        logging.info("Reading from replica %s in GET requests", REPLICA_SERVER)
+
+
+def render_prometheus() -> str:
+    """Return the query metrics of this process in the Prometheus text exposition format."""
+    with _metrics_lock:
+        metrics = {bind: BindMetrics(m.queries, m.seconds) for bind, m in _bind_metrics.items()}
+        fallbacks = _replica_fallbacks
+
+    lines: List[str] = [
+        "# HELP argostime_db_queries_total Queries sent to the database by this process.",
+        "# TYPE argostime_db_queries_total counter",
+    ]
+    lines += [f'argostime_db_queries_total{{bind="{bind}"}} {m.queries}'
+              for bind, m in sorted(metrics.items())]
+    lines += [
+        "# HELP argostime_db_query_seconds_total Time spent on queries by this process.",
+        "# TYPE argostime_db_query_seconds_total counter",
+    ]
+    lines += [f'argostime_db_query_seconds_total{{bind="{bind}"}} {m.seconds}'
+              for bind, m in sorted(metrics.items())]
+    lines += [
+        "# HELP argostime_db_replica_fallbacks_total Reads sent to the primary because "
+        "the replica lagged behind.",
+        "# TYPE argostime_db_replica_fallbacks_total counter",
+        f"argostime_db_replica_fallbacks_total {fallbacks}",
+    ]
+    return "\n".join(lines) + "\n"
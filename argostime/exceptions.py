@@ -46,3 +46,27 @@ class NoEffectivePriceAvailableException(Exception):
 
 class CrawlerException(Exception):
     """Exception to throw if something goes wrong in the crawler."""
+
+class NotModifiedException(Exception):
+    """Exception to throw if a page did not change since it was last crawled."""
+
+    def __init__(self, url: str, bytes_saved: int):
+        self.url = url
+        self.bytes_saved = bytes_saved
+
+        logging.debug("NotModifiedException for %s", url)
+
+        super().__init__()
+
+class CircuitOpenException(CrawlerException):
+    """Exception to throw if a shop is not crawled because its circuit breaker is open."""
+
+    def __init__(self, url: str):
+        self.url = url
+
+        logging.debug("CircuitOpenException for %s", url)
+
+        super().__init__(url)
+
+class MigrationException(Exception):
+    """Exception to throw if a schema migration can't be applied."""
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+    log.py
+
+    Logging of argostime, configured in the [logging] and [log_levels] sections of
+    argostime.conf.
+
+    Log records are formatted in the thread that logs them, but written to the log
+    file by a background thread, so crawls and requests never wait for the disk.
+    Messages longer than max_message_length, such as dumps of product JSON, are
+    truncated.
+
+    The web app, the crawl scripts and their worker processes all append to the
+    same log file, so none of them rotates it: a process renaming the file would
+    make the others lose records. Rotate it with logrotate instead, the file is
+    opened again when it was moved.
+
+    The level of the messages of single modules can be set in [log_levels], by the
+    name of a module (ah, fetch) or of the logger of a library (urllib3).
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import queue
+from typing import Dict, List, Optional
+
+from argostime.config import get_config
+
+__config = get_config()
+
+LOG_FILE: str = __config.get("logging", "file", fallback="argostime.log")
+MAX_MESSAGE_LENGTH: int = __config.getint("logging", "max_message_length", fallback=2000)
+
+# Levels in the configuration that don't exist, logged once logging is configured
+_invalid_levels: List[str] = []
+
+
+def parse_level(name: str, level: str, fallback: Optional[int] = None) -> Optional[int]:
+    """Return the number of a level like "info" set for name in argostime.conf.
+
+    Returns fallback if there is no such level, which is logged as a warning.
+    """
+    number = logging.getLevelName(level.strip().upper())
+    if not isinstance(number, int):
+        _invalid_levels.append(f"{name} = {level}")
+        return fallback
+    return number
+
+
+LEVEL: int = parse_level(
+    "level", __config.get("logging", "level", fallback="DEBUG"), logging.DEBUG)
+MODULE_LEVELS: Dict[str, int] = {
+    module: number
+    for module, number in (
+        (module, parse_level(module, level))
+        for module, level in (__config["log_levels"].items() if "log_levels" in __config else ())
+    )
+    if number is not None
+}
+
+LOG_FORMAT = "%(asctime)s - %(processName)s - %(levelname)s - %(module)s - %(funcName)s - %(message)s"
+
+
+class ModuleLevelFilter(logging.Filter):
+    """Drop records below the level configured for the module that logged them.
+
+    Most of argostime logs with the root logger, so the level can't be set on a
+    logger. The record is dropped before its message is formatted.
+    """
+
+    def __init__(self, levels: Dict[str, int]):
+        super().__init__()
+        self.levels = levels
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.levels.get(record.module, logging.NOTSET)
+
+
+class TruncatingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that shortens long messages before they are queued."""
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_length: int):
+        super().__init__(log_queue)
+        self.max_length = max_length
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        if self.max_length and len(record.msg) > self.max_length:
+            record.msg = (f"{record.msg[:self.max_length]}... "
+                          f"({len(record.msg) - self.max_length} characters truncated)")
+            record.message = record.msg
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _start_listener(handler: TruncatingQueueHandler, file_handler: logging.Handler) -> None:
+    global _listener  # pylint: disable=W0603
+
+    _listener = logging.handlers.QueueListener(
+        handler.queue, file_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_listener_in_child(handler: TruncatingQueueHandler,
+                               file_handler: logging.Handler) -> None:
+    # The thread of the listener doesn't survive a fork, so the child starts its own
+    # listener on a new queue
+    handler.queue = queue.SimpleQueue()
+    _start_listener(handler, file_handler)
+
+
+def stop_logging() -> None:
+    """Write all queued log records to the log file and stop the background thread."""
+    global _listener  # pylint: disable=W0603
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging() -> None:
+    """Log to the log file in a background thread, as configured in argostime.conf."""
+    file_handler = logging.handlers.WatchedFileHandler(LOG_FILE, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    handler = TruncatingQueueHandler(queue.SimpleQueue(), MAX_MESSAGE_LENGTH)
+    handler.addFilter(ModuleLevelFilter(MODULE_LEVELS))
+
+    root = logging.getLogger()
+    root.setLevel(LEVEL)
+    root.addHandler(handler)
+
+    # Libraries log with their own loggers, for those the level can be set directly
+    for name, level in MODULE_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    _start_listener(handler, file_handler)
+    os.register_at_fork(
+        after_in_child=lambda: _restart_listener_in_child(handler, file_handler))
+    atexit.register(stop_logging)
+    # Processes of multiprocessing don't run atexit handlers, but they do run its
+    # finalizers. Finalizers registered before the fork are discarded, so register
+    # one in every new process.
+    multiprocessing.util.register_after_fork(
+        handler, lambda _: multiprocessing.util.Finalize(None, stop_logging, exitpriority=0))
+
+    for level in _invalid_levels:
+        logging.warning("Ignoring unknown log level %s in argostime.conf", level)
@@ -0,0 +1,616 @@
+#!/usr/bin/env python3
+"""
+    migrations.py
+
+    Versioned migrations of the database schema, applied with migrate.py.
+
+    Every migration has a version number and is applied once, in order of version.
+    The applied versions are stored in the SchemaMigration table. The operations
+    check the database before they change it, so databases that were changed by
+    hand or by the old migration scripts end up in the same state as new ones.
+
+    On MariaDB columns and indexes are added online with ALGORITHM=INPLACE,
+    LOCK=NONE, so the web app and the crawlers keep running during a migration.
+    SQLite can't change existing columns, so such a table is rebuilt: a new table
+    with the definition of the model is filled in batches of rows, each committed
+    on its own, while triggers copy the writes to the old table that happen in
+    between. Then the new table replaces the old one. Migration 1 creates the
+    tables of the first version, which the later migrations change to the current
+    models, so new and old databases go through the same steps.
+
+    On PostgreSQL the materialized views of queries.py are created as well.
+
+    check_indexes() explains the queries of routes.py and models.py to the database
+    and reports indexes that are missing or that none of these queries use.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import Index
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+from argostime import db
+from argostime.exceptions import MigrationException
+from argostime.models import CheapestOffer, CrawlBudget, CrawlHost, CrawlJob, Price, Product
+from argostime.models import Notification, ProductOffer, SchemaMigration, Watch, Webshop
+from argostime.queries import create_views
+
+DEFAULT_BATCH_SIZE: int = 10000
+
+# The tables as the first version of Argostimè created them. Later migrations
+# change them to the models, so this must not follow changes of the models.
+BASELINE = db.MetaData()
+
+db.Table(
+    "Webshop", BASELINE,
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("name", db.Unicode(512), unique=True, nullable=False),
+    db.Column("hostname", db.Unicode(512), unique=True, nullable=False),
+)
+
+db.Table(
+    "Product", BASELINE,
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("name", db.Unicode(512), nullable=False),
+    db.Column("description", db.Unicode(1024)),
+    db.Column("ean", db.Integer),
+    db.Column("product_code", db.Unicode(512), unique=True),
+)
+
+db.Table(
+    "ProductOffer", BASELINE,
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("product_id", db.Integer,
+              db.ForeignKey("Product.id", ondelete="CASCADE"), nullable=False),
+    db.Column("shop_id", db.Integer,
+              db.ForeignKey("Webshop.id", ondelete="CASCADE"), nullable=False),
+    db.Column("url", db.Unicode(1024), unique=True, nullable=False),
+    db.Column("time_added", db.DateTime),
+)
+
+db.Table(
+    "Price", BASELINE,
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("normal_price", db.Float),
+    db.Column("discount_price", db.Float),
+    db.Column("on_sale", db.Boolean),
+    db.Column("datetime", db.DateTime),
+    db.Column("product_offer_id", db.Integer,
+              db.ForeignKey("ProductOffer.id", ondelete="CASCADE"), nullable=False),
+)
+
+
+class SchemaOperations:
+    """Changes of the schema to the definitions of the models."""
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.dialect: str = db.engine.dialect.name
+        self.preparer = db.engine.dialect.identifier_preparer
+
+    @property
+    def online(self) -> bool:
+        """Whether the database can change tables while they are in use."""
+        return self.dialect in ("mysql", "mariadb")
+
+    def _compile(self, element: Any) -> str:
+        return str(element.compile(dialect=db.engine.dialect)).strip()
+
+    def _execute(self, statement: str) -> None:
+        logging.info("Executing %s", statement)
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql(statement)
+
+    def columns(self, table_name: str) -> Set[str]:
+        """Return the names of the columns of a table in the database."""
+        return {column["name"] for column in db.inspect(db.engine).get_columns(table_name)}
+
+    def indexes(self, table_name: str) -> Set[str]:
+        """Return the names of the indexes of a table in the database."""
+        return {index["name"] for index in db.inspect(db.engine).get_indexes(table_name)}
+
+    def add_column(self, table_name: str, column_name: str) -> bool:
+        """Add a column as defined on the model, return False if it already exists."""
+        if column_name in self.columns(table_name):
+            return False
+
+        column = db.metadata.tables[table_name].c[column_name]
+        statement = (f"ALTER TABLE {self.preparer.quote(table_name)} "
+                     f"ADD COLUMN {self._compile(CreateColumn(column))}")
+        if self.online:
+            statement += ", ALGORITHM=INPLACE, LOCK=NONE"
+        self._execute(statement)
+        return True
+
+    def create_index(self, index: Index) -> bool:
+        """Create an index declared on a model, return False if it already exists."""
+        if index.name in self.indexes(index.table.name):
+            return False
+
+        statement = self._compile(CreateIndex(index))
+        if self.online:
+            statement += " ALGORITHM=INPLACE LOCK=NONE"
+        self._execute(statement)
+        return True
+
+    def drop_index(self, table_name: str, index_name: str) -> None:
+        """Drop an index of a table."""
+        statement = f"DROP INDEX {self.preparer.quote(index_name)}"
+        if self.online:
+            statement += f" ON {self.preparer.quote(table_name)}"
+        self._execute(statement)
+
+    def create_missing_indexes(self) -> List[str]:
+        """Create all indexes declared on the models that don't exist yet.
+
+        Tables that don't exist yet get their indexes from the migration that
+        creates them.
+        """
+        existing: List[str] = db.inspect(db.engine).get_table_names()
+        return [
+            index.name
+            for table in db.metadata.sorted_tables
+            if table.name in existing
+            for index in sorted(table.indexes, key=lambda index: index.name)
+            if self.create_index(index)
+        ]
+
+    def alter_columns(self, table_name: str, column_names: List[str],
+                      online: bool = True) -> None:
+        """Change columns to their definition on the model.
+
+        On MariaDB the columns are changed in place if online is True, otherwise
+        the table is copied, which blocks writes to it. SQLite rebuilds the table.
+        """
+        if self.dialect == "sqlite":
+            self.rebuild_table(table_name)
+            return
+
+        table = db.metadata.tables[table_name]
+        if self.online:
+            changes = ", ".join(f"MODIFY COLUMN {self._compile(CreateColumn(table.c[name]))}"
+                                for name in column_names)
+            algorithm = "ALGORITHM=INPLACE, LOCK=NONE" if online else "ALGORITHM=COPY, LOCK=SHARED"
+            self._execute(f"ALTER TABLE {self.preparer.quote(table_name)} {changes}, {algorithm}")
+        else:
+            changes = ", ".join(
+                f"ALTER COLUMN {self.preparer.quote(name)} "
+                f"TYPE {self._compile(table.c[name].type)}"
+                for name in column_names
+            )
+            self._execute(f"ALTER TABLE {self.preparer.quote(table_name)} {changes}")
+
+    def _transaction(self, connection: Any, *statements: Any) -> None:
+        """Execute statements, SQL or SQL with parameters, in one write transaction
+        of a SQLite connection in autocommit mode."""
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            for statement in statements:
+                if isinstance(statement, tuple):
+                    connection.exec_driver_sql(*statement)
+                else:
+                    connection.exec_driver_sql(statement)
+            connection.exec_driver_sql("COMMIT")
+        except:
+            connection.exec_driver_sql("ROLLBACK")
+            raise
+
+    def _copy_batch(self, connection: Any, statement: str, start: int) -> None:
+        self._transaction(connection, (statement, (start, start + self.batch_size)))
+
+    def rebuild_table(self, table_name: str) -> None:
+        """Rebuild a table of a SQLite database with its definition on the model.
+
+        The rows are copied to a new table in batches of batch_size, each in its own
+        transaction, so other connections can write in between. Triggers on the old
+        table copy those writes to the new one. The last transaction replaces the old
+        table with the new one and creates its indexes. Columns that are not in the
+        database yet get their default value.
+        """
+        table = db.metadata.tables[table_name]
+        primary_key = list(table.primary_key.columns)
+        if len(primary_key) != 1 or not isinstance(primary_key[0].type, db.Integer):
+            raise MigrationException(f"Can't rebuild {table_name} without an integer primary key")
+
+        quote = self.preparer.quote
+        key = quote(primary_key[0].name)
+        old = quote(table_name)
+        new = quote(f"_new_{table_name}")
+        existing_columns = self.columns(table_name)
+        names = [column.name for column in table.columns if column.name in existing_columns]
+        columns = ", ".join(quote(name) for name in names)
+        values = ", ".join(f"NEW.{quote(name)}" for name in names)
+        create = self._compile(CreateTable(table)).replace(
+            f"CREATE TABLE {old}", f"CREATE TABLE {new}", 1)
+        triggers = [quote(f"_rebuild_{table_name}_{event}")
+                    for event in ("insert", "update", "delete")]
+        drop_triggers = [f"DROP TRIGGER IF EXISTS {trigger}" for trigger in triggers]
+
+        logging.info("Rebuilding table %s", table_name)
+        with db.engine.connect() as connection:
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            try:
+                self._transaction(
+                    connection,
+                    *drop_triggers,
+                    f"DROP TABLE IF EXISTS {new}",
+                    create,
+                    f"CREATE TRIGGER {triggers[0]} AFTER INSERT ON {old} BEGIN "
+                    f"INSERT OR REPLACE INTO {new} ({columns}) VALUES ({values}); END",
+                    f"CREATE TRIGGER {triggers[1]} AFTER UPDATE ON {old} BEGIN "
+                    f"DELETE FROM {new} WHERE {key} = OLD.{key}; "
+                    f"INSERT OR REPLACE INTO {new} ({columns}) VALUES ({values}); END",
+                    f"CREATE TRIGGER {triggers[2]} AFTER DELETE ON {old} BEGIN "
+                    f"DELETE FROM {new} WHERE {key} = OLD.{key}; END",
+                )
+
+                # Rows the triggers copied are newer than the old table was
+                copy = (f"INSERT OR IGNORE INTO {new} ({columns}) SELECT {columns} FROM {old} "
+                        f"WHERE {key} >= ? AND {key} < ?")
+                first, last = connection.exec_driver_sql(
+                    f"SELECT min({key}), max({key}) FROM {old}").one()
+                if first is not None:
+                    for start in range(first, last + 1, self.batch_size):
+                        self._copy_batch(connection, copy, start)
+                        logging.debug("Copied rows %d to %d of %d of %s",
+                                      start, min(start + self.batch_size, last + 1) - 1,
+                                      last, table_name)
+
+                self._swap_tables(connection, table, old, new, drop_triggers)
+            except:
+                self._transaction(connection, *drop_triggers, f"DROP TABLE IF EXISTS {new}")
+                raise
+
+    def _swap_tables(self, connection: Any, table: Any, old: str, new: str,
+                     drop_triggers: List[str]) -> None:
+        foreign_keys = connection.exec_driver_sql("PRAGMA foreign_keys").scalar()
+        # Dropping the old table would delete the rows referring to it otherwise,
+        # and this can't be changed inside a transaction
+        connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            for statement in drop_triggers:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(f"DROP TABLE {old}")
+            connection.exec_driver_sql(f"ALTER TABLE {new} RENAME TO {old}")
+            for index in table.indexes:
+                connection.exec_driver_sql(self._compile(CreateIndex(index)))
+
+            violations = connection.exec_driver_sql(f"PRAGMA foreign_key_check({old})").all()
+            if violations:
+                raise MigrationException(
+                    f"Rebuilding {table.name} violates foreign keys: {violations}")
+            connection.exec_driver_sql("COMMIT")
+        except:
+            connection.exec_driver_sql("ROLLBACK")
+            raise
+        finally:
+            connection.exec_driver_sql(f"PRAGMA foreign_keys={int(foreign_keys)}")
+
+
+@dataclass(frozen=True)
+class Migration:
+    """A change of the schema, and of the data that depends on it."""
+    version: int
+    name: str
+    apply: Callable[[SchemaOperations], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str) -> Callable:
+    """Register the decorated function as the migration with this version."""
+    def register(function: Callable[[SchemaOperations], None]) -> Callable:
+        MIGRATIONS.append(Migration(version, name, function))
+        return function
+    return register
+
+
+@migration(1, "Create the tables of the first version")
+def _create_tables(_operations: SchemaOperations) -> None:
+    BASELINE.create_all(db.engine, checkfirst=True)
+
+
+@migration(2, "Add the memoized prices and crawl schedule to ProductOffer")
+def _add_product_offer_columns(operations: SchemaOperations) -> None:
+    added: Dict[str, bool] = {
+        column: operations.add_column("ProductOffer", column)
+        for column in ("average_price", "minimum_price", "maximum_price",
+                       "next_crawl", "price_valid_until")
+    }
+
+    if added["average_price"] or added["minimum_price"] or added["maximum_price"]:
+        logging.info("Calculating the memoized prices of all offers")
+        for offer in db.session.scalars(db.select(ProductOffer)).all():
+            offer.update_memoized_values(commit=False)
+        db.session.commit()
+
+    if added["next_crawl"]:
+        logging.info("Planning the next crawl of every offer")
+        # The crawlers are only imported when needed
+        from argostime.products import schedule_all_offers
+        # The planned crawl budget is stored too, its table is added by migration 10
+        CrawlBudget.__table__.create(db.engine, checkfirst=True)
+        schedule_all_offers()
+
+
+@migration(3, "Create the indexes declared on the models")
+def _create_indexes(operations: SchemaOperations) -> None:
+    operations.create_missing_indexes()
+
+
+@migration(4, "Use a BRIN index on Price.datetime and create the views of PostgreSQL")
+def _create_postgresql_views(operations: SchemaOperations) -> None:
+    if operations.dialect != "postgresql":
+        return
+
+    with db.engine.connect() as connection:
+        method = connection.exec_driver_sql(
+            "SELECT am.amname FROM pg_class c JOIN pg_am am ON am.oid = c.relam "
+            "WHERE c.relname = 'idx_Price_datetime'").scalar()
+    if method not in (None, "brin"):
+        operations.drop_index("Price", "idx_Price_datetime")
+    operations.create_missing_indexes()
+
+    create_views()
+
+
+@migration(5, "Store EANs as BIGINT and index them")
+def _index_ean(operations: SchemaOperations) -> None:
+    # Changing the type copies the table on MariaDB, Product is small enough
+    operations.alter_columns("Product", ["ean"], online=False)
+    operations.create_missing_indexes()
+
+
+@migration(6, "Add the cheapest offer of every product")
+def _add_cheapest_offers(_operations: SchemaOperations) -> None:
+    CheapestOffer.__table__.create(db.engine, checkfirst=True)
+
+    logging.info("Finding the cheapest offer of every product")
+    for product in db.session.scalars(db.select(Product)).all():
+        product.update_cheapest_offer(commit=False)
+    db.session.commit()
+
+
+@migration(7, "Add watches and their notifications")
+def _add_watches(_operations: SchemaOperations) -> None:
+    Watch.__table__.create(db.engine, checkfirst=True)
+    Notification.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(8, "Drop the view of the latest prices of PostgreSQL")
+def _drop_latest_price_view(operations: SchemaOperations) -> None:
+    # Showed outdated prices until it was refreshed, DISTINCT ON is used instead
+    if operations.dialect == "postgresql":
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('DROP MATERIALIZED VIEW IF EXISTS "LatestPrice"')
+
+
+@migration(9, "Add the queue of the crawl workers")
+def _add_crawl_queue(_operations: SchemaOperations) -> None:
+    CrawlHost.__table__.create(db.engine, checkfirst=True)
+    CrawlJob.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(10, "Store the crawl budget for all crawl workers")
+def _add_crawl_budget(_operations: SchemaOperations) -> None:
+    CrawlBudget.__table__.create(db.engine, checkfirst=True)
+
+
+def applied_versions() -> Set[int]:
+    """Return the versions of all migrations that have been applied to the database."""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return set(db.session.scalars(db.select(SchemaMigration.version)).all())
+
+
+def pending_migrations() -> List[Migration]:
+    """Return the migrations that have not been applied yet, in order of version."""
+    applied = applied_versions()
+    return sorted((migration for migration in MIGRATIONS if migration.version not in applied),
+                  key=lambda migration: migration.version)
+
+
+def migrate(batch_size: int = DEFAULT_BATCH_SIZE) -> List[Migration]:
+    """Apply all pending migrations and return them."""
+    operations = SchemaOperations(batch_size)
+    pending = pending_migrations()
+    for pending_migration in pending:
+        logging.info("Applying migration %d: %s", pending_migration.version, pending_migration.name)
+        pending_migration.apply(operations)
+        db.session.add(SchemaMigration(
+            version=pending_migration.version,
+            name=pending_migration.name,
+            applied=datetime.now()
+        ))
+        db.session.commit()
+    return pending
+
+
+# The queries of routes.py, models.py, crawl_queue.py and alerts.py that should use an index
+QUERY_PATTERNS: Dict[str, Any] = {
+    "index: discounts of today":
+        db.select(Price).where(Price.datetime >= datetime(2000, 1, 1),
+                               Price.on_sale == True),  # pylint: disable=C0121
+    "product_page: product by code":
+        db.select(Product).where(Product.product_code == ""),
+    "product_page: offers of a product by code":
+        db.select(ProductOffer).join(Product).join(Webshop)
+            .where(Product.product_code == "").order_by(Webshop.name),
+    "add_product_offer_from_url: products by EAN":
+        db.select(Product).where(Product.ean == 0).order_by(Product.id),
+    "offer_price_json: offer by id":
+        db.select(ProductOffer).where(ProductOffer.id == 0),
+    "webshop_page: offers of a shop":
+        db.select(ProductOffer).where(ProductOffer.shop_id == 0)
+            .join(Product).order_by(Product.name),
+    "ProductOffer.get_current_price":
+        db.select(Price).where(Price.product_offer_id == 0)
+            .order_by(Price.datetime.desc()).limit(1),
+    "ProductOffer.get_prices_since":
+        db.select(Price).where(Price.product_offer_id == 0)
+            .where(Price.datetime >= datetime(2000, 1, 1)),
+    "cheapest: page sorted by savings":
+        db.select(CheapestOffer).join(CheapestOffer.product).join(CheapestOffer.product_offer)
+            .where(db.or_(CheapestOffer.savings < 0,
+                          db.and_(CheapestOffer.savings == 0, CheapestOffer.product_id < 0)))
+            .order_by(CheapestOffer.savings.desc(), CheapestOffer.product_id.desc()).limit(51),
+    "cheapest: page sorted by price":
+        db.select(CheapestOffer).join(CheapestOffer.product).join(CheapestOffer.product_offer)
+            .where(db.or_(CheapestOffer.price > 0,
+                          db.and_(CheapestOffer.price == 0, CheapestOffer.product_id > 0)))
+            .order_by(CheapestOffer.price, CheapestOffer.product_id).limit(51),
+    "check_watches: watches of an offer and its product":
+        db.select(Watch).where(db.or_(Watch.product_offer_id == 0, Watch.product_id == 0)),
+    "deliver_notifications: notifications to send":
+        db.select(Notification).where(Notification.sent.is_(None), Notification.id > 0)
+            .order_by(Notification.id).limit(100),
+    "enqueue_due_offers: offers due to be crawled":
+        db.select(ProductOffer).where(db.or_(ProductOffer.next_crawl.is_(None),
+                                             ProductOffer.next_crawl <= datetime(2000, 1, 1))),
+    "enqueue_due_offers: open crawl jobs":
+        db.select(CrawlJob.product_offer_id)
+            .where(CrawlJob.status.in_(("pending", "claimed", "storing", "deferred"))),
+    "metrics: crawl jobs per host and status":
+        db.select(CrawlJob.hostname, CrawlJob.status, db.func.count(CrawlJob.id))
+            .group_by(CrawlJob.hostname, CrawlJob.status),
+}
+
+# Tables with a few rows, which may be read completely
+SMALL_TABLES: Set[str] = {"Webshop", "CrawlHost"}
+
+_SQLITE_PLAN = re.compile(
+    r"^(?:SCAN|SEARCH) (\w+)(?: AS \w+)?"
+    r"(?: USING (?:COVERING )?INDEX (\w+)| USING (INTEGER PRIMARY KEY))?"
+)
+
+
+def _postgresql_plan(node: Dict[str, Any]) -> List[Tuple[str, Optional[str]]]:
+    plan: List[Tuple[str, Optional[str]]] = []
+    children: List[Dict[str, Any]] = node.get("Plans", [])
+    if node["Node Type"] == "Seq Scan":
+        plan.append((node["Relation Name"], None))
+    elif "Index Name" in node and "Relation Name" in node:
+        plan.append((node["Relation Name"], node["Index Name"]))
+    elif node["Node Type"] == "Bitmap Heap Scan":
+        # The indexes are read by the Bitmap Index Scans below it
+        plan.extend((node["Relation Name"], index) for index in _bitmap_indexes(node))
+        children = []
+
+    for child in children:
+        plan.extend(_postgresql_plan(child))
+    return plan
+
+
+def _bitmap_indexes(node: Dict[str, Any]) -> List[str]:
+    if "Index Name" in node:
+        return [node["Index Name"]]
+    return [index for child in node.get("Plans", []) for index in _bitmap_indexes(child)]
+
+
+def explain(statement: Any) -> List[Tuple[str, Optional[str]]]:
+    """Return the tables a statement reads, with the index used for each table, or
+    None if the table is read completely."""
+    compiled = statement.compile(dialect=db.engine.dialect,
+                                 compile_kwargs={"render_postcompile": True})
+    parameters: Any = dict(compiled.params)
+    if compiled.positional:
+        parameters = tuple(compiled.params[name] for name in compiled.positiontup or ())
+    dialect: str = db.engine.dialect.name
+
+    with db.engine.connect() as connection:
+        if dialect == "sqlite":
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", parameters)
+            plan = []
+            for row in rows:
+                match = _SQLITE_PLAN.match(row.detail)
+                if match:
+                    table, index, primary_key = match.groups()
+                    plan.append((table, index or primary_key))
+            return plan
+
+        if dialect == "postgresql":
+            # Small tables are always read completely otherwise
+            connection.exec_driver_sql("SET enable_seqscan = off")
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {compiled}", parameters).scalar()
+            return _postgresql_plan(plan[0]["Plan"])
+
+        rows = connection.exec_driver_sql(f"EXPLAIN {compiled}", parameters)
+        return [
+            (row._mapping["table"], None if row._mapping["type"] == "ALL" else row._mapping["key"])
+            for row in rows if row._mapping["table"] is not None
+        ]
+
+
+@dataclass
+class IndexReport:
+    """Indexes that are missing from the database or not used by any query."""
+    missing: List[str] = field(default_factory=list)
+    full_scans: List[str] = field(default_factory=list)
+    unused: List[str] = field(default_factory=list)
+
+    def ok(self) -> bool:
+        """Return whether no index is missing."""
+        return not self.missing and not self.full_scans
+
+
+def check_indexes() -> IndexReport:
+    """Compare the indexes in the database with the models and the query patterns.
+
+    The queries are only valid once all migrations have been applied.
+    """
+    report = IndexReport()
+    operations = SchemaOperations()
+
+    existing: Set[str] = set()
+    tables: List[Any] = []
+    for table in db.metadata.sorted_tables:
+        if not db.inspect(db.engine).has_table(table.name):
+            report.missing.append(f"{table.name} (table)")
+            continue
+        tables.append(table)
+        indexes = operations.indexes(table.name)
+        existing.update(indexes)
+        report.missing.extend(sorted(
+            f"{table.name}.{index.name}" for index in table.indexes if index.name not in indexes
+        ))
+
+    used: Set[str] = set()
+    for pattern, statement in QUERY_PATTERNS.items():
+        for table, index in explain(statement):
+            if index is None and table not in SMALL_TABLES:
+                report.full_scans.append(f"{pattern}: {table}")
+            elif index is not None:
+                used.add(index)
+
+    # Unique indexes enforce constraints, even if no query uses them
+    unique: Set[str] = {
+        index["name"]
+        for table in tables
+        for index in db.inspect(db.engine).get_indexes(table.name)
+        if index["unique"]
+    }
+    report.unused = sorted(existing - used - unique)
+    return report
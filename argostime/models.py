@@ -23,18 +23,52 @@
 """
 
 from datetime import datetime
+import itertools
 import logging
 import statistics
 from sys import maxsize
-from typing import List
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
 
-from argostime.crawler import crawl_url, CrawlResult
+from argostime.exceptions import CircuitOpenException
 from argostime.exceptions import CrawlerException, WebsiteNotImplementedException
 from argostime.exceptions import PageNotFoundException
 from argostime.exceptions import NoEffectivePriceAvailableException
+from argostime.scheduler import DAY, HISTORY, STALE_AFTER
+from argostime.scheduler import Observation, PriceHistory, budgeted_interval, respect_valid_until
 
 from argostime import db
 
+if TYPE_CHECKING:
+    # The web app doesn't crawl, so the crawlers are only imported when needed
+    from argostime.crawler import CrawlResult
+
+# Number of prices read at a time when summarizing price histories
+HISTORY_BATCH_SIZE: int = 1000
+
+
+def _format_loaded(model: db.Model, *attributes: str) -> str:
+    """Format the given attributes of model, as far as they are loaded.
+
+    Used by __str__ so that logging an object never queries the database, also not
+    for expired or detached objects. Attributes that are not loaded are shown as ?.
+    """
+    loaded = db.inspect(model).dict
+    values = ", ".join(f"{name}={loaded.get(name, '?')}" for name in attributes)
+    return f"{type(model).__name__}({values})"
+
+
+def get_effective_price_or_none(price: Optional["Price"],
+                                since: Optional[datetime] = None) -> Optional[float]:
+    """Return the effective price of price, or None if there is none or if price is
+    older than since."""
+    if price is None or (since is not None and price.datetime < since):
+        return None
+    try:
+        return price.get_effective_price()
+    except NoEffectivePriceAvailableException:
+        return None
+
+
 class Webshop(db.Model):  # type: ignore
     """A webshop, which may offer products."""
     __tablename__ = "Webshop"
@@ -46,7 +80,7 @@ class Webshop(db.Model):  # type: ignore
                                 lazy=True, cascade="all, delete", passive_deletes=True)
 
     def __str__(self) -> str:
-        return f"Webshop(id={self.id}, name={self.name}, hostname={self.hostname})"
+        return _format_loaded(self, "id", "name", "hostname")
 
 
 class Product(db.Model):  # type: ignore
@@ -55,15 +89,84 @@ class Product(db.Model):  # type: ignore
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.Unicode(512), nullable=False)
     description = db.Column(db.Unicode(1024))
-    ean = db.Column(db.Integer)
+    # EAN-13 numbers don't fit in 32 bits
+    ean = db.Column(db.BigInteger)
     product_code = db.Column(db.Unicode(512), unique=True)
     product_offers = db.relationship("ProductOffer",
                                         backref="product", lazy=True,
                                         cascade="all, delete", passive_deletes=True)
 
+    __table_args__ = (
+        # The same product in other shops
+        db.Index("idx_Product_ean", "ean"),
+    )
+
     def __str__(self) -> str:
-        return (f"Product(id={self.id}, name={self.name}, description={self.description},"
-                f"ean={self.ean}, product_code={self.product_code}, product_offers={self.product_offers})")
+        return _format_loaded(self, "id", "name", "description", "ean", "product_code")
+
+    def update_cheapest_offer(self, commit: bool = True) -> None:
+        """Compare the current prices of all offers of this product and store the
+        cheapest in its CheapestOffer.
+
+        Offers without a price since STALE_AFTER are left out.
+        """
+        # Imported here, the queries import the models
+        from argostime.queries import latest_prices  # pylint: disable=C0415
+
+        now = datetime.now()
+        current_prices: List[Tuple[float, int]] = []
+        for offer_id, price in latest_prices([offer.id for offer in self.product_offers]).items():
+            effective_price: Optional[float] = get_effective_price_or_none(price, now - STALE_AFTER)
+            if effective_price is not None:
+                current_prices.append((effective_price, offer_id))
+
+        cheapest: Optional[CheapestOffer] = db.session.get(CheapestOffer, self.id)
+        if not current_prices:
+            if cheapest is not None:
+                db.session.delete(cheapest)
+        else:
+            if cheapest is None:
+                cheapest = CheapestOffer(product_id=self.id)
+                db.session.add(cheapest)
+            cheapest.price, cheapest.product_offer_id = min(current_prices)
+            cheapest.maximum_price = max(price for price, _ in current_prices)
+            cheapest.savings = cheapest.maximum_price - cheapest.price
+            cheapest.offers = len(current_prices)
+            cheapest.updated = now
+
+        logging.debug("Updated the cheapest offer of %s", self)
+        if commit:
+            db.session.commit()
+
+    def add_to_cheapest_offer(self, offer: "ProductOffer", price: "Price",
+                              previous: Optional["Price"], commit: bool = True) -> None:
+        """Update the CheapestOffer of this product with price, the new price of offer,
+        which was previous before.
+
+        Only when the cheapest price or the most expensive price may have gone up or
+        down to a price of another offer, or when the offers were last compared a day
+        ago, all offers are compared again by update_cheapest_offer().
+        """
+        now = datetime.now()
+        cheapest: Optional[CheapestOffer] = db.session.get(CheapestOffer, self.id)
+        new_price: Optional[float] = get_effective_price_or_none(price, now - STALE_AFTER)
+        old_price: Optional[float] = get_effective_price_or_none(previous, now - STALE_AFTER)
+
+        if cheapest is None or new_price is None or cheapest.updated < now - DAY \
+                or (offer.id == cheapest.product_offer_id and new_price > cheapest.price) \
+                or (old_price == cheapest.maximum_price and new_price < old_price):
+            self.update_cheapest_offer(commit)
+            return
+
+        if old_price is None:
+            cheapest.offers += 1
+        if new_price < cheapest.price:
+            cheapest.price, cheapest.product_offer_id = new_price, offer.id
+        cheapest.maximum_price = max(cheapest.maximum_price, new_price)
+        cheapest.savings = cheapest.maximum_price - cheapest.price
+
+        if commit:
+            db.session.commit()
 
 
 class Price(db.Model):  # type: ignore
@@ -78,10 +181,18 @@ class Price(db.Model):  # type: ignore
                                     db.ForeignKey("ProductOffer.id", ondelete="CASCADE"),
                                     nullable=False)
 
+    __table_args__ = (
+        # Discounts of today on the home page, prices of the last days of all offers.
+        # Prices are added in order of time, so on PostgreSQL a small BRIN index of
+        # the time range of every block of rows will do.
+        db.Index("idx_Price_datetime", "datetime", postgresql_using="brin"),
+        # Current price and price history of an offer, also serves product_offer_id alone
+        db.Index("idx_Price_product_offer_id_datetime", "product_offer_id", "datetime"),
+    )
+
     def __str__(self) -> str:
-        return (f"Price(id={self.id}, normal_price={self.normal_price},"
-                f"discount_price={self.discount_price}, on_sale={self.on_sale}"
-                f"datetime={self.datetime}, product_offer_id={self.product_offer_id})")
+        return _format_loaded(self, "id", "normal_price", "discount_price", "on_sale",
+                              "datetime", "product_offer_id")
 
     def get_effective_price(self) -> float:
         """Return the discounted price if on sale, else the normal price."""
@@ -94,6 +205,42 @@ class Price(db.Model):  # type: ignore
                 raise NoEffectivePriceAvailableException
 
 
+# Price.get_effective_price() in SQL, NULL if there is no effective price
+effective_price = db.case(
+    (Price.on_sale == True, Price.discount_price), # pylint: disable=C0121
+    (Price.normal_price >= 0, Price.normal_price),
+    else_=None
+)
+
+
+def load_price_histories(
+    since: datetime,
+    now: datetime,
+    offer_id: Optional[int] = None
+    ) -> Iterator[Tuple[int, PriceHistory, datetime]]:
+    """Summarize the prices since since of every offer, or only of offer_id.
+
+    Yields the id, the PriceHistory and the time of the latest price of every offer
+    with a price since since. The rows are streamed in batches and only the prices
+    of one offer are kept at a time.
+    """
+    query = db.select(
+        Price.product_offer_id, Price.datetime, Price.on_sale,
+        effective_price.label("effective_price")
+    ).where(Price.datetime >= since)
+    if offer_id is not None:
+        query = query.where(Price.product_offer_id == offer_id)
+
+    rows = db.session.execute(query.order_by(Price.product_offer_id, Price.datetime),
+                              execution_options={"yield_per": HISTORY_BATCH_SIZE})
+    for product_offer_id, offer_rows in itertools.groupby(rows, key=lambda row: row[0]):
+        observations: List[Observation] = [
+            (row.datetime, bool(row.on_sale), row.effective_price) for row in offer_rows
+        ]
+        yield product_offer_id, PriceHistory.from_observations(observations, now), \
+            observations[-1][0]
+
+
 class ProductOffer(db.Model):  # type: ignore
     """An offer of a Webshop to sell a specific product."""
     __tablename__ = "ProductOffer"
@@ -107,14 +254,24 @@ class ProductOffer(db.Model):  # type: ignore
     average_price = db.Column(db.Float)
     minimum_price = db.Column(db.Float)
     maximum_price = db.Column(db.Float)
+    next_crawl = db.Column(db.DateTime)
+    # Time until which the shop guarantees the latest price, see CrawlResult.valid_until
+    price_valid_until = db.Column(db.DateTime)
     # TODO: Memoize current price with reference to the most recent Price entry
 
     prices = db.relationship("Price", backref="product_offer", lazy=True,
                                 cascade="all, delete", passive_deletes=True)
 
-    def __str__(self):
-        return (f"ProductOffer(id={self.id}, product_id={self.product_id},"
-                f"shop_id={self.shop_id}, url={self.url}, time_added={self.time_added})")
+    __table_args__ = (
+        # Offers of a product, offers of a shop
+        db.Index("idx_ProductOffer_product_id", "product_id"),
+        db.Index("idx_ProductOffer_shop_id", "shop_id"),
+        # Offers that are due to be crawled
+        db.Index("idx_ProductOffer_next_crawl", "next_crawl"),
+    )
+
+    def __str__(self) -> str:
+        return _format_loaded(self, "id", "product_id", "shop_id", "url", "time_added")
 
     def get_current_price(self) -> Price:
         """Get the latest Price object related to this offer."""
@@ -128,7 +285,7 @@ class ProductOffer(db.Model):  # type: ignore
 
         return price
 
-    def update_average_price(self) -> float:
+    def update_average_price(self, commit: bool = True) -> float:
         """Calculate the average price of this offer and update ProductOffer.average_price."""
         logging.debug("Updating average price for %s", self)
         effective_price_values: List[float] = []
@@ -147,12 +304,23 @@ class ProductOffer(db.Model):  # type: ignore
         try:
             avg: float = statistics.mean(effective_price_values)
             self.average_price = avg
-            db.session.commit()
+            if commit:
+                db.session.commit()
             return avg
         except statistics.StatisticsError:
             logging.debug("Called get_average_price for %s but no prices were found...", str(self))
             return -1
 
+    def get_previous_price(self, price: Price) -> Optional[Price]:
+        """Return the latest Price of this offer before price."""
+        return db.session.scalar(
+            db.select(Price)
+                .where(Price.product_offer_id == self.id)
+                .where(Price.datetime < price.datetime)
+                .order_by(Price.datetime.desc())
+                .limit(1)
+        )
+
     def get_average_price(self) -> float:
         """Stub for new .average_price attribute
 
@@ -192,12 +360,13 @@ class ProductOffer(db.Model):  # type: ignore
 
         return min_price
 
-    def update_minimum_price(self) -> None:
+    def update_minimum_price(self, commit: bool = True) -> None:
         """Update the minimum price ever in the minimum column"""
 
         min_price: float = self.get_lowest_price_since(self.time_added)
         self.minimum_price = min_price
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
     def get_lowest_price(self) -> float:
         """Return the lowest effective price of this offer.
@@ -223,12 +392,13 @@ class ProductOffer(db.Model):  # type: ignore
 
         return max_price
 
-    def update_maximum_price(self) -> None:
+    def update_maximum_price(self, commit: bool = True) -> None:
         """Update the maximum price ever in the maximum_price column"""
 
         max_price: float = self.get_highest_price_since(self.time_added)
         self.maximum_price = max_price
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
     def get_highest_price(self) -> float:
         """Return the highest effective price of this offer.
@@ -259,28 +429,120 @@ class ProductOffer(db.Model):  # type: ignore
         """Return the standard deviation of the effective price of this offer."""
         return self.get_price_standard_deviation_since(self.time_added)
 
-    def update_memoized_values(self) -> None:
+    def update_memoized_values(self, commit: bool = True) -> None:
         """Update all memoized columns"""
 
-        self.update_average_price()
-        self.update_minimum_price()
-        self.update_maximum_price()
+        self.update_average_price(commit)
+        self.update_minimum_price(commit)
+        self.update_maximum_price(commit)
+
+    def needs_update(self) -> bool:
+        """Return True if the planned time for the next crawl of this offer has come."""
+        return self.next_crawl is None or self.next_crawl <= datetime.now()
+
+    def get_price_history(self) -> PriceHistory:
+        """Return a summary of the recent price history, used to plan the next crawl."""
+        now = datetime.now()
+        for _, history, _ in load_price_histories(now - HISTORY, now, self.id):
+            return history
+        return PriceHistory()
+
+    def schedule_next_crawl(self, commit: bool = True) -> None:
+        """Plan the next crawl of this offer, based on its price history."""
+        now = datetime.now()
+        self.next_crawl = respect_valid_until(
+            now + budgeted_interval(self.get_price_history(), get_budget_factor()),
+            self.price_valid_until, now)
+        logging.debug("Next crawl of %s at %s", self, self.next_crawl)
+        if commit:
+            db.session.commit()
 
-    def crawl_new_price(self) -> None:
-        """Crawl the current price if we haven't already checked today."""
-        latest_price: Price = self.get_current_price()
+    def carry_price_forward(self, latest_price: Optional[Price],
+                            now: datetime) -> Optional[Price]:
+        """Return a copy of latest_price, the latest price of this offer, for today if
+        it is still guaranteed.
+
+        Offers with a guaranteed price are not crawled every day, this keeps their
+        price history as continuous as that of offers that are. Returns None if
+        there is no need for it. The new Price is not stored.
+        """
+        if self.price_valid_until is None or self.price_valid_until <= now:
+            return None
+        if latest_price is None or latest_price.datetime.date() >= now.date():
+            return None
+
+        return Price(
+            normal_price=latest_price.normal_price,
+            discount_price=latest_price.discount_price,
+            on_sale=latest_price.on_sale,
+            product_offer_id=self.id,
+            datetime=now
+        )
+
+    def price_from_crawl_result(self, parse_result: "CrawlResult") -> Price:
+        """Return a new Price of this offer for the price found by a crawler."""
+        on_sale: bool = False
+        if parse_result.discount_price > 0:
+            on_sale = True
 
-        if latest_price.datetime.date() >= datetime.now().date():
-            # Don't update if we already checked today.
+        return Price(
+            normal_price=parse_result.normal_price,
+            discount_price=parse_result.discount_price,
+            on_sale=on_sale,
+            product_offer_id=self.id,
+            datetime=datetime.now()
+        )
+
+    def update_after_crawl(self, price: Price, parse_result: "CrawlResult",
+                           commit: bool = True) -> None:
+        """Check the watches, update the memoized columns and the cheapest offer of the
+        product and plan the next crawl, once price, the price found by a crawler, has
+        been stored."""
+        # Imported here, the alerts import the models
+        from argostime.alerts import check_watches  # pylint: disable=C0415
+
+        self.price_valid_until = parse_result.valid_until
+        previous: Optional[Price] = self.get_previous_price(price)
+        # Before the new price is part of the minimum price
+        check_watches(self, price, previous)
+        self.update_memoized_values(commit)
+        self.product.add_to_cheapest_offer(self, price, previous, commit)
+        self.schedule_next_crawl(commit)
+
+    def add_crawl_result(self, parse_result: "CrawlResult", commit: bool = True) -> Price:
+        """Store the price found by a crawler and update the memoized columns.
+
+        With commit False nothing is committed, so the results of many crawls can
+        be stored in one transaction.
+        """
+        price: Price = self.price_from_crawl_result(parse_result)
+        db.session.add(price)
+        if commit:
+            db.session.commit()
+
+        self.update_after_crawl(price, parse_result, commit)
+
+        return price
+
+    def crawl_new_price(self) -> None:
+        """Crawl the current price if the planned time for the next crawl has come."""
+        if not self.needs_update():
+            # Don't update if the scheduler planned the next crawl for later.
             logging.info("No update needed for %s", str(self))
             return
 
+        from argostime.crawler import crawl_url  # pylint: disable=C0415
+
         try:
             parse_result: CrawlResult = crawl_url(self.url)
+        except CircuitOpenException:
+            logging.debug("Deferred %s, the circuit breaker of its shop is open", self)
+            return
         except PageNotFoundException:
             logging.error(
                 "Received a PageNotFoundException in %s, is"
                 "seems that the product is no longer available?", str(self))
+            return
         except CrawlerException as exception:
             logging.error(
                 "Received CrawlerException in %s, couldn't update price %s",
@@ -292,18 +554,170 @@ class ProductOffer(db.Model):  # type: ignore
             logging.error("Disabled website for existing product %s", self)
             raise WebsiteNotImplementedException(self.url) from exception
 
-        on_sale: bool = False
-        if parse_result.discount_price > 0:
-            on_sale = True
+        self.add_crawl_result(parse_result)
 
-        price: Price = Price(
-            normal_price=parse_result.normal_price,
-            discount_price=parse_result.discount_price,
-            on_sale=on_sale,
-            product_offer_id=self.id,
-            datetime=datetime.now()
-        )
-        db.session.add(price)
+
+class CheapestOffer(db.Model):  # type: ignore
+    """The offer with the lowest current price of a Product, and how much it saves
+    compared to the most expensive offer.
+
+    Updated by Product.add_to_cheapest_offer() whenever a price of one of the
+    offers of the product is stored, so /cheapest doesn't need the current price
+    of every offer.
+    """
+    __tablename__ = "CheapestOffer"
+    product_id = db.Column(db.Integer,
+                            db.ForeignKey("Product.id", ondelete="CASCADE"),
+                            primary_key=True, autoincrement=False)
+    product_offer_id = db.Column(db.Integer,
+                                    db.ForeignKey("ProductOffer.id", ondelete="CASCADE"),
+                                    nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    maximum_price = db.Column(db.Float, nullable=False)
+    savings = db.Column(db.Float, nullable=False)
+    # Offers of the product with a current price
+    offers = db.Column(db.Integer, nullable=False)
+    # Last time the prices of all offers were compared
+    updated = db.Column(db.DateTime, nullable=False)
+    product = db.relationship("Product", backref=db.backref(
+        "cheapest_offer", uselist=False, cascade="all, delete", passive_deletes=True))
+    product_offer = db.relationship("ProductOffer")
+
+    __table_args__ = (
+        # Pages of /cheapest, sorted by savings or by price
+        db.Index("idx_CheapestOffer_savings", "savings", "product_id"),
+        db.Index("idx_CheapestOffer_price", "price", "product_id"),
+    )
+
+    def __str__(self) -> str:
+        return _format_loaded(self, "product_id", "product_offer_id", "price",
+                              "maximum_price", "savings", "offers")
+
+
+class Watch(db.Model):  # type: ignore
+    """A subscription to a change of the price of an offer, or of any offer of a
+    product. See alerts.py for the kinds of watches."""
+    __tablename__ = "Watch"
+    id = db.Column(db.Integer, primary_key=True)
+    product_offer_id = db.Column(db.Integer,
+                                    db.ForeignKey("ProductOffer.id", ondelete="CASCADE"))
+    product_id = db.Column(db.Integer, db.ForeignKey("Product.id", ondelete="CASCADE"))
+    kind = db.Column(db.Unicode(16), nullable=False)
+    # Only for watches of the kind below
+    threshold = db.Column(db.Float)
+    # E-mail address, webhook or file label the notifications are sent to
+    contact = db.Column(db.Unicode(512), nullable=False)
+    created = db.Column(db.DateTime, nullable=False)
+    product_offer = db.relationship("ProductOffer", backref=db.backref(
+        "watches", lazy=True, cascade="all, delete", passive_deletes=True))
+    product = db.relationship("Product", backref=db.backref(
+        "watches", lazy=True, cascade="all, delete", passive_deletes=True))
+
+    __table_args__ = (
+        # The watches of an offer whose price was stored, and of its product
+        db.Index("idx_Watch_product_offer_id", "product_offer_id"),
+        db.Index("idx_Watch_product_id", "product_id"),
+    )
+
+    def __str__(self) -> str:
+        return _format_loaded(self, "id", "product_offer_id", "product_id", "kind",
+                              "threshold", "contact")
+
+
+class Notification(db.Model):  # type: ignore
+    """A triggered Watch, waiting to be sent with the other notifications of its
+    contact."""
+    __tablename__ = "Notification"
+    id = db.Column(db.Integer, primary_key=True)
+    watch_id = db.Column(db.Integer, db.ForeignKey("Watch.id", ondelete="CASCADE"),
+                            nullable=False)
+    product_offer_id = db.Column(db.Integer,
+                                    db.ForeignKey("ProductOffer.id", ondelete="CASCADE"),
+                                    nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    created = db.Column(db.DateTime, nullable=False)
+    sent = db.Column(db.DateTime)
+    watch = db.relationship("Watch", backref=db.backref(
+        "notifications", lazy=True, cascade="all, delete", passive_deletes=True))
+    product_offer = db.relationship("ProductOffer")
+
+    __table_args__ = (
+        # Notifications that have not been sent yet
+        db.Index("idx_Notification_sent", "sent"),
+    )
+
+    def __str__(self) -> str:
+        return _format_loaded(self, "id", "watch_id", "product_offer_id", "price",
+                              "created", "sent")
+
+
+class CrawlHost(db.Model):  # type: ignore
+    """Crawl limits of a host, shared by all crawl workers."""
+    __tablename__ = "CrawlHost"
+    id = db.Column(db.Integer, primary_key=True)
+    hostname = db.Column(db.Unicode(512), unique=True, nullable=False)
+    # Incremented on every claim, so concurrent claims for this host are detected
+    version = db.Column(db.Integer, nullable=False, default=0)
+    next_request = db.Column(db.DateTime, nullable=False)
+
+    def __str__(self) -> str:
+        return _format_loaded(self, "id", "hostname", "version", "next_request")
+
+
+class CrawlJob(db.Model):  # type: ignore
+    """A ProductOffer waiting to be crawled by one of the crawl workers."""
+    __tablename__ = "CrawlJob"
+    id = db.Column(db.Integer, primary_key=True)
+    product_offer_id = db.Column(db.Integer,
+                                    db.ForeignKey("ProductOffer.id", ondelete="CASCADE"),
+                                    unique=True, nullable=False)
+    hostname = db.Column(db.Unicode(512), nullable=False, index=True)
+    status = db.Column(db.Unicode(16), nullable=False, index=True)
+    not_before = db.Column(db.DateTime, nullable=False)
+    worker = db.Column(db.Unicode(256))
+    lease_expires = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    product_offer = db.relationship("ProductOffer")
+
+    def __str__(self) -> str:
+        return _format_loaded(self, "id", "product_offer_id", "hostname", "status", "worker",
+                              "lease_expires", "attempts")
+
+
+class CrawlBudget(db.Model):  # type: ignore
+    """The factor by which all crawl intervals are stretched to fit the daily budget.
+
+    Planned by schedule_all_offers() and used by every crawl worker, see scheduler.py.
+    """
+    __tablename__ = "CrawlBudget"
+    id = db.Column(db.Integer, primary_key=True)
+    factor = db.Column(db.Float, nullable=False)
+    planned = db.Column(db.DateTime, nullable=False)
+
+    def __str__(self) -> str:
+        return _format_loaded(self, "id", "factor", "planned")
+
+
+def get_budget_factor() -> float:
+    """Return the budget factor of the latest schedule, 1.0 if none has been made."""
+    factor: Optional[float] = db.session.scalar(
+        db.select(CrawlBudget.factor).where(CrawlBudget.id == 1))
+    return 1.0 if factor is None else factor
+
+
+def store_budget_factor(factor: float, commit: bool = True) -> None:
+    """Store the budget factor of a new schedule for all crawl workers."""
+    db.session.merge(CrawlBudget(id=1, factor=factor, planned=datetime.now()))
+    if commit:
         db.session.commit()
 
-        self.update_memoized_values()
+
+class SchemaMigration(db.Model):  # type: ignore
+    """A migration of the database schema that has been applied, see migrations.py."""
+    __tablename__ = "SchemaMigration"
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.Unicode(256), nullable=False)
+    applied = db.Column(db.DateTime, nullable=False)
+
+    def __str__(self) -> str:
+        return _format_loaded(self, "version", "name", "applied")
@@ -25,13 +25,21 @@
 
 from enum import Enum
 from datetime import datetime
-from typing import Tuple
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
 import urllib.parse
 
 from argostime import db
+from argostime.exceptions import CrawlerException, PageNotFoundException
 from argostime.exceptions import WebsiteNotImplementedException
-from argostime.models import Webshop, Price, Product, ProductOffer
-from argostime.crawler import crawl_url, CrawlResult, enabled_shops
+from argostime.models import CheapestOffer, Webshop, Product, ProductOffer, Price, Watch
+from argostime.models import load_price_histories, store_budget_factor
+from argostime.queries import insert_prices, latest_prices
+from argostime.scheduler import HISTORY, PriceHistory, budgeted_interval, plan_interval
+from argostime.scheduler import budget_factor, respect_valid_until
+from argostime.crawler import crawl_url, crawl_urls, CrawlResult, enabled_shops
+from argostime.crawler.pipeline import CrawlPipeline
 
 class ProductOfferAddResult(Enum):
     """Enum to indicate the result of add_product_offer"""
@@ -73,19 +81,32 @@ def add_product_offer_from_url(url: str) -> Tuple[ProductOfferAddResult, Product
 
     parse_results: CrawlResult = crawl_url(url)
 
-    # Check if this Product already exists, otherwise add it to the database
-    product: Product = db.session.scalar(
+    # Check if this Product already exists, also in another shop with the same EAN,
+    # otherwise add it to the database
+    product: Optional[Product] = db.session.scalar(
         db.select(Product)
             .where(Product.product_code == parse_results.product_code)
     )
+    if product is None and parse_results.ean is not None:
+        product = db.session.scalar(
+            db.select(Product)
+                .where(Product.ean == parse_results.ean)
+                .order_by(Product.id)
+        )
+        if product is not None:
+            logging.info("Matched %s to %s by EAN", url, product)
+
     if product is None:
         product = Product(
             name=parse_results.product_name,
             description=parse_results.product_description,
+            ean=parse_results.ean,
             product_code=parse_results.product_code
         )
         db.session.add(product)
         db.session.commit()
+    else:
+        product = match_ean(product, parse_results.ean)
 
     offer: ProductOffer = ProductOffer(
         product_id=product.id,
@@ -96,19 +117,206 @@ def add_product_offer_from_url(url: str) -> Tuple[ProductOfferAddResult, Product
     db.session.add(offer)
     db.session.commit()
 
-    on_sale: bool = False
-    if parse_results.discount_price > 0:
-        on_sale = True
+    offer.add_crawl_result(parse_results)
+
+    return (ProductOfferAddResult.ADDED, offer)
+
+
+def merge_products(products: List[Product]) -> Product:
+    """Merge products that are the same into the one that was added first.
+
+    The offers and watches of the other products are moved to that product, after
+    which the other products are deleted. Returns the remaining product.
+    """
+    products = sorted(products, key=lambda product: product.id)
+    product: Product = products[0]
+    others: List[int] = [other.id for other in products[1:]]
+    if not others:
+        return product
 
-    price: Price = Price(
-        normal_price=parse_results.normal_price,
-        discount_price=parse_results.discount_price,
-        on_sale=on_sale,
-        product_offer_id=offer.id,
-        datetime=datetime.now()
+    logging.info("Merging products %s into %s", others, product)
+    if not product.description:
+        product.description = next(
+            (other.description for other in products[1:] if other.description), None)
+    db.session.execute(
+        db.update(ProductOffer)
+            .where(ProductOffer.product_id.in_(others))
+            .values(product_id=product.id)
     )
-    db.session.add(price)
+    # Deleting the other products would delete their watches as well
+    db.session.execute(
+        db.update(Watch)
+            .where(Watch.product_id.in_(others))
+            .values(product_id=product.id)
+    )
+    db.session.execute(db.delete(CheapestOffer).where(CheapestOffer.product_id.in_(others)))
+    db.session.execute(db.delete(Product).where(Product.id.in_(others)))
     db.session.commit()
-    offer.update_memoized_values()
+    product.update_cheapest_offer()
+    return product
 
-    return (ProductOfferAddResult.ADDED, offer)
+
+def match_ean(product: Product, ean: Optional[int]) -> Product:
+    """Store the EAN of a product if it is new, merging the products with this EAN.
+
+    Returns the product that remains after merging, which may be another one.
+    """
+    if ean is None or product.ean == ean:
+        return product
+    if product.ean is not None:
+        logging.warning("Found EAN %d for %s, keeping its EAN", ean, product)
+        return product
+
+    product.ean = ean
+    db.session.commit()
+    return merge_products(db.session.scalars(
+        db.select(Product)
+            .where(Product.ean == ean)
+            .order_by(Product.id)
+    ).all())
+
+
+def backfill_eans(limit: Optional[int] = None, delay: float = 1) -> int:
+    """Crawl an offer of every product without EAN again, to store the EAN.
+
+    Products of different shops with the same EAN are merged. The price found by
+    the crawl is stored as well, so the crawl is not wasted. Waits delay seconds
+    after every crawl. Returns the number of products that got an EAN.
+    """
+    products: List[Product] = db.session.scalars(
+        db.select(Product)
+            .where(Product.ean.is_(None))
+            .order_by(Product.id)
+            .limit(limit)
+    ).all()
+    logging.info("Looking for the EAN of %d products", len(products))
+
+    found: int = 0
+    for product in products:
+        for offer in list(product.product_offers):
+            try:
+                result: CrawlResult = crawl_url(offer.url)
+            except (CrawlerException, PageNotFoundException,
+                    WebsiteNotImplementedException) as exception:
+                logging.info("Could not crawl %s for its EAN: %s", offer, exception)
+                continue
+            finally:
+                time.sleep(delay)
+
+            offer.add_crawl_result(result)
+            if result.ean is not None:
+                match_ean(product, result.ean)
+                found += 1
+                break
+
+    logging.info("Found the EAN of %d of %d products", found, len(products))
+    return found
+
+
+def update_offers_in_batch(offers: List[ProductOffer]) -> None:
+    """Crawl the offers using the batch crawlers of their shops and store the new prices."""
+    results: Dict[str, CrawlResult] = crawl_urls([offer.url for offer in offers])
+
+    for offer in offers:
+        if offer.url not in results:
+            logging.error("No price found for %s in batch crawl", offer)
+            continue
+        offer.add_crawl_result(results[offer.url])
+
+
+def store_crawl_results(results: List[Tuple[ProductOffer, CrawlResult]]) -> None:
+    """Store the prices found by the crawlers of many offers at once, without commit.
+
+    The prices are inserted together with insert_prices(), after which the
+    memoized columns and the next crawl of every offer are updated.
+    """
+    prices: List[Price] = [offer.price_from_crawl_result(result) for offer, result in results]
+    insert_prices(prices)
+    for (offer, result), price in zip(results, prices):
+        offer.update_after_crawl(price, result, commit=False)
+
+
+def update_offers_pipelined(offers: List[ProductOffer], pipeline: CrawlPipeline) -> None:
+    """Crawl the offers with a CrawlPipeline and store the new prices.
+
+    The prices are stored in batches, with one commit per batch.
+    """
+    offers_per_url: Dict[str, ProductOffer] = {offer.url: offer for offer in offers}
+
+    def persist(results: List[Tuple[str, CrawlResult]]) -> None:
+        store_crawl_results([(offers_per_url[url], result) for url, result in results])
+        db.session.commit()
+        logging.debug("Stored the prices of %d offers", len(results))
+
+    pipeline.run(list(offers_per_url), persist)
+
+
+def schedule_all_offers() -> None:
+    """Plan the next crawl of every offer, within the daily crawl budget.
+
+    Offers are crawled again an interval after their latest price, so offers that
+    became due early in the run don't have to wait for the next run.
+    """
+    now = datetime.now()
+    offers: List[ProductOffer] = db.session.scalars(db.select(ProductOffer)).all()
+    histories: Dict[int, PriceHistory] = {offer.id: PriceHistory() for offer in offers}
+    latest: Dict[int, datetime] = {}
+    for offer_id, history, latest_datetime in load_price_histories(now - HISTORY, now):
+        histories[offer_id] = history
+        latest[offer_id] = latest_datetime
+    factor = budget_factor(plan_interval(history) for history in histories.values())
+    store_budget_factor(factor, commit=False)
+
+    for offer in offers:
+        if offer.price_valid_until is not None:
+            if offer.price_valid_until > now and offer.next_crawl is not None:
+                # Planned when the guaranteed price was crawled, keep its re-check
+                continue
+            if offer.price_valid_until <= now:
+                # The guarantee ended, look at the new price right away
+                offer.next_crawl = offer.price_valid_until
+                continue
+
+        if offer.id not in latest:
+            offer.next_crawl = now
+            continue
+        offer.next_crawl = respect_valid_until(
+            latest[offer.id] + budgeted_interval(histories[offer.id], factor),
+            offer.price_valid_until,
+            now
+        )
+
+    db.session.commit()
+
+    due: int = len([offer for offer in offers if offer.next_crawl <= now])
+    logging.info("Scheduled %d offers, %d of them are due now", len(offers), due)
+
+
+def carry_valid_prices_forward() -> int:
+    """Store today's price of every offer that is skipped because its price is guaranteed.
+
+    The prices are inserted together and committed at once. Returns the number of
+    crawls saved this way.
+    """
+    now = datetime.now()
+    offers: List[ProductOffer] = db.session.scalars(
+        db.select(ProductOffer)
+            .where(ProductOffer.price_valid_until > now)
+            .where(ProductOffer.next_crawl > now)
+    ).all()
+    current_prices: Dict[int, Price] = latest_prices([offer.id for offer in offers])
+
+    carried: List[Tuple[ProductOffer, Price]] = []
+    for offer in offers:
+        price: Optional[Price] = offer.carry_price_forward(current_prices.get(offer.id), now)
+        if price is not None:
+            carried.append((offer, price))
+
+    insert_prices([price for _, price in carried])
+    for offer, _ in carried:
+        # The same price as before, so the minimum and maximum don't change
+        offer.update_average_price(commit=False)
+    db.session.commit()
+
+    logging.info("Saved %d crawls of offers with a guaranteed price", len(carried))
+    return len(carried)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+    profiling.py
+
+    Opt-in statistical profiling of web requests and crawls.
+
+    While a request or crawl is profiled, a thread samples the stack of the thread
+    handling it every few milliseconds. The samples are written as collapsed stacks,
+    one line per distinct stack with the number of samples, which flamegraph.pl,
+    speedscope and similar tools turn into flame graphs. At most max_files profiles
+    are kept in the directory, the oldest are removed.
+
+    Profiling is enabled for a fraction of all requests and crawls with enabled and
+    sample_rate in the [profiling] section of argostime.conf. If a secret is set, a
+    single request can be profiled by adding ?profile=<signature> to its URL, see
+    profile_signature(). When neither is configured no hooks are installed at all.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+import hashlib
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+from types import FrameType
+from typing import Iterator, List, Optional
+
+from flask import Flask, g, request
+
+from argostime.config import get_config
+
+__config = get_config()
+
+ENABLED: bool = __config.getboolean("profiling", "enabled", fallback=False)
+SAMPLE_RATE: float = __config.getfloat("profiling", "sample_rate", fallback=1.0)
+INTERVAL: float = __config.getfloat("profiling", "interval_ms", fallback=5) / 1000
+DIRECTORY: str = __config.get("profiling", "directory", fallback="profiles")
+MAX_FILES: int = __config.getint("profiling", "max_files", fallback=100)
+SECRET: str = __config.get("profiling", "secret", fallback="")
+
+# Frames above this depth are left out, to bound the size of deep recursive stacks
+MAX_DEPTH: int = 128
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread from another thread."""
+
+    def __init__(self, thread_id: int, interval: Optional[float] = None):
+        self.thread_id = thread_id
+        self.interval = interval or INTERVAL
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    @staticmethod
+    def _format_stack(frame: Optional[FrameType]) -> str:
+        names: List[str] = []
+        while frame is not None and len(names) < MAX_DEPTH:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                         f"{frame.f_lineno})".replace(";", ":"))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # pylint: disable=W0212
+            if frame is None:
+                return
+            self.stacks[self._format_stack(frame)] += 1
+
+    def start(self) -> None:
+        """Start sampling."""
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        """Stop sampling and return the number of samples per collapsed stack."""
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+def _remove_old_profiles() -> None:
+    profiles = sorted(
+        os.path.join(DIRECTORY, name) for name in os.listdir(DIRECTORY)
+        if name.endswith(".collapsed")
+    )
+    for path in profiles[:max(0, len(profiles) - MAX_FILES)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Removed by another process at the same time
+            pass
+
+
+def write_profile(kind: str, tag: str, stacks: Counter) -> Optional[str]:
+    """Write stacks to the profile directory and return the path of the file."""
+    if not stacks:
+        return None
+
+    os.makedirs(DIRECTORY, exist_ok=True)
+    safe_tag = re.sub(r"[^A-Za-z0-9_.-]", "_", tag)
+    path = os.path.join(
+        DIRECTORY,
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{kind}-{safe_tag}.collapsed"
+    )
+    with open(path, "w", encoding="utf-8") as file:
+        for stack, count in stacks.most_common():
+            file.write(f"{stack} {count}\n")
+
+    _remove_old_profiles()
+    logging.info("Wrote profile of %s %s with %d samples to %s",
+                 kind, tag, sum(stacks.values()), path)
+    return path
+
+
+def _sampled() -> bool:
+    return ENABLED and random.random() < SAMPLE_RATE
+
+
+@contextmanager
+def profile_crawl(shop: str) -> Iterator[None]:
+    """Profile the crawl in this block, if profiling is enabled and it is sampled."""
+    if not _sampled():
+        yield
+        return
+
+    profiler = SamplingProfiler(threading.get_ident())
+    profiler.start()
+    try:
+        yield
+    finally:
+        write_profile("crawl", shop, profiler.stop())
+
+
+def profile_signature(path: str) -> str:
+    """Return the value of the profile query parameter that profiles a request for path."""
+    return hmac.new(SECRET.encode(), path.encode(), hashlib.sha256).hexdigest()
+
+
+def _start_request_profile() -> None:
+    signature: Optional[str] = request.args.get("profile")
+    signed: bool = bool(SECRET) and signature is not None \
+        and hmac.compare_digest(signature, profile_signature(request.path))
+    if signed or _sampled():
+        g.profiler = SamplingProfiler(threading.get_ident())
+        g.profiler.start()
+
+
+def _stop_request_profile(_exception: Optional[BaseException]) -> None:
+    profiler: Optional[SamplingProfiler] = g.pop("profiler", None)
+    if profiler is not None:
+        write_profile("request", request.endpoint or "unknown", profiler.stop())
+
+
+def init_app(app: Flask) -> None:
+    """Install the hooks that profile requests, if profiling is configured."""
+    if not ENABLED and not SECRET:
+        return
+    app.before_request(_start_request_profile)
+    app.teardown_request(_stop_request_profile)
+    logging.info("Profiling requests to %s", DIRECTORY)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+    queries.py
+
+    Queries of which the fastest form depends on the database.
+
+    On PostgreSQL new prices are stored with COPY, which needs psycopg2, the latest
+    prices of offers are found with DISTINCT ON and the discounts of the home page
+    are read from a materialized view, which is refreshed with refresh_views() after
+    every crawl run. Discounts found since the last refresh only show up on the home
+    page after the next one. MariaDB and SQLite use portable queries that are
+    served by the indexes of the models.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import csv
+from datetime import datetime
+import io
+import logging
+from typing import Dict, List, Tuple
+
+from argostime import db
+from argostime.models import Price, Product, ProductOffer
+
+try:
+    from sqlalchemy.dialects.postgresql import distinct_on
+except ImportError:
+    # Before SQLAlchemy 2.1, DISTINCT ON is written with Select.distinct()
+    distinct_on = None
+
+# Columns of Price that are written by insert_prices()
+PRICE_COLUMNS = ("normal_price", "discount_price", "on_sale", "datetime", "product_offer_id")
+
+# Materialized views of PostgreSQL, with the column of their unique index, which
+# REFRESH MATERIALIZED VIEW CONCURRENTLY needs
+MATERIALIZED_VIEWS: Dict[str, Tuple[str, str]] = {
+    # Prices of yesterday and today are kept, so the view is still right on the
+    # morning before the next crawl run
+    "Deal": (
+        'SELECT "Price".id AS price_id, "Price".datetime, "Product".name AS product_name '
+        'FROM "Price" JOIN "ProductOffer" ON "ProductOffer".id = "Price".product_offer_id '
+        'JOIN "Product" ON "Product".id = "ProductOffer".product_id '
+        'WHERE "Price".on_sale AND "Price".datetime >= current_date - 1',
+        "price_id",
+    ),
+}
+
+# Not part of db.metadata, so db.create_all() doesn't create them as tables
+_views = db.MetaData()
+deal_view = db.Table(
+    "Deal", _views,
+    db.Column("price_id", db.Integer, primary_key=True),
+    db.Column("datetime", db.DateTime),
+    db.Column("product_name", db.Unicode(512)),
+)
+
+
+def is_postgresql() -> bool:
+    """Return whether the database is PostgreSQL."""
+    return db.engine.dialect.name == "postgresql"
+
+
+def create_views() -> None:
+    """Create the materialized views of PostgreSQL that don't exist yet."""
+    with db.engine.begin() as connection:
+        for name, (query, unique_column) in MATERIALIZED_VIEWS.items():
+            logging.info("Creating materialized view %s", name)
+            connection.exec_driver_sql(
+                f'CREATE MATERIALIZED VIEW IF NOT EXISTS "{name}" AS {query}')
+            connection.exec_driver_sql(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS "idx_{name}_{unique_column}" '
+                f'ON "{name}" ({unique_column})')
+
+
+def refresh_views() -> None:
+    """Refresh the materialized views with the prices of the last crawls, if any.
+
+    The views can still be read during the refresh.
+    """
+    if not is_postgresql():
+        return
+
+    with db.engine.begin() as connection:
+        for name in MATERIALIZED_VIEWS:
+            logging.debug("Refreshing materialized view %s", name)
+            connection.exec_driver_sql(f'REFRESH MATERIALIZED VIEW CONCURRENTLY "{name}"')
+
+
+def insert_prices(prices: List[Price]) -> None:
+    """Insert new prices in the transaction of the session, without loading them.
+
+    PostgreSQL receives them with COPY, the other databases with one executemany.
+    """
+    if not prices:
+        return
+
+    if not is_postgresql():
+        db.session.execute(db.insert(Price), [
+            {column: getattr(price, column) for column in PRICE_COLUMNS} for price in prices
+        ])
+        return
+
+    data = io.StringIO()
+    writer = csv.writer(data)
+    for price in prices:
+        # An empty field is NULL
+        writer.writerow(["" if value is None else value
+                         for value in (getattr(price, column) for column in PRICE_COLUMNS)])
+    data.seek(0)
+
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f'COPY "Price" ({", ".join(PRICE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)', data)
+    finally:
+        cursor.close()
+
+
+def latest_prices(offer_ids: List[int]) -> Dict[int, Price]:
+    """Return the latest Price of each of the offers that has one, by offer id.
+
+    The same as ProductOffer.get_current_price() for every offer, in one query.
+    """
+    if not offer_ids:
+        return {}
+
+    if is_postgresql():
+        statement = (
+            db.select(Price)
+                .where(Price.product_offer_id.in_(offer_ids))
+                .order_by(Price.product_offer_id, Price.datetime.desc())
+        )
+        if distinct_on is None:
+            statement = statement.distinct(Price.product_offer_id)
+        else:
+            statement = statement.ext(distinct_on(Price.product_offer_id))
+        return {price.product_offer_id: price for price in db.session.scalars(statement).all()}
+
+    latest = (
+        db.select(Price.product_offer_id, db.func.max(Price.datetime).label("datetime"))
+            .where(Price.product_offer_id.in_(offer_ids))
+            .group_by(Price.product_offer_id)
+            .subquery()
+    )
+    return {
+        price.product_offer_id: price for price in db.session.scalars(
+            db.select(Price).join(latest, db.and_(
+                Price.product_offer_id == latest.c.product_offer_id,
+                Price.datetime == latest.c.datetime
+            ))
+        ).all()
+    }
+
+
+def todays_discounts() -> List[Price]:
+    """Return the prices of today of the offers that are on sale, by product name."""
+    today = datetime.now().date()
+
+    if is_postgresql():
+        return db.session.scalars(
+            db.select(Price)
+                .join(deal_view, deal_view.c.price_id == Price.id)
+                .where(deal_view.c.datetime >= today)
+                .order_by(deal_view.c.product_name)
+        ).all()
+
+    return db.session.scalars(
+        db.select(Price)
+            .join(ProductOffer).join(Product)
+            .where(
+                Price.datetime >= today,
+                Price.on_sale == True # pylint: disable=C0121
+            )
+            .order_by(Product.name)
+    ).all()
@@ -22,25 +22,38 @@
     along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
 """
 
-from datetime import datetime
 import logging
-from typing import List, Dict
+from typing import Any, List, Dict, Tuple
 import urllib.parse
 
 from flask import current_app as app
 from flask import render_template, abort, request, redirect
 from flask import Response
 
-from argostime import db
+from argostime import database, db
+from argostime.crawl_metrics import load_summary, render_prometheus
 from argostime.exceptions import CrawlerException
 from argostime.exceptions import PageNotFoundException
 from argostime.exceptions import WebsiteNotImplementedException
 from argostime.graphs import generate_price_graph_data
-from argostime.models import Webshop, Product, ProductOffer, Price
-from argostime.products import ProductOfferAddResult, add_product_offer_from_url
+from argostime.models import CheapestOffer, CrawlJob, Webshop, Product, ProductOffer, Price
+from argostime.queries import latest_prices, todays_discounts
+
+CHEAPEST_PAGE_SIZE = 50
+# Columns by which /cheapest can be sorted, and whether the order is descending
+CHEAPEST_SORTS: Dict[str, Tuple[Any, bool]] = {
+    "savings": (CheapestOffer.savings, True),
+    "price": (CheapestOffer.price, False),
+}
 
 def add_product_url(url):
     """Helper function for adding a product"""
+    # Imported here, so the web workers only load the crawlers when a product is added
+    # pylint: disable=C0415
+    from argostime.products import ProductOfferAddResult, add_product_offer_from_url
+
+    # The replica may not have the shop or offer yet, which would be added twice
+    database.use_primary()
     try:
         res, offer = add_product_offer_from_url(url)
     except WebsiteNotImplementedException:
@@ -81,15 +94,7 @@ def index():
                 db.select(Product).order_by(Product.id.desc()).limit(5)
             ).all()
 
-        # TODO: Maybe join on productoffer & product?
-        discounts = db.session.scalars(
-                db.select(Price).where(
-                    Price.datetime >= datetime.now().date(),
-                    Price.on_sale == True # pylint: disable=C0121
-                )
-            ).all()
-
-        discounts.sort(key=lambda x: x.product_offer.product.name)
+        discounts: List[Price] = todays_discounts()
         shops = db.session.scalars(
             db.select(Webshop)
                 .order_by(Webshop.name)
@@ -105,26 +110,38 @@ def index():
 def product_page(product_code):
     """Show the page for a specific product, with all known product offers"""
 
-    product: Product = db.session.scalars(
-        db.select(Product)
+    # The offers of all shops, with their product and shop, in one query. Products
+    # with the same EAN have been merged, so these are all offers of the product.
+    offers: List[ProductOffer] = db.session.scalars(
+        db.select(ProductOffer)
+            .join(ProductOffer.product).join(ProductOffer.webshop)
             .where(Product.product_code == product_code)
-    ).first()
+            .options(db.contains_eager(ProductOffer.product),
+                     db.contains_eager(ProductOffer.webshop))
+            .order_by(Webshop.name)
+    ).all()
+
+    if offers:
+        product: Product = offers[0].product
+    else:
+        product = db.session.scalars(
+            db.select(Product)
+                .where(Product.product_code == product_code)
+        ).first()
 
     logging.debug("Rendering product page for %s based on product code %s", product, product_code)
 
     if product is None:
         abort(404)
 
-    offers: List[ProductOffer] = db.session.scalars(
-        db.select(ProductOffer)
-            .where(ProductOffer.product_id == product.id)
-            .join(Webshop).order_by(Webshop.name)
-    ).all()
+    prices: Dict[int, Price] = latest_prices([offer.id for offer in offers])
+    current_prices: Dict[ProductOffer, Price] = {offer: prices.get(offer.id) for offer in offers}
 
     return render_template(
         "product.html.jinja",
         p=product,
-        offers=offers)
+        offers=offers,
+        current_prices=current_prices)
 
 @app.route("/productoffer/<offer_id>/price_step_graph_data.json")
 def offer_price_json(offer_id):
@@ -154,9 +171,8 @@ def all_offers():
             .order_by(Product.name)
     ).all()
 
-    current_prices: Dict[ProductOffer, Price] = {}
-    for offer in offers:
-        current_prices[offer] = offer.get_current_price()
+    prices: Dict[int, Price] = latest_prices([offer.id for offer in offers])
+    current_prices: Dict[ProductOffer, Price] = {offer: prices.get(offer.id) for offer in offers}
 
     return render_template(
         "all_offers.html.jinja",
@@ -187,9 +203,8 @@ def webshop_page(shop_id):
             .order_by(Product.name)
     ).all()
 
-    current_prices: Dict[ProductOffer, Price] = {}
-    for offer in offers:
-        current_prices[offer] = offer.get_current_price()
+    prices: Dict[int, Price] = latest_prices([offer.id for offer in offers])
+    current_prices: Dict[ProductOffer, Price] = {offer: prices.get(offer.id) for offer in offers}
 
     return render_template(
         "shop.html.jinja",
@@ -199,6 +214,62 @@ def webshop_page(shop_id):
         show_variance=show_variance
         )
 
+@app.route("/cheapest")
+def cheapest():
+    """Show the cheapest offer of every product, a page at a time.
+
+    The next page starts after the sort value and product id in the after argument,
+    so every page is read from the index, however far the listing is paged.
+    """
+    sort: str = request.args.get("sort", "savings")
+    if sort not in CHEAPEST_SORTS:
+        abort(404)
+    column, descending = CHEAPEST_SORTS[sort]
+
+    query = (
+        db.select(CheapestOffer)
+            .join(CheapestOffer.product)
+            .join(CheapestOffer.product_offer).join(ProductOffer.webshop)
+            .options(db.contains_eager(CheapestOffer.product),
+                     db.contains_eager(CheapestOffer.product_offer)
+                        .contains_eager(ProductOffer.webshop))
+    )
+    if descending:
+        query = query.order_by(column.desc(), CheapestOffer.product_id.desc())
+    else:
+        query = query.order_by(column, CheapestOffer.product_id)
+
+    after = request.args.get("after")
+    if after is not None:
+        try:
+            after_value, after_id = after.split(":")
+            value: float = float(after_value)
+            product_id: int = int(after_id)
+        except ValueError:
+            abort(404)
+        if descending:
+            query = query.where(db.or_(column < value, db.and_(
+                column == value, CheapestOffer.product_id < product_id)))
+        else:
+            query = query.where(db.or_(column > value, db.and_(
+                column == value, CheapestOffer.product_id > product_id)))
+
+    # One more than a page, to know if there is a next page
+    offers: List[CheapestOffer] = db.session.scalars(
+        query.limit(CHEAPEST_PAGE_SIZE + 1)).all()
+    next_page = None
+    if len(offers) > CHEAPEST_PAGE_SIZE:
+        offers = offers[:CHEAPEST_PAGE_SIZE]
+        last: CheapestOffer = offers[-1]
+        next_page = f"{getattr(last, sort)!r}:{last.product_id}"
+
+    return render_template(
+        "cheapest.html.jinja",
+        offers=offers,
+        sort=sort,
+        next_page=next_page
+        )
+
 @app.route("/add_url", methods=['GET'])
 def add_url():
     """GET request to allow users to add a URL using a booklet"""
@@ -208,6 +279,21 @@ def add_url():
         abort(404)
     return add_product_url(url)
 
+@app.route("/metrics")
+def metrics():
+    """Show the crawl metrics of the latest update run, the crawl queue and the
+    database queries of this process in the Prometheus text format"""
+    queue_depth: Dict[Tuple[str, str], int] = {
+        (hostname, status): count for hostname, status, count in db.session.execute(
+            db.select(CrawlJob.hostname, CrawlJob.status, db.func.count(CrawlJob.id))
+                .group_by(CrawlJob.hostname, CrawlJob.status)
+        ).all()
+    }
+    return Response(
+        render_prometheus(load_summary(), queue_depth) + database.render_prometheus(),
+        mimetype="text/plain; version=0.0.4"
+        )
+
 @app.errorhandler(404)
 def not_found(error):
     """Return the 404 page"""
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+    scheduler.py
+
+    Plan how often an offer is crawled, based on how its price behaved before.
+
+    Offers with a price that the shop guarantees until some time, like a sale with a
+    known end date, are not crawled again until then, apart from a safety re-check.
+    Offers whose price changes often, that go on sale regularly or whose price
+    changed recently are crawled more often, up to several times a day. Offers with
+    a price that never changes are crawled down to once a week. When the planned
+    crawls exceed the daily request budget, all intervals are stretched alike.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import logging
+import statistics
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from argostime.config import get_config
+from argostime.exceptions import NoEffectivePriceAvailableException
+
+__config = get_config()
+
+DAY = timedelta(days=1)
+DEFAULT_INTERVAL = DAY
+MIN_INTERVAL = timedelta(hours=__config.getfloat("scheduler", "min_interval_hours", fallback=4))
+MAX_INTERVAL = timedelta(hours=__config.getfloat("scheduler", "max_interval_hours", fallback=168))
+HISTORY = timedelta(days=__config.getfloat("scheduler", "history_days", fallback=180))
+# Offers without a price in this time are probably no longer sold
+STALE_AFTER = timedelta(days=__config.getfloat("scheduler", "stale_after_days", fallback=14))
+# Crawl offers with a price that is guaranteed for longer at least this often, 0 for never
+VALID_UNTIL_RECHECK = timedelta(
+    hours=__config.getfloat("scheduler", "valid_until_recheck_hours", fallback=72))
+# Maximum number of crawls per day over all offers, 0 for no limit
+DAILY_BUDGET: int = __config.getint("scheduler", "daily_budget", fallback=0)
+
+# Number of price changes we accept to expect between two crawls
+TARGET_CHANGES: float = 0.5
+# Relative price differences smaller than this are rounding, not a change
+CHANGE_THRESHOLD: float = 0.005
+
+# The datetime, whether it was on sale and the effective price of a price
+Observation = Tuple[datetime, bool, Optional[float]]
+
+
+@dataclass
+class PriceHistory:
+    """Summary of how the price of an offer behaved."""
+    observations: int = 0
+    days: float = 0
+    changes: int = 0
+    sales: int = 0
+    relative_stddev: float = 0
+    since_last_change: Optional[timedelta] = None
+
+    @classmethod
+    def from_prices(cls, prices: Iterable, now: Optional[datetime] = None) -> "PriceHistory":
+        """Summarize Price objects, which must be sorted by datetime."""
+        def observations() -> Iterator[Observation]:
+            for price in prices:
+                try:
+                    effective_price: Optional[float] = price.get_effective_price()
+                except NoEffectivePriceAvailableException:
+                    effective_price = None
+                yield price.datetime, bool(price.on_sale), effective_price
+
+        return cls.from_observations(observations(), now)
+
+    @classmethod
+    def from_observations(cls, observations: Iterable[Observation],
+                          now: Optional[datetime] = None) -> "PriceHistory":
+        """Summarize the (datetime, on_sale, effective price) of prices, which must be
+        sorted by datetime. The effective price is None if there was none."""
+        if now is None:
+            now = datetime.now()
+
+        history = cls()
+        effective_prices: List[float] = []
+        first: Optional[datetime] = None
+        last_change: Optional[datetime] = None
+        previous_price: Optional[float] = None
+        previous_on_sale: bool = False
+
+        for price_datetime, on_sale, effective_price in observations:
+            history.observations += 1
+            if first is None:
+                first = price_datetime
+
+            if on_sale and not previous_on_sale:
+                history.sales += 1
+            previous_on_sale = on_sale
+
+            if effective_price is None:
+                continue
+            effective_prices.append(effective_price)
+
+            if previous_price is not None and abs(effective_price - previous_price) \
+                    > CHANGE_THRESHOLD * max(abs(previous_price), 1):
+                history.changes += 1
+                last_change = price_datetime
+            previous_price = effective_price
+
+        if first is not None:
+            history.days = (now - first) / DAY
+        if last_change is not None:
+            history.since_last_change = now - last_change
+        if len(effective_prices) > 1 and statistics.mean(effective_prices) > 0:
+            history.relative_stddev = \
+                statistics.stdev(effective_prices) / statistics.mean(effective_prices)
+
+        return history
+
+
+def plan_interval(history: PriceHistory) -> timedelta:
+    """Return the time between two crawls of an offer with this history.
+
+    The budget is not taken into account, see budgeted_interval().
+    """
+    if history.observations < 2:
+        return DEFAULT_INTERVAL
+
+    # Price changes and the start of sales per day, counting half an event so
+    # offers without any changes still get a finite interval.
+    events_per_day = (history.changes + history.sales + 0.5) / max(history.days, 1)
+    interval = DAY * (TARGET_CHANGES / events_per_day)
+
+    # Prices that vary a lot are worth looking at more often
+    interval /= 1 + 5 * history.relative_stddev
+
+    # A recent change may be followed by another, don't wait longer than it has been
+    if history.since_last_change is not None:
+        interval = min(interval, history.since_last_change)
+
+    return max(MIN_INTERVAL, min(MAX_INTERVAL, interval))
+
+
+def budget_factor(intervals: Iterable[timedelta]) -> float:
+    """Fit the planned intervals of all offers in the daily budget.
+
+    Returns the factor by which the intervals have to be stretched, which is stored
+    for all crawl workers and passed to budgeted_interval().
+    """
+    crawls_per_day: float = sum(DAY / interval for interval in intervals)
+    factor: float = 1.0
+    if DAILY_BUDGET > 0 and crawls_per_day > DAILY_BUDGET:
+        factor = crawls_per_day / DAILY_BUDGET
+
+    logging.info(
+        "Planned %.0f crawls per day, stretching all intervals by %.2f for a budget of %d",
+        crawls_per_day, factor, DAILY_BUDGET)
+    return factor
+
+
+def budgeted_interval(history: PriceHistory, factor: float = 1.0) -> timedelta:
+    """Return the time between two crawls of an offer, stretched by the budget factor."""
+    return plan_interval(history) * factor
+
+
+def respect_valid_until(
+    next_crawl: datetime,
+    valid_until: Optional[datetime],
+    now: Optional[datetime] = None
+    ) -> datetime:
+    """Postpone next_crawl until valid_until, the time the current price is guaranteed.
+
+    The offer is still re-checked VALID_UNTIL_RECHECK after now, in case the shop
+    ended the sale early. If the guarantee ends before next_crawl, the offer is
+    crawled when it ends instead.
+    """
+    if valid_until is None:
+        return next_crawl
+    if valid_until <= next_crawl:
+        return valid_until
+    if now is None:
+        now = datetime.now()
+    if VALID_UNTIL_RECHECK > timedelta(0):
+        valid_until = min(valid_until, now + VALID_UNTIL_RECHECK)
+    return max(next_crawl, valid_until)
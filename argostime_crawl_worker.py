@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+    argostime_crawl_worker.py
+
+    Standalone script to run a crawl worker, which claims jobs from the crawl queue
+    in the database. Any number of workers can run at the same time, on one or more
+    machines sharing the database.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import time
+
+from argostime.crawl_metrics import write_summary
+from argostime.crawl_queue import default_worker_name, enqueue_due_offers, run_worker
+from argostime.products import carry_valid_prices_forward, schedule_all_offers
+from argostime.queries import refresh_views
+from argostime.alerts import deliver_notifications
+from argostime.crawler.circuit_breaker import log_breaker_report
+from argostime.crawler.fetch import get_http_cache
+from argostime import create_app
+
+app = create_app()
+app.app_context().push()
+
+parser = argparse.ArgumentParser(description="Run a worker for the crawl queue.")
+parser.add_argument("--name", default=default_worker_name(),
+                    help="name of this worker, by default hostname:pid")
+parser.add_argument("--enqueue", action="store_true",
+                    help="first add jobs for all offers that are due, with --forever "
+                         "again every time the queue is empty")
+parser.add_argument("--forever", action="store_true",
+                    help="keep waiting for new jobs when the queue is empty")
+parser.add_argument("--poll", type=float, default=10,
+                    help="seconds to wait before looking for new jobs again")
+args = parser.parse_args()
+
+if args.enqueue:
+    schedule_all_offers()
+    carry_valid_prices_forward()
+    enqueue_due_offers()
+
+if args.forever and args.enqueue:
+    # Offers may become due several times a day, so keep adding them to the queue
+    while True:
+        run_worker(args.name, args.poll)
+        refresh_views()
+        deliver_notifications()
+        write_summary()
+        time.sleep(args.poll)
+        carry_valid_prices_forward()
+        enqueue_due_offers()
+else:
+    run_worker(args.name, args.poll, exit_when_empty=not args.forever)
+
+http_cache = get_http_cache()
+if http_cache is not None:
+    http_cache.log_statistics()
+refresh_views()
+deliver_notifications()
+log_breaker_report()
+write_summary()
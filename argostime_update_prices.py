@@ -25,8 +25,16 @@
 import random
 import logging
 import time
+from typing import Dict, List
 
+from argostime.crawl_metrics import write_summary
+from argostime.crawler import has_batch_crawler
+from argostime.crawler.circuit_breaker import defer_if_open, log_breaker_report
+from argostime.crawler.fetch import get_http_cache
 from argostime.models import ProductOffer
+from argostime.products import carry_valid_prices_forward, schedule_all_offers, update_offers_in_batch
+from argostime.queries import refresh_views
+from argostime.alerts import deliver_notifications
 from argostime import create_app, db
 
 app = create_app()
@@ -36,19 +44,52 @@ initial_sleep_time: float = random.uniform(0, 600)
 logging.debug("Sleeping for %f seconds", initial_sleep_time)
 time.sleep(initial_sleep_time)
 
+schedule_all_offers()
+carry_valid_prices_forward()
+
 offers = db.session.scalars(
     db.select(ProductOffer)
 ).all()
 
-offer: ProductOffer
+offers_per_shop: Dict[int, List[ProductOffer]] = {}
 for offer in offers:
-    logging.info("Crawling %s", str(offer))
+    offers_per_shop.setdefault(offer.shop_id, []).append(offer)
+
+offer: ProductOffer
+for shop_id, shop_offers in offers_per_shop.items():
+    if has_batch_crawler(shop_offers[0].url):
+        due_offers = [offer for offer in shop_offers if offer.needs_update()]
+        logging.info("Crawling %d offers of shop %d in a batch", len(due_offers), shop_id)
+
+        try:
+            update_offers_in_batch(due_offers)
+        except Exception as exception:
+            logging.error("Received %s while updating prices of shop %d", exception, shop_id)
+        continue
+
+    for offer in shop_offers:
+        if not offer.needs_update():
+            continue
+
+        if defer_if_open(offer.url):
+            logging.debug("Deferred %s, the circuit breaker of its shop is open", offer)
+            continue
+
+        logging.info("Crawling %s", str(offer))
+
+        try:
+            offer.crawl_new_price()
+        except Exception as exception:
+            logging.error("Received %s while updating price of %s, continuing...", exception, offer)
 
-    try:
-        offer.crawl_new_price()
-    except Exception as exception:
-        logging.error("Received %s while updating price of %s, continuing...", exception, offer)
+        next_sleep_time: float = random.uniform(1, 180)
+        logging.debug("Sleeping for %f seconds", next_sleep_time)
+        time.sleep(next_sleep_time)
 
-    next_sleep_time: float = random.uniform(1, 180)
-    logging.debug("Sleeping for %f seconds", next_sleep_time)
-    time.sleep(next_sleep_time)
+http_cache = get_http_cache()
+if http_cache is not None:
+    http_cache.log_statistics()
+refresh_views()
+deliver_notifications()
+log_breaker_report()
+write_summary()
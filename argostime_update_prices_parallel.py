@@ -4,6 +4,10 @@
 
     Standalone script to update prices in the database.
 
+    Adds a crawl job for every offer that needs an update, then starts worker
+    processes that share the jobs of all shops until the queue is empty. More
+    workers can be started on other machines with argostime_crawl_worker.py.
+
     Copyright (c) 2022, 2023 Martijn <martijn [at] mrtijn.nl>
 
     This file is part of Argostimè.
@@ -22,50 +26,84 @@
     along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
 """
 
-import random
+import argparse
 import logging
-from multiprocessing import Process
-import time
-
-from argostime.models import ProductOffer, Webshop
+from multiprocessing import Process, Queue
+from typing import Optional
+
+from argostime.crawl_metrics import merge_summary, summary, write_summary
+from argostime.crawl_queue import default_worker_name, enqueue_due_offers, queue_status
+from argostime.crawl_queue import ResultWriter, run_worker
+from argostime.crawler.circuit_breaker import log_breaker_report
+from argostime.crawler.fetch import get_http_cache
+from argostime.models import Webshop
+from argostime.products import carry_valid_prices_forward, schedule_all_offers
+from argostime.queries import refresh_views
+from argostime.alerts import deliver_notifications
 from argostime import create_app, db
 
 app = create_app()
 app.app_context().push()
 
-def update_shop_offers(shop_id: int) -> None:
-    """Crawl all the offers of one shop"""
-
-    offers: list[ProductOffer] = db.session.scalars(
-        db.select(ProductOffer)
-            .where(ProductOffer.shop_id == shop_id)
-    ).all()
+def crawl_worker(summaries: Queue, writer: Optional[ResultWriter]) -> None:
+    """Run crawl jobs until the queue is empty, then send the crawl metrics to summaries"""
 
-    offer: ProductOffer
-    for offer in offers:
-        logging.info("Crawling %s", str(offer))
+    # Connections of the parent process can't be shared with this process
+    db.engine.dispose(close=False)
 
-        try:
-            offer.crawl_new_price()
-        except Exception as exception:
-            logging.error("Received %s while updating price of %s, continuing...", exception, offer)
+    try:
+        run_worker(default_worker_name(), writer=writer)
 
-        next_sleep_time: float = random.uniform(1, 180)
-        logging.debug("Sleeping for %f seconds", next_sleep_time)
-        time.sleep(next_sleep_time)
+        http_cache = get_http_cache()
+        if http_cache is not None:
+            http_cache.log_statistics()
+        log_breaker_report()
+    finally:
+        summaries.put(summary())
 
 if __name__ == "__main__":
 
-    shops: list[Webshop] = db.session.scalars(
-        db.select(Webshop)
-            .order_by(Webshop.id)
-    ).all()
-
-    for shop in shops:
-        shop_process: Process = Process(
-            target=update_shop_offers,
-            args=[shop.id],
-            name=f"ShopProcess({shop.id})")
-
-        logging.info("Starting process %s", shop_process)
-        shop_process.start()
+    parser = argparse.ArgumentParser(description="Update the prices of all offers.")
+    parser.add_argument("--workers", type=int,
+                        help="number of worker processes, by default one per webshop")
+    parser.add_argument("--serialize-writes", action=argparse.BooleanOptionalAction,
+                        help="store all prices from one writer in this process, "
+                             "by default only for SQLite")
+    args = parser.parse_args()
+
+    schedule_all_offers()
+    carry_valid_prices_forward()
+    enqueue_due_offers()
+
+    workers: int = args.workers or db.session.scalar(db.select(db.func.count(Webshop.id)))
+    serialize_writes: bool = args.serialize_writes
+    if serialize_writes is None:
+        serialize_writes = db.engine.dialect.name == "sqlite"
+    writer: Optional[ResultWriter] = ResultWriter() if serialize_writes else None
+
+    summaries: Queue = Queue()
+    processes: list[Process] = []
+    for i in range(workers):
+        worker_process: Process = Process(
+            target=crawl_worker, args=(summaries, writer), name=f"CrawlWorker({i})")
+
+        logging.info("Starting process %s", worker_process)
+        worker_process.start()
+        processes.append(worker_process)
+
+    # Started after forking, a forked process only gets a copy of the forking thread
+    if writer is not None:
+        writer.start()
+
+    # Read the metrics before joining, a process can't exit before its queue is read
+    for _ in processes:
+        merge_summary(summaries.get())
+    for worker_process in processes:
+        worker_process.join()
+    if writer is not None:
+        writer.stop()
+
+    logging.info("Crawl jobs per status: %s", queue_status())
+    refresh_views()
+    deliver_notifications()
+    write_summary()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+    argostime_update_prices_pipelined.py
+
+    Standalone script to update prices in the database with a pipeline: threads
+    download the pages, a process per CPU core parses them and the results are
+    stored in batches. After every request a shop is left alone for a random
+    delay between host_delay_min and host_delay_max seconds of the [queue] section
+    of argostime.conf, like the other update scripts do.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import logging
+from typing import List
+
+from argostime.crawl_metrics import write_summary
+from argostime.crawl_queue import HOST_DELAY_MAX, HOST_DELAY_MIN
+from argostime.crawler import has_batch_crawler
+from argostime.crawler.circuit_breaker import log_breaker_report
+from argostime.crawler.pipeline import CrawlPipeline
+from argostime.models import ProductOffer
+from argostime.products import carry_valid_prices_forward, schedule_all_offers
+from argostime.products import update_offers_in_batch, update_offers_pipelined
+from argostime.queries import refresh_views
+from argostime.alerts import deliver_notifications
+from argostime import create_app, db
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Update the prices of all offers in a pipeline.")
+    parser.add_argument("--fetch-workers", type=int, default=8,
+                        help="number of threads downloading pages")
+    parser.add_argument("--parse-workers", type=int,
+                        help="number of processes parsing pages, by default one per CPU core")
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="number of pages that may wait for the next stage")
+    parser.add_argument("--batch-size", type=int, default=50,
+                        help="number of prices stored per commit")
+    parser.add_argument("--host-delay-min", type=float, default=HOST_DELAY_MIN,
+                        help="minimum seconds between two requests to the same shop, "
+                             "host_delay_min in the [queue] section of argostime.conf")
+    parser.add_argument("--host-delay-max", type=float, default=HOST_DELAY_MAX,
+                        help="maximum seconds between two requests to the same shop, "
+                             "host_delay_max in the [queue] section of argostime.conf")
+    args = parser.parse_args()
+
+    app = create_app()
+    app.app_context().push()
+
+    schedule_all_offers()
+    carry_valid_prices_forward()
+
+    due_offers: List[ProductOffer] = [
+        offer for offer in db.session.scalars(db.select(ProductOffer)).all()
+        if offer.needs_update()
+    ]
+
+    batch_offers: List[ProductOffer] = [
+        offer for offer in due_offers if has_batch_crawler(offer.url)
+    ]
+    if batch_offers:
+        logging.info("Crawling %d offers with batch crawlers", len(batch_offers))
+        update_offers_in_batch(batch_offers)
+
+    pipeline = CrawlPipeline(
+        fetch_workers=args.fetch_workers,
+        parse_workers=args.parse_workers,
+        queue_size=args.queue_size,
+        batch_size=args.batch_size,
+        host_delay_min=args.host_delay_min,
+        host_delay_max=args.host_delay_max
+    )
+    update_offers_pipelined(
+        [offer for offer in due_offers if not has_batch_crawler(offer.url)], pipeline)
+
+    refresh_views()
+    deliver_notifications()
+    log_breaker_report()
+    write_summary()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+    backfill_ean.py
+
+    Standalone script to crawl the products without EAN again, to store their EAN.
+    Products of different shops with the same EAN are merged into one product.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+
+from argostime.products import backfill_eans
+from argostime.queries import refresh_views
+from argostime import create_app
+
+parser = argparse.ArgumentParser(description="Store the EAN of the products without EAN.")
+parser.add_argument("--limit", type=int,
+                    help="maximum number of products to crawl, by default all of them")
+parser.add_argument("--delay", type=float, default=1,
+                    help="seconds to wait after every crawl")
+args = parser.parse_args()
+
+app = create_app()
+app.app_context().push()
+
+found: int = backfill_eans(args.limit, args.delay)
+refresh_views()
+print(f"Found the EAN of {found} products")
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+    benchmark_crawlers.py
+
+    Standalone script to benchmark every registered crawler against the pages in a
+    corpus recorded with check_url.py --record.
+
+    For every shop the time to crawl a page, the memory retained and the peak memory
+    are measured. After that, crawl_url() and the ingestion of the results into an
+    in-memory database are run with several numbers of concurrent crawls, and with
+    --pipeline also the fetch, parse and persist pipeline. The results can be
+    written as JSON to compare runs, for example after a shop changed the layout of
+    its pages.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import gc
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+import urllib.parse
+
+from flask import Flask
+
+from argostime import db, get_current_commit
+from argostime.crawler import CrawlResult, crawl_url, enabled_shops
+from argostime.crawler.fetch import get_http_cache, session
+from argostime.crawler.pipeline import CrawlPipeline
+from argostime.crawler.replay import Corpus, RecordedResponse, ReplayAdapter
+from argostime.models import Product, ProductOffer, Webshop
+
+
+class InMemoryCorpus(Corpus):
+    """Corpus that is read from disk once, so disk access is not benchmarked."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.recordings: Dict[str, RecordedResponse] = {
+            recording.url: recording for recording in super().__iter__()
+        }
+
+    def load(self, url: str) -> Optional[RecordedResponse]:
+        return self.recordings.get(url)
+
+
+class LatencyReplayAdapter(ReplayAdapter):
+    """Replay adapter that waits a fixed time before answering, like a real server."""
+
+    def __init__(self, corpus: Corpus, latency: float):
+        super().__init__(corpus)
+        self.latency = latency
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        # pylint: disable=R0913
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return super().send(request, stream, timeout, verify, cert, proxies)
+
+
+def use_adapter(adapter: ReplayAdapter) -> None:
+    """Answer all requests of the crawlers with adapter."""
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def group_by_shop(urls: List[str]) -> Dict[str, List[str]]:
+    """Return the urls of registered shops, grouped by the name of the shop."""
+    urls_per_shop: Dict[str, List[str]] = {}
+    for url in urls:
+        hostname = urllib.parse.urlparse(url).netloc
+        if hostname in enabled_shops:
+            urls_per_shop.setdefault(enabled_shops[hostname]["hostname"], []).append(url)
+        else:
+            print(f"Skipping {url}, no crawler is registered for {hostname}")
+    return urls_per_shop
+
+
+def crawl(url: str) -> CrawlResult:
+    """Run the crawler registered for url, without the HTTP cache."""
+    result: CrawlResult = enabled_shops[urllib.parse.urlparse(url).netloc]["crawler"](url)
+    result.check()
+    return result
+
+
+def benchmark_shop(urls: List[str], repeat: int) -> Dict[str, Any]:
+    """Crawl the urls of one shop repeat times and return the timing and memory results."""
+    times: List[float] = []
+    failed: Dict[str, str] = {}
+
+    for url in urls:
+        try:
+            crawl(url)
+        except Exception as exception:  # pylint: disable=W0703
+            failed[url] = repr(exception)
+    working_urls = [url for url in urls if url not in failed]
+
+    for _ in range(repeat):
+        for url in working_urls:
+            start = time.perf_counter()
+            crawl(url)
+            times.append(time.perf_counter() - start)
+
+    gc.collect()
+    peak_memory = 0
+    retained_memory = 0
+    for url in working_urls:
+        tracemalloc.start()
+        result = crawl(url)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_memory = max(peak_memory, peak)
+        retained_memory = max(retained_memory, retained)
+        del result
+
+    return {
+        "pages": len(urls),
+        "failed": failed,
+        "median_ms": statistics.median(times) * 1000 if times else None,
+        "mean_ms": statistics.mean(times) * 1000 if times else None,
+        "max_ms": max(times) * 1000 if times else None,
+        "retained_memory_kb": retained_memory / 1024,
+        "peak_memory_kb": peak_memory / 1024,
+    }
+
+
+def create_benchmark_app() -> Flask:
+    """Return a flask app with an empty in-memory database."""
+    app = Flask("argostime")
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def get_offer(url: str, result: CrawlResult) -> ProductOffer:
+    """Return the offer for url in the benchmark database, add it if needed."""
+    offer: ProductOffer = db.session.scalar(
+        db.select(ProductOffer).where(ProductOffer.url == url))
+    if offer is not None:
+        return offer
+
+    shop_info = enabled_shops[urllib.parse.urlparse(url).netloc]
+    shop: Webshop = db.session.scalar(
+        db.select(Webshop).where(Webshop.hostname == shop_info["hostname"]))
+    if shop is None:
+        shop = Webshop(name=shop_info["name"], hostname=shop_info["hostname"])
+        db.session.add(shop)
+
+    product = Product(name=result.product_name or url, product_code=url)
+    db.session.add(product)
+    db.session.commit()
+
+    offer = ProductOffer(product_id=product.id, shop_id=shop.id, url=url,
+                         time_added=datetime.now())
+    db.session.add(offer)
+    db.session.commit()
+    return offer
+
+
+def benchmark_throughput(app: Flask, urls: List[str], workers: int, rounds: int) -> Dict[str, Any]:
+    """Crawl urls rounds times with workers threads and store every result.
+
+    The crawls run concurrently, the results are stored by the calling thread like
+    the update scripts do.
+    """
+    crawl_times: List[float] = []
+    ingest_time: float = 0
+    failed: int = 0
+
+    def timed_crawl(url: str) -> CrawlResult:
+        start = time.perf_counter()
+        result = crawl_url(url)
+        crawl_times.append(time.perf_counter() - start)
+        return result
+
+    with app.app_context():
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(timed_crawl, url): url for _ in range(rounds) for url in urls
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception:  # pylint: disable=W0703
+                    failed += 1
+                    continue
+                ingest_start = time.perf_counter()
+                get_offer(futures[future], result).add_crawl_result(result)
+                ingest_time += time.perf_counter() - ingest_start
+        total_time = time.perf_counter() - start
+
+    crawled = len(crawl_times)
+    return {
+        "workers": workers,
+        "crawls": crawled,
+        "failed": failed,
+        "seconds": total_time,
+        "crawls_per_second": crawled / total_time if total_time else None,
+        "median_crawl_ms": statistics.median(crawl_times) * 1000 if crawl_times else None,
+        "ingest_ms_per_price": ingest_time / crawled * 1000 if crawled else None,
+    }
+
+
+def benchmark_pipeline(app: Flask, urls: List[str], workers: int, rounds: int) -> Dict[str, Any]:
+    """Crawl urls rounds times with a CrawlPipeline of workers fetch threads."""
+    pipeline = CrawlPipeline(fetch_workers=workers, host_concurrency=workers)
+    stored: int = 0
+
+    def persist(results: List[Tuple[str, CrawlResult]]) -> None:
+        nonlocal stored
+        for url, result in results:
+            get_offer(url, result).add_crawl_result(result, commit=False)
+        db.session.commit()
+        stored += len(results)
+
+    with app.app_context():
+        start = time.perf_counter()
+        pipeline.run([url for _ in range(rounds) for url in urls], persist)
+        total_time = time.perf_counter() - start
+
+    return {
+        "workers": workers,
+        "parse_workers": pipeline.parse_workers,
+        "crawls": stored,
+        "failed": len(urls) * rounds - stored,
+        "seconds": total_time,
+        "crawls_per_second": stored / total_time if total_time else None,
+        "stages": {name: metrics.to_json() for name, metrics in pipeline.metrics.items()},
+    }
+
+
+def main() -> None:
+    """Run the benchmarks and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("corpus", nargs="?", default="tests/corpus",
+                        help="directory with the recorded responses")
+    parser.add_argument("--repeat", type=int, default=20, help="number of crawls per page")
+    parser.add_argument("--workers", default="1,4,16",
+                        help="comma separated numbers of concurrent crawls")
+    parser.add_argument("--rounds", type=int, default=10,
+                        help="number of times every page is crawled per concurrency level")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="simulated latency per request in ms")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="also measure the throughput of the fetch, parse and persist pipeline")
+    parser.add_argument("--json", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if get_http_cache() is not None:
+        print("Warning: the HTTP cache is enabled, crawl_url() results include cache hits")
+
+    corpus = InMemoryCorpus(args.corpus)
+    urls_per_shop = group_by_shop(corpus.page_urls())
+    use_adapter(LatencyReplayAdapter(corpus, 0))
+
+    results: Dict[str, Any] = {
+        "commit": get_current_commit(),
+        "python": platform.python_version(),
+        "time": datetime.now().isoformat(),
+        "corpus": args.corpus,
+        "latency_ms": args.latency,
+        "shops": {},
+        "throughput": [],
+        "pipeline": [],
+    }
+
+    print(f"{'shop':<25} {'pages':>5} {'median ms':>10} {'max ms':>8} "
+          f"{'retained KiB':>13} {'peak KiB':>9}")
+    for shop, urls in urls_per_shop.items():
+        result = results["shops"][shop] = benchmark_shop(urls, args.repeat)
+        if result["median_ms"] is None:
+            print(f"{shop:<25} {result['pages']:>5} {'failed':>10}")
+        else:
+            print(f"{shop:<25} {result['pages']:>5} {result['median_ms']:>10.2f} "
+                  f"{result['max_ms']:>8.2f} {result['retained_memory_kb']:>13.0f} "
+                  f"{result['peak_memory_kb']:>9.0f}")
+        for url, failure in result["failed"].items():
+            print(f"    {url} failed with {failure}")
+
+    use_adapter(LatencyReplayAdapter(corpus, args.latency / 1000))
+    app = create_benchmark_app()
+    urls = [url for shop_urls in urls_per_shop.values() for url in shop_urls]
+
+    print()
+    print(f"{'workers':>7} {'crawls':>7} {'failed':>7} {'crawls/s':>9} "
+          f"{'median ms':>10} {'ingest ms':>10}")
+    for workers in [int(workers) for workers in args.workers.split(",")]:
+        result = benchmark_throughput(app, urls, workers, args.rounds)
+        results["throughput"].append(result)
+        print(f"{result['workers']:>7} {result['crawls']:>7} {result['failed']:>7} "
+              f"{result['crawls_per_second'] or 0:>9.1f} {result['median_crawl_ms'] or 0:>10.2f} "
+              f"{result['ingest_ms_per_price'] or 0:>10.2f}")
+
+    if args.pipeline:
+        print()
+        print(f"{'workers':>7} {'crawls':>7} {'failed':>7} {'crawls/s':>9} "
+              f"{'fetch s':>8} {'parse s':>8} {'persist s':>10} {'blocked s':>10}")
+        for workers in [int(workers) for workers in args.workers.split(",")]:
+            result = benchmark_pipeline(app, urls, workers, args.rounds)
+            results["pipeline"].append(result)
+            stages = result["stages"]
+            print(f"{result['workers']:>7} {result['crawls']:>7} {result['failed']:>7} "
+                  f"{result['crawls_per_second'] or 0:>9.1f} "
+                  f"{stages['fetch']['busy_seconds']:>8.2f} "
+                  f"{stages['parse']['busy_seconds']:>8.2f} "
+                  f"{stages['persist']['busy_seconds']:>10.2f} "
+                  f"{stages['fetch']['blocked_seconds']:>10.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+    benchmark_imports.py
+
+    Standalone script to measure the startup time of the web app and the command
+    line tools, and which heavy packages they import.
+
+    Every entry point is started a number of times in a new Python process with
+    -X importtime. The wall time of the process, the total import time and the
+    cumulative import time of a few packages are reported, packages that were not
+    imported at all are shown as -. Finally the time saved by skipping the creation
+    of the tables and by the template bytecode cache is reported.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+COMPILE_TEMPLATES = "env = wsgi.app.jinja_env; [env.get_template(t) for t in env.list_templates()]"
+
+# Entry points, as arguments to the Python interpreter
+ENTRY_POINTS: Dict[str, List[str]] = {
+    "wsgi.py": ["-c", "import wsgi"],
+    "wsgi.py+schema": ["-c", "from argostime import create_app; create_app(create_schema=True)"],
+    "templates": ["-c", f"import wsgi; {COMPILE_TEMPLATES}"],
+    "templates-nocache": ["-c", f"import wsgi; wsgi.app.jinja_env.bytecode_cache = None; "
+                                f"{COMPILE_TEMPLATES}"],
+    "check_url.py": ["check_url.py", "--help"],
+    # Exits right after startup, because no offer is given
+    "manual_update.py": ["manual_update.py"],
+}
+
+# Pairs of entry points that only differ in one startup optimization
+GAINS: Dict[str, Tuple[str, str]] = {
+    "skip creating tables": ("wsgi.py+schema", "wsgi.py"),
+    "template bytecode cache": ("templates-nocache", "templates"),
+}
+
+# Packages of which the cumulative import time is reported
+PACKAGES = ("flask", "sqlalchemy", "requests", "bs4", "argostime.crawler")
+
+
+def parse_importtime(output: str) -> Dict[str, int]:
+    """Return the cumulative import time in microseconds per module from the output
+    of -X importtime, with the sum of the self times of all modules as "total"."""
+    times: Dict[str, int] = {"total": 0}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, module = line[len("import time:"):].split("|")
+        times["total"] += int(self_time)
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def benchmark_entry_point(arguments: List[str], repeat: int) -> Dict[str, Any]:
+    """Start a Python process with arguments repeat times, return the median times in ms."""
+    wall_times: List[float] = []
+    import_times: List[Dict[str, int]] = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", *arguments],
+            capture_output=True, text=True, check=False
+        )
+        wall_times.append(time.perf_counter() - start)
+        import_times.append(parse_importtime(process.stderr))
+
+    def median_ms(module: str) -> Optional[float]:
+        if module not in import_times[0]:
+            return None
+        return statistics.median(times.get(module, 0) for times in import_times) / 1000
+
+    return {
+        "wall_ms": statistics.median(wall_times) * 1000,
+        "import_ms": median_ms("total"),
+        "packages_ms": {package: median_ms(package) for package in PACKAGES},
+    }
+
+
+def main() -> None:
+    """Run the benchmarks and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of times every entry point is started")
+    parser.add_argument("--json", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {}
+    print(f"{'entry point':<16} {'wall ms':>8} {'import ms':>10} "
+          + " ".join(f"{package:>17}" for package in PACKAGES))
+    for name, arguments in ENTRY_POINTS.items():
+        result = results[name] = benchmark_entry_point(arguments, args.repeat)
+        packages = " ".join(
+            f"{'-' if ms is None else f'{ms:.1f}':>17}"
+            for ms in result["packages_ms"].values()
+        )
+        print(f"{name:<16} {result['wall_ms']:>8.1f} {result['import_ms']:>10.1f} {packages}")
+
+    print()
+    for gain, (before, after) in GAINS.items():
+        saved_ms = results[before]["wall_ms"] - results[after]["wall_ms"]
+        results[gain] = {"saved_ms": saved_ms}
+        print(f"{gain:<24} {saved_ms:>8.1f} ms "
+              f"({saved_ms / results[before]['wall_ms'] * 100:.0f}% of {before})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
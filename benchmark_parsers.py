@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+    benchmark_parsers.py
+
+    Standalone script to compare the parse time and peak memory usage of the HTML
+    parser backends on recorded product pages of each shop.
+
+    Recorded pages are read from a directory with one subdirectory per shop
+    hostname, containing the pages as .html files:
+
+        pages/ah.nl/product1.html
+        pages/jumbo.com/product2.html
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from typing import Dict, List
+
+from argostime.crawler.crawl_utils import PARSER_BACKENDS, parse_html, parser_available
+
+
+def load_pages(directory: str) -> Dict[str, List[str]]:
+    """Return the recorded pages in directory, grouped by shop hostname."""
+    pages: Dict[str, List[str]] = {}
+    for shop in sorted(os.listdir(directory)):
+        shop_directory = os.path.join(directory, shop)
+        if not os.path.isdir(shop_directory):
+            continue
+        for filename in sorted(os.listdir(shop_directory)):
+            if filename.endswith(".html"):
+                with open(os.path.join(shop_directory, filename), encoding="utf-8") as file:
+                    pages.setdefault(shop, []).append(file.read())
+    return pages
+
+
+def benchmark_backend(shop: str, pages: List[str], backend: str, repeat: int) -> Dict[str, float]:
+    """Parse all pages of a shop with backend and return the timing and memory results."""
+    url = f"https://{shop}/"
+    times: List[float] = []
+
+    for _ in range(repeat):
+        for page in pages:
+            start = time.perf_counter()
+            parse_html(page, url, backend)
+            times.append(time.perf_counter() - start)
+
+    gc.collect()
+    peak_memory = 0
+    for page in pages:
+        tracemalloc.start()
+        soup = parse_html(page, url, backend)
+        peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del soup
+
+    return {
+        "pages": len(pages),
+        "median_ms": statistics.median(times) * 1000,
+        "mean_ms": statistics.mean(times) * 1000,
+        "peak_memory_kb": peak_memory / 1024,
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results per shop and backend."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("directory", help="directory with recorded pages per shop")
+    parser.add_argument("--repeat", type=int, default=5, help="number of parses per page")
+    parser.add_argument("--json", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    backends = [backend for backend in PARSER_BACKENDS if parser_available(backend)]
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+    for shop, pages in load_pages(args.directory).items():
+        results[shop] = {}
+        for backend in backends:
+            results[shop][backend] = benchmark_backend(shop, pages, backend, args.repeat)
+
+    print(f"{'shop':<25} {'backend':<12} {'pages':>5} {'median ms':>10} {'peak KiB':>10}")
+    for shop, shop_results in results.items():
+        for backend, result in shop_results.items():
+            print(f"{shop:<25} {backend:<12} {result['pages']:>5} "
+                  f"{result['median_ms']:>10.2f} {result['peak_memory_kb']:>10.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
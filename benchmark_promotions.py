@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+    benchmark_promotions.py
+
+    Standalone script to benchmark the parser of promotional messages over a corpus
+    of messages found on product pages, and to report which messages are covered by
+    which rule of the grammar.
+
+    The corpus is a text file with one message per line, lines starting with # are
+    ignored. Every message is parsed with and without the cache, the messages no rule
+    matched are listed so the grammar can be extended.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from argostime.crawler.crawl_utils import PROMOTION_GRAMMAR, Promotion
+from argostime.crawler.crawl_utils import normalize_promotional_message, parse_promotion
+
+
+def load_messages(path: str) -> List[str]:
+    """Return the messages in the corpus file at path."""
+    with open(path, encoding="utf-8") as file:
+        return [
+            line.strip() for line in file
+            if line.strip() and not line.startswith("#")
+        ]
+
+
+def time_parser(
+    messages: List[str],
+    parser: Callable[[str], Optional[Promotion]],
+    repeat: int
+    ) -> float:
+    """Return the mean time in microseconds to normalize and parse one message."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            parser(normalize_promotional_message(message))
+    return (time.perf_counter() - start) / (repeat * len(messages)) * 1e6
+
+
+def coverage(messages: List[str]) -> Dict[str, Any]:
+    """Return the number of messages matched per rule and the unmatched messages."""
+    matched: Dict[str, int] = {kind: 0 for kind, _, _ in PROMOTION_GRAMMAR}
+    unmatched: List[str] = []
+    for message in messages:
+        promotion = parse_promotion(normalize_promotional_message(message))
+        if promotion is None:
+            unmatched.append(message)
+        else:
+            matched[promotion.kind] += 1
+
+    return {
+        "messages": len(messages),
+        "covered": (len(messages) - len(unmatched)) / len(messages) if messages else None,
+        "per_rule": matched,
+        "unmatched": unmatched,
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("corpus", nargs="?", default="tests/corpus/promotions.txt",
+                        help="file with one promotional message per line")
+    parser.add_argument("--repeat", type=int, default=1000,
+                        help="number of times every message is parsed")
+    parser.add_argument("--json", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    messages = load_messages(args.corpus)
+
+    parse_promotion.cache_clear()
+    results: Dict[str, Any] = {
+        "uncached_us": time_parser(messages, parse_promotion.__wrapped__, args.repeat),
+        "cached_us": time_parser(messages, parse_promotion, args.repeat),
+        "coverage": coverage(messages),
+    }
+
+    print(f"{'uncached':<10} {results['uncached_us']:>8.2f} µs per message")
+    print(f"{'cached':<10} {results['cached_us']:>8.2f} µs per message")
+    print()
+
+    report = results["coverage"]
+    print(f"{'rule':<20} {'messages':>8}")
+    for kind, count in report["per_rule"].items():
+        print(f"{kind:<20} {count:>8}")
+    print(f"{'unmatched':<20} {len(report['unmatched']):>8}")
+    if report["covered"] is not None:
+        print(f"Covered {report['covered']:.0%} of {report['messages']} messages")
+    for message in report["unmatched"]:
+        print(f"    {message}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
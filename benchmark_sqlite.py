@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+    benchmark_sqlite.py
+
+    Standalone script to measure how many crawl results can be stored and how many
+    product pages can be read per second when crawl workers and the web app use
+    the same SQLite database at the same time.
+
+    For every profile a new temporary database is filled with offers and prices.
+    Then a number of writer processes store crawl results, like the workers of
+    argostime_update_prices_parallel.py, while reader processes read the price
+    history of random offers, like the product pages of the web app. The writes
+    and reads per second and the "database is locked" errors are reported for
+    SQLite without any pragmas, with the pragmas of argostime.database and with
+    those pragmas while all results are stored by a single ResultWriter.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import json
+from multiprocessing import Process, Queue
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+from argostime import db
+from argostime.crawl_queue import ResultWriter
+from argostime.crawler.crawl_utils import CrawlResult
+from argostime.database import DEFAULT_SQLITE_PRAGMAS, use_sqlite_pragmas
+from argostime.models import Price, Product, ProductOffer, Webshop
+
+# Pragmas and whether the results are stored by a ResultWriter, per profile
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {"pragmas": {}, "writer": False},
+    "pragmas": {"pragmas": DEFAULT_SQLITE_PRAGMAS, "writer": False},
+    "pragmas+writer": {"pragmas": DEFAULT_SQLITE_PRAGMAS, "writer": True},
+}
+
+
+def create_benchmark_app(path: str, pragmas: Dict[str, str]) -> Flask:
+    """Return an app using the SQLite database at path with the given pragmas."""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db.init_app(app)
+    with app.app_context():
+        use_sqlite_pragmas(db.engine, pragmas)
+    return app
+
+
+def seed(offers: int, prices: int) -> List[int]:
+    """Fill the database with offers that have a history of prices, return their ids."""
+    db.create_all()
+    shop = Webshop(name="Benchmark", hostname="benchmark.test")
+    db.session.add(shop)
+    db.session.flush()
+
+    now = datetime.now()
+    for i in range(offers):
+        product = Product(name=f"Product {i}", product_code=f"product-{i}")
+        db.session.add(product)
+        db.session.flush()
+        offer = ProductOffer(product_id=product.id, shop_id=shop.id,
+                             url=f"https://benchmark.test/{i}", time_added=now)
+        db.session.add(offer)
+        db.session.flush()
+        db.session.add_all(
+            Price(normal_price=random.uniform(1, 10), discount_price=-1, on_sale=False,
+                  datetime=now - timedelta(days=day), product_offer_id=offer.id)
+            for day in range(prices)
+        )
+    db.session.commit()
+    return list(db.session.scalars(db.select(ProductOffer.id)))
+
+
+def count_locked(exception: OperationalError) -> int:
+    """Return 1 if the exception is a "database is locked" error, otherwise raise it."""
+    if "locked" not in str(exception):
+        raise exception
+    db.session.rollback()
+    return 1
+
+
+def run_writer(app: Flask, offer_ids: List[int], seconds: float,
+               writer: Optional[ResultWriter], results: Queue) -> None:
+    """Store crawl results of random offers for seconds, send the counts to results."""
+    with app.app_context():
+        # Connections of the parent process can't be shared with this process
+        db.engine.dispose(close=False)
+        writes = locked = 0
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            offer_id = random.choice(offer_ids)
+            result = CrawlResult(url=f"https://benchmark.test/{offer_id}",
+                                 normal_price=random.uniform(1, 10))
+            try:
+                if writer is None:
+                    db.session.get(ProductOffer, offer_id).add_crawl_result(result)
+                else:
+                    writer.put(offer_id, result)
+                writes += 1
+            except OperationalError as exception:
+                locked += count_locked(exception)
+        results.put({"writes": writes, "reads": 0, "locked": locked})
+
+
+def run_reader(app: Flask, offer_ids: List[int], seconds: float, results: Queue) -> None:
+    """Read the prices of random offers for seconds, send the counts to results."""
+    with app.app_context():
+        db.engine.dispose(close=False)
+        reads = locked = 0
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            try:
+                db.session.scalars(
+                    db.select(Price)
+                    .where(Price.product_offer_id == random.choice(offer_ids))
+                    .order_by(Price.datetime)
+                ).all()
+                db.session.commit()
+                reads += 1
+            except OperationalError as exception:
+                locked += count_locked(exception)
+        results.put({"writes": 0, "reads": reads, "locked": locked})
+
+
+def benchmark_profile(profile: Dict[str, Any], args: argparse.Namespace) -> Dict[str, float]:
+    """Run the writers and readers on a new database, return the operations per second."""
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_benchmark_app(os.path.join(directory, "benchmark.db"), profile["pragmas"])
+        with app.app_context():
+            offer_ids = seed(args.offers, args.prices)
+            db.session.remove()
+            db.engine.dispose()
+
+            writer: Optional[ResultWriter] = ResultWriter() if profile["writer"] else None
+            results: Queue = Queue()
+            processes: List[Process] = [
+                Process(target=run_writer,
+                        args=(app, offer_ids, args.seconds, writer, results))
+                for _ in range(args.writers)
+            ] + [
+                Process(target=run_reader, args=(app, offer_ids, args.seconds, results))
+                for _ in range(args.readers)
+            ]
+
+            start = time.perf_counter()
+            for process in processes:
+                process.start()
+            # Started after forking, a forked process only gets a copy of the forking thread
+            if writer is not None:
+                writer.start()
+
+            counts: Dict[str, int] = {"writes": 0, "reads": 0, "locked": 0}
+            for _ in processes:
+                for key, value in results.get().items():
+                    counts[key] += value
+            for process in processes:
+                process.join()
+            if writer is not None:
+                writer.stop()
+                # Only the results that were actually stored count
+                counts["writes"] = writer.stored
+            seconds = time.perf_counter() - start
+            db.engine.dispose()
+
+    return {
+        "writes_per_second": counts["writes"] / seconds,
+        "reads_per_second": counts["reads"] / seconds,
+        "locked": counts["locked"],
+    }
+
+
+def main() -> None:
+    """Run the benchmarks and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("--seconds", type=float, default=10,
+                        help="how long the writers and readers run per profile")
+    parser.add_argument("--writers", type=int, default=4,
+                        help="number of processes storing crawl results")
+    parser.add_argument("--readers", type=int, default=4,
+                        help="number of processes reading prices")
+    parser.add_argument("--offers", type=int, default=200,
+                        help="number of offers in the database")
+    parser.add_argument("--prices", type=int, default=100,
+                        help="number of prices of every offer in the database")
+    parser.add_argument("--json", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'profile':<16} {'writes/s':>10} {'reads/s':>10} {'locked':>8}")
+    for name, profile in PROFILES.items():
+        result = results[name] = benchmark_profile(profile, args)
+        print(f"{name:<16} {result['writes_per_second']:>10.1f} "
+              f"{result['reads_per_second']:>10.1f} {result['locked']:>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
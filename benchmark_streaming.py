@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+    benchmark_streaming.py
+
+    Standalone script to measure the bandwidth and time saved by crawlers that stop
+    downloading a page as soon as they found the data they need.
+
+    Recorded pages are read from the same directory layout as benchmark_parsers.py
+    and served to the crawlers over a simulated connection with limited bandwidth.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict
+
+import requests
+from requests.adapters import BaseAdapter
+
+from argostime.crawler import crawl_url, enabled_shops
+from argostime.crawler.fetch import session
+
+from benchmark_parsers import load_pages
+
+
+class ThrottledStream:
+    """File-like body of a response that is read at a limited bandwidth."""
+
+    def __init__(self, body: bytes, bandwidth: float):
+        self.body = body
+        self.bandwidth = bandwidth
+        self.position = 0
+
+    def read(self, size: int = -1, **_kwargs: Any) -> bytes:
+        """Return the next size bytes, after the time it takes to receive them."""
+        if size < 0:
+            size = len(self.body) - self.position
+        chunk = self.body[self.position:self.position + size]
+        self.position += len(chunk)
+        time.sleep(len(chunk) / self.bandwidth)
+        return chunk
+
+    def close(self) -> None:
+        """Nothing to close, needed for the requests API."""
+
+
+class RecordedPageAdapter(BaseAdapter):
+    """Transport adapter that serves recorded pages instead of sending requests."""
+
+    def __init__(self, bandwidth: float):
+        super().__init__()
+        self.bandwidth = bandwidth
+        self.pages: Dict[str, bytes] = {}
+        self.streams: Dict[str, ThrottledStream] = {}
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        # pylint: disable=R0913
+        body = self.pages[request.url]
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        response.headers["Content-Type"] = "text/html; charset=utf-8"
+        response.headers["Content-Length"] = str(len(body))
+        response.raw = self.streams[request.url] = ThrottledStream(body, self.bandwidth)
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+def main() -> None:
+    """Crawl every recorded page and print the bytes and time saved per shop."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("directory", help="directory with recorded pages per shop")
+    parser.add_argument("--bandwidth", type=float, default=1000,
+                        help="simulated bandwidth in KiB per second")
+    parser.add_argument("--json", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    adapter = RecordedPageAdapter(args.bandwidth * 1024)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for shop, pages in load_pages(args.directory).items():
+        host = f"www.{shop}" if f"www.{shop}" in enabled_shops else shop
+        if host not in enabled_shops:
+            print(f"Skipping {shop}, no crawler is registered")
+            continue
+
+        shop_result = results[shop] = {
+            "pages": len(pages), "bytes_total": 0, "bytes_read": 0,
+            "time_ms": 0.0, "full_download_ms": 0.0, "failed": 0,
+        }
+        for i, page in enumerate(pages):
+            url = f"https://{host}/benchmark/product/{i}"
+            adapter.pages[url] = page.encode("utf-8")
+
+            start = time.perf_counter()
+            try:
+                crawl_url(url)
+            except Exception:  # pylint: disable=W0703
+                shop_result["failed"] += 1
+            shop_result["time_ms"] += (time.perf_counter() - start) * 1000
+
+            shop_result["bytes_total"] += len(adapter.pages[url])
+            shop_result["bytes_read"] += adapter.streams[url].position
+            shop_result["full_download_ms"] += len(adapter.pages[url]) / adapter.bandwidth * 1000
+
+    print(f"{'shop':<25} {'pages':>5} {'KiB total':>10} {'KiB read':>10} {'saved':>6} "
+          f"{'ms':>8} {'full ms':>8}")
+    for shop, result in results.items():
+        saved = 1 - result["bytes_read"] / result["bytes_total"] if result["bytes_total"] else 0
+        print(f"{shop:<25} {result['pages']:>5} {result['bytes_total'] / 1024:>10.1f} "
+              f"{result['bytes_read'] / 1024:>10.1f} {saved:>6.0%} "
+              f"{result['time_ms']:>8.0f} {result['full_download_ms']:>8.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,26 +22,39 @@
     along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
 """
 
+import argparse
 import sys
 import traceback
 
 from argostime.crawler.crawl_url import crawl_url
+from argostime.crawler.fetch import use_recording, use_replay
+from argostime.crawler.replay import Corpus
 
 from argostime.crawler.crawl_utils import CrawlResult
 
-# Print help message if needed...
-if len(sys.argv) < 2 or len(sys.argv) > 2 or "help" in sys.argv[1]:
-    print(f"usage: {sys.argv[0]} url")
-    exit()
+parser = argparse.ArgumentParser(description="Test the product page crawler on a URL.")
+parser.add_argument("url")
+group = parser.add_mutually_exclusive_group()
+group.add_argument("--record", metavar="CORPUS", help="record the responses in CORPUS")
+group.add_argument("--replay", metavar="CORPUS", help="replay the responses from CORPUS")
+args = parser.parse_args()
+
+if args.record:
+    use_recording(args.record)
+elif args.replay:
+    use_replay(args.replay)
 
 # Just call the crawler with the url given by the user
 try:
-    result: CrawlResult = crawl_url(sys.argv[1])
+    result: CrawlResult = crawl_url(args.url)
 except Exception as exception:
     print("Exception thrown during crawling:", file=sys.stderr)
     traceback.print_exc()
     exit()
 
+if args.record:
+    Corpus(args.record).add_page(args.url)
+
 # Crawling was successful, print results...
 print("Crawling result:")
 print(f"  -> URL:         {result.url}")
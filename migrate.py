@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+    migrate.py
+
+    Standalone script to create the tables of a new database, or to apply the
+    pending schema migrations to an existing one.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import sys
+
+from argostime import create_app
+from argostime.migrations import DEFAULT_BATCH_SIZE, MIGRATIONS
+from argostime.migrations import applied_versions, check_indexes, migrate, pending_migrations
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Apply the pending schema migrations.")
+    parser.add_argument("--status", action="store_true",
+                        help="only show which migrations have been applied")
+    parser.add_argument("--check", action="store_true",
+                        help="only report missing and unused indexes")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="number of rows copied per transaction when SQLite rebuilds a table")
+    args = parser.parse_args()
+
+    app = create_app()
+    app.app_context().push()
+
+    if args.status:
+        applied = applied_versions()
+        for migration in sorted(MIGRATIONS, key=lambda migration: migration.version):
+            state = "applied" if migration.version in applied else "pending"
+            print(f"{migration.version:>4} {state:<8} {migration.name}")
+    elif args.check:
+        if pending_migrations():
+            print("Apply the pending migrations before checking the indexes")
+            sys.exit(1)
+        report = check_indexes()
+        for index in report.missing:
+            print(f"missing index {index}")
+        for scan in report.full_scans:
+            print(f"full table scan in {scan}")
+        for index in report.unused:
+            print(f"unused index {index}")
+        if report.ok():
+            print("All queries use an index")
+        sys.exit(0 if report.ok() else 1)
+    else:
+        applied_migrations = migrate(args.batch_size)
+        for migration in applied_migrations:
+            print(f"Applied migration {migration.version}: {migration.name}")
+        if not applied_migrations:
+            print("The database is up to date")
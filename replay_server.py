@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+    replay_server.py
+
+    Standalone HTTP server that serves a corpus of recorded responses with a
+    realistic latency, as a stand-in for the real shops.
+
+    Point the crawlers at it by setting stand_in in the [crawler] section of
+    argostime.conf, for example stand_in = http://127.0.0.1:8642
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import random
+import time
+
+from argostime.crawler.replay import Corpus
+
+CHUNK_SIZE: int = 16 * 1024
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Serve /{scheme}/{hostname}/{path} from the corpus."""
+
+    corpus: Corpus
+    latency: float
+    jitter: float
+    bandwidth: float
+
+    def do_GET(self) -> None:  # pylint: disable=C0103
+        """Answer a GET request with the recorded response."""
+        scheme, _, rest = self.path.lstrip("/").partition("/")
+        hostname, _, path = rest.partition("/")
+        url = f"{scheme}://{hostname}/{path}"
+
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        recording = self.corpus.load(url)
+        if recording is None:
+            self.send_error(404, f"{url} is not in the corpus")
+            return
+
+        self.send_response(recording.status_code, recording.reason)
+        for key, value in recording.headers.items():
+            if key.lower() not in ("connection", "keep-alive"):
+                self.send_header(key, value)
+        self.send_header("Content-Length", str(len(recording.body)))
+        self.end_headers()
+
+        for start in range(0, len(recording.body), CHUNK_SIZE):
+            chunk = recording.body[start:start + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            if self.bandwidth > 0:
+                time.sleep(len(chunk) / self.bandwidth)
+
+
+def main() -> None:
+    """Parse the arguments and serve the corpus until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("corpus", help="directory with the recorded responses")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8642)
+    parser.add_argument("--latency", type=float, default=150, help="mean latency in ms")
+    parser.add_argument("--jitter", type=float, default=50,
+                        help="standard deviation of the latency in ms")
+    parser.add_argument("--bandwidth", type=float, default=2048,
+                        help="bandwidth per response in KiB/s, 0 for unlimited")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the latency jitter")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    ReplayHandler.corpus = Corpus(args.corpus)
+    ReplayHandler.latency = args.latency / 1000
+    ReplayHandler.jitter = args.jitter / 1000
+    ReplayHandler.bandwidth = args.bandwidth * 1024
+
+    server = ThreadingHTTPServer((args.host, args.port), ReplayHandler)
+    logging.info("Serving %s on %s:%d", args.corpus, args.host, args.port)
+    print(f"Serving {args.corpus} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
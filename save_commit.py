@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+    save_commit.py
+
+    Standalone script to save the hash of the current commit at deploy time, so
+    the web app and the update scripts don't have to read it from .git on every
+    start. Run it again after every update of the code.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+
+import argostime
+
+if __name__ == "__main__":
+    # Read the commit from .git, not from an old commit file
+    if os.path.exists(argostime.COMMIT_FILE):
+        os.remove(argostime.COMMIT_FILE)
+
+    commit: str = argostime.get_current_commit()
+    with open(argostime.COMMIT_FILE, "w") as file_commit:
+        file_commit.write(commit + "\n")
+    print(f"Saved commit {commit} to {argostime.COMMIT_FILE}")
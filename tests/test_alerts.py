@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+    test_alerts.py
+
+    Part of Argostimè
+    Test cases for alerts.py
+"""
+
+from datetime import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from argostime import db
+from argostime.alerts import AlertSink, FileSink, WatchKind, deliver_notifications
+from argostime.crawler import CrawlResult
+from argostime.models import Notification, Product, ProductOffer, Watch, Webshop
+from argostime.products import store_crawl_results
+
+class FailingSink(AlertSink):
+
+    def send(self, contact, notifications):
+        raise OSError("unreachable")
+
+class AlertsTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        shop = Webshop(name="Shop", hostname="shop.test")
+        product = Product(name="Product", product_code="code")
+        db.session.add_all([shop, product])
+        db.session.commit()
+        self.offers = []
+        for i in range(2):
+            offer = ProductOffer(product_id=product.id, shop_id=shop.id,
+                                 url=f"https://shop.test/{i}", time_added=datetime.now())
+            db.session.add(offer)
+            self.offers.append(offer)
+        db.session.commit()
+        self.product = product
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def watch(self, kind: WatchKind, threshold=None, offer=None, contact="a@example.com"):
+        watch = Watch(product_offer_id=offer.id if offer else None,
+                      product_id=None if offer else self.product.id,
+                      kind=kind.value, threshold=threshold, contact=contact,
+                      created=datetime.now())
+        db.session.add(watch)
+        db.session.commit()
+        return watch
+
+    def crawl(self, offer, price, discount_price=-1.0):
+        offer.add_crawl_result(CrawlResult(url=offer.url, normal_price=price,
+                                           discount_price=discount_price))
+
+    def notified(self, watch):
+        return [notification.price for notification in db.session.scalars(
+            db.select(Notification).where(Notification.watch_id == watch.id)
+                .order_by(Notification.id)
+        ).all()]
+
+    def test_below(self):
+        offer_watch = self.watch(WatchKind.BELOW, 2.0, offer=self.offers[0])
+        product_watch = self.watch(WatchKind.BELOW, 2.0)
+
+        for price in (3.0, 1.5, 1.0, 2.5, 1.9):
+            self.crawl(self.offers[0], price)
+        self.crawl(self.offers[1], 1.0)
+
+        # Only when the price drops below the threshold, not while it stays below
+        self.assertEqual(self.notified(offer_watch), [1.5, 1.9])
+        self.assertEqual(self.notified(product_watch), [1.5, 1.9, 1.0])
+
+    def test_stored_in_batch(self):
+        watch = self.watch(WatchKind.BELOW, 2.0, offer=self.offers[0])
+        for price in (3.0, 1.5, 1.0):
+            store_crawl_results([(self.offers[0], CrawlResult(url=self.offers[0].url,
+                                                              normal_price=price))])
+        db.session.commit()
+        self.assertEqual(self.notified(watch), [1.5])
+
+    def test_sale_and_low(self):
+        sale = self.watch(WatchKind.SALE, offer=self.offers[0])
+        low = self.watch(WatchKind.LOW, offer=self.offers[0])
+
+        self.crawl(self.offers[0], 3.0)
+        self.crawl(self.offers[0], 3.0, discount_price=2.5)
+        self.crawl(self.offers[0], 3.0, discount_price=2.0)
+        self.crawl(self.offers[0], 2.8)
+        self.crawl(self.offers[0], 2.0)
+
+        self.assertEqual(self.notified(sale), [2.5])
+        self.assertEqual(self.notified(low), [2.5, 2.0])
+
+    def test_cost_independent_of_watches(self):
+        def queries() -> int:
+            statements = []
+            def count(connection, cursor, statement, *args):
+                statements.append(statement)
+            db.event.listen(db.engine, "before_cursor_execute", count)
+            self.crawl(self.offers[0], 3.0)
+            db.event.remove(db.engine, "before_cursor_execute", count)
+            return len(statements)
+
+        self.watch(WatchKind.BELOW, 2.0, offer=self.offers[0])
+        self.crawl(self.offers[0], 3.0)
+        before = queries()
+        for _ in range(200):
+            db.session.add(Watch(product_offer_id=self.offers[1].id, kind=WatchKind.SALE.value,
+                                 contact="b@example.com", created=datetime.now()))
+        db.session.commit()
+        self.assertEqual(queries(), before)
+
+    def test_sink_without_send(self):
+        class IncompleteSink(AlertSink):  # pylint: disable=W0223
+            pass
+        with self.assertRaises(TypeError):
+            IncompleteSink()  # pylint: disable=E0110
+
+    def test_deliver(self):
+        self.watch(WatchKind.BELOW, 2.0, contact="a@example.com")
+        self.watch(WatchKind.SALE, contact="b@example.com")
+        self.crawl(self.offers[0], 3.0, discount_price=1.0)
+        self.crawl(self.offers[1], 1.5)
+
+        self.assertEqual(deliver_notifications(FailingSink()), 0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "alerts.jsonl")
+            self.assertEqual(deliver_notifications(FileSink(path), batch_size=2), 3)
+            self.assertEqual(deliver_notifications(FileSink(path)), 0)
+
+            with open(path, encoding="utf-8") as file:
+                lines = [json.loads(line) for line in file]
+        self.assertEqual(sorted(line["contact"] for line in lines),
+                         ["a@example.com", "a@example.com", "b@example.com"])
+        self.assertIn("in de aanbieding", [line for line in lines
+                                           if line["contact"] == "b@example.com"][0]["message"])
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+    test_circuit_breaker.py
+
+    Part of Argostimè
+    Test cases for crawler/circuit_breaker.py and the retries in crawler/fetch.py
+"""
+
+import unittest
+from unittest import mock
+
+import requests
+from requests.adapters import BaseAdapter
+
+from argostime.crawler import fetch as fetch_module
+from argostime.crawler.circuit_breaker import BreakerState, CircuitBreaker, RetryBudget
+from argostime.crawler.circuit_breaker import defer_if_open, get_breaker, reset_breakers
+from argostime.crawler.fetch import fetch, session
+from argostime.exceptions import CircuitOpenException
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class StatusAdapter(BaseAdapter):
+
+    def __init__(self, status_codes):
+        super().__init__()
+        self.status_codes = list(status_codes)
+        self.requests = 0
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        status_code = self.status_codes.pop(0) if self.status_codes else 200
+        if isinstance(status_code, Exception):
+            raise status_code
+        response = requests.Response()
+        response.status_code = status_code
+        response.url = request.url
+        response._content = b""
+        return response
+
+    def close(self):
+        pass
+
+class CircuitBreakerTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = CircuitBreaker("shop.test", 3, 60, self.clock)
+
+    def test_opens_after_threshold(self):
+        for _ in range(2):
+            self.assertTrue(self.breaker.allow_request())
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, BreakerState.CLOSED)
+
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, BreakerState.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, BreakerState.CLOSED)
+
+    def test_single_probe_after_timeout(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+        self.clock.now = 61
+        self.assertFalse(self.breaker.is_open())
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.breaker.state, BreakerState.HALF_OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, BreakerState.CLOSED)
+
+    def test_failed_probe_doubles_timeout(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+        self.clock.now = 61
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, BreakerState.OPEN)
+        self.assertEqual(self.breaker.reset_timeout, 120)
+
+        self.clock.now = 121
+        self.assertFalse(self.breaker.allow_request())
+        self.clock.now = 182
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_probe_times_out(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+        self.clock.now = 61
+        self.assertTrue(self.breaker.allow_request())
+        self.clock.now = 61 + self.breaker.probe_timeout - 1
+        self.assertFalse(self.breaker.allow_request())
+        # The probe never reported back
+        self.clock.now = 61 + self.breaker.probe_timeout
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.breaker.state, BreakerState.HALF_OPEN)
+
+    def test_retry_budget(self):
+        budget = RetryBudget(2)
+        self.assertTrue(budget.spend())
+        self.assertTrue(budget.spend())
+        self.assertFalse(budget.spend())
+
+class FetchRetryTestCases(unittest.TestCase):
+
+    def setUp(self):
+        reset_breakers()
+        patcher = mock.patch("argostime.crawler.fetch.time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        del session.adapters["https://breaker.test/"]
+        reset_breakers()
+
+    def mount(self, status_codes):
+        adapter = StatusAdapter(status_codes)
+        session.mount("https://breaker.test/", adapter)
+        return adapter
+
+    def test_retries_with_backoff(self):
+        adapter = self.mount([503, 429])
+        response = fetch("https://breaker.test/page")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(adapter.requests, 3)
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [1, 2])
+
+    def test_gives_up_after_max_retries(self):
+        adapter = self.mount([500] * 10)
+        response = fetch("https://breaker.test/page")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(adapter.requests, fetch_module.MAX_RETRIES + 1)
+
+    def test_no_retry_without_budget(self):
+        adapter = self.mount([503])
+        with mock.patch.object(fetch_module, "retry_budget", RetryBudget(0)):
+            response = fetch("https://breaker.test/page")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(adapter.requests, 1)
+
+    def test_open_breaker_defers(self):
+        adapter = self.mount([500] * 10)
+        for _ in range(2):
+            fetch("https://breaker.test/page")
+        self.assertTrue(get_breaker("https://breaker.test/page").is_open())
+
+        requests_sent = adapter.requests
+        with self.assertRaises(CircuitOpenException):
+            fetch("https://breaker.test/other")
+        self.assertEqual(adapter.requests, requests_sent)
+
+        self.assertTrue(defer_if_open("https://breaker.test/offer"))
+        self.assertEqual(get_breaker("https://breaker.test/").deferred,
+                         ["https://breaker.test/offer"])
+
+    def test_probe_with_other_exception(self):
+        adapter = self.mount([500] * 10)
+        for _ in range(2):
+            fetch("https://breaker.test/page")
+        breaker = get_breaker("https://breaker.test/page")
+        self.assertTrue(breaker.is_open())
+
+        adapter.status_codes = [requests.TooManyRedirects("redirect loop")]
+        breaker.opened_at -= breaker.reset_timeout
+        with self.assertRaises(requests.TooManyRedirects):
+            fetch("https://breaker.test/page")
+        self.assertEqual(breaker.state, BreakerState.OPEN)
+
+        breaker.opened_at -= breaker.reset_timeout
+        self.assertEqual(fetch("https://breaker.test/page").status_code, 200)
+        self.assertEqual(breaker.state, BreakerState.CLOSED)
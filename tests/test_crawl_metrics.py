@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+    test_crawl_metrics.py
+
+    Part of Argostimè
+    Test cases for crawl_metrics.py
+"""
+
+import os.path
+import tempfile
+import unittest
+
+from argostime import crawl_metrics
+from argostime.crawl_metrics import Histogram, Outcome, measure_crawl, record_request
+from argostime.crawl_metrics import record_response, record_retry, render_prometheus
+from argostime.exceptions import CrawlerException, PageNotFoundException
+
+URL = "https://www.ah.nl/producten/product/wi1525/ah-halfvolle-melk"
+
+class CrawlMetricsTestCases(unittest.TestCase):
+
+    def setUp(self):
+        crawl_metrics.reset_metrics()
+
+    def tearDown(self):
+        crawl_metrics.reset_metrics()
+
+    def shop(self):
+        return crawl_metrics.summary()["shops"]["ah.nl"]
+
+    def test_histogram(self):
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.total, 56.5)
+
+    def test_outcomes(self):
+        with measure_crawl(URL):
+            record_response(URL, 2048, 0.0)
+        with self.assertRaises(PageNotFoundException):
+            with measure_crawl(URL):
+                raise PageNotFoundException(URL)
+        with self.assertRaises(CrawlerException):
+            with measure_crawl(URL):
+                raise CrawlerException()
+
+        shop = self.shop()
+        self.assertEqual(shop["outcomes"], {"ok": 1, "not_found": 1, "crawler_exception": 1})
+        self.assertEqual(shop["parse_seconds"]["count"], 1)
+        self.assertEqual(shop["response_bytes"]["sum"], 2048)
+
+    def test_summary_is_merged(self):
+        record_request(URL, 0.2)
+        record_retry(URL)
+        summary = crawl_metrics.summary()
+        crawl_metrics.merge_summary(summary)
+        self.assertEqual(self.shop()["retries"], 2)
+        self.assertEqual(self.shop()["request_seconds"]["count"], 2)
+
+    def test_write_and_load_summary(self):
+        record_request(URL, 0.2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+            crawl_metrics.write_summary(path)
+            self.assertEqual(crawl_metrics.load_summary(path)["shops"],
+                             crawl_metrics.summary()["shops"])
+            self.assertIsNone(crawl_metrics.load_summary(os.path.join(directory, "missing.json")))
+
+    def test_prometheus(self):
+        record_request(URL, 0.2)
+        record_request(URL, 3)
+        crawl_metrics.record_crawl(URL, Outcome.OK, 0.01)
+        text = render_prometheus(crawl_metrics.summary(), {("ah.nl", "pending"): 3})
+
+        name = "argostime_crawl_request_duration_seconds"
+        self.assertIn(f"# TYPE {name} histogram", text)
+        self.assertIn(f'{name}_bucket{{shop="ah.nl",le="0.25"}} 1', text)
+        self.assertIn(f'{name}_bucket{{shop="ah.nl",le="+Inf"}} 2', text)
+        self.assertIn(f'{name}_count{{shop="ah.nl"}} 2', text)
+        self.assertIn('argostime_crawl_results_total{shop="ah.nl",outcome="ok"} 1', text)
+        self.assertIn('argostime_crawl_queue_jobs{shop="ah.nl",status="pending"} 3', text)
+
+    def test_prometheus_without_run(self):
+        text = render_prometheus(None)
+        self.assertNotIn("argostime_crawl_run_timestamp_seconds ", text)
+        self.assertTrue(text.endswith("\n"))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+    test_crawl_queue.py
+
+    Part of Argostimè
+    Test cases for crawl_queue.py
+"""
+
+from datetime import datetime, timedelta
+import unittest
+from unittest import mock
+
+from flask import Flask
+import requests
+
+from argostime import db
+from argostime import crawl_queue
+from argostime.crawl_queue import JobStatus, ResultWriter, claim_job, enqueue_due_offers, run_job
+from argostime.crawler import CrawlResult
+from argostime.exceptions import CircuitOpenException, CrawlerException
+from argostime.models import CrawlHost, CrawlJob, Price, Product, ProductOffer, Webshop
+
+class CrawlQueueTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        for hostname, offers in (("shop-a.test", 3), ("shop-b.test", 2)):
+            shop = Webshop(name=hostname, hostname=hostname)
+            db.session.add(shop)
+            db.session.commit()
+            for i in range(offers):
+                product = Product(name=f"{hostname} {i}", product_code=f"{hostname}-{i}")
+                db.session.add(product)
+                db.session.commit()
+                db.session.add(ProductOffer(
+                    product_id=product.id, shop_id=shop.id,
+                    url=f"https://{hostname}/product/{i}", time_added=datetime.now()))
+        db.session.commit()
+
+        patcher = mock.patch.multiple(crawl_queue, HOST_DELAY_MIN=0, HOST_DELAY_MAX=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def test_enqueue_once(self):
+        self.assertEqual(enqueue_due_offers(), 5)
+        self.assertEqual(enqueue_due_offers(), 0)
+        self.assertEqual(db.session.scalar(db.select(db.func.count(CrawlHost.id))), 2)
+
+    def test_host_concurrency(self):
+        enqueue_due_offers()
+        first = claim_job("worker-1")
+        second = claim_job("worker-2")
+        self.assertNotEqual(first.hostname, second.hostname)
+        self.assertIsNone(claim_job("worker-3"))
+
+    def test_expired_lease_is_claimed_again(self):
+        enqueue_due_offers()
+        job = claim_job("worker-1")
+        job.lease_expires = datetime.now() - timedelta(seconds=1)
+        db.session.commit()
+
+        claims = [claim_job("worker-2"), claim_job("worker-2")]
+        self.assertIn(job.id, [claim.id for claim in claims])
+        self.assertEqual(db.session.get(CrawlJob, job.id).worker, "worker-2")
+
+    def test_lost_race(self):
+        enqueue_due_offers()
+        job = db.session.scalars(db.select(CrawlJob)).first()
+        claimable = crawl_queue._claimable
+        calls = []
+
+        def claimed_by_other_worker(now):
+            # Simulate another worker claiming the job between the select and the update
+            calls.append(now)
+            return claimable(now) if len(calls) % 2 == 1 else CrawlJob.id == -1
+
+        with mock.patch.object(crawl_queue, "_claimable", claimed_by_other_worker):
+            self.assertIsNone(claim_job("worker-1"))
+        self.assertEqual(db.session.get(CrawlJob, job.id).status, JobStatus.PENDING.value)
+
+    def test_run_job(self):
+        enqueue_due_offers()
+        job = claim_job("worker-1")
+        result = CrawlResult(url=job.product_offer.url, product_name="Product",
+                             product_code="code", normal_price=1.5)
+        with mock.patch.object(crawl_queue, "crawl_url", return_value=result):
+            self.assertEqual(run_job(job, "worker-1"), JobStatus.DONE)
+
+        self.assertEqual(db.session.get(CrawlJob, job.id).status, JobStatus.DONE.value)
+        self.assertEqual(db.session.scalar(db.select(Price.normal_price)), 1.5)
+        self.assertFalse(job.product_offer.needs_update())
+
+    def test_result_writer(self):
+        enqueue_due_offers()
+        writer = ResultWriter(batch_size=2)
+        for i in range(3):
+            job = claim_job(f"worker-{i}")
+            result = CrawlResult(url=job.product_offer.url, product_name="Product",
+                                 product_code="code", normal_price=float(i))
+            with mock.patch.object(crawl_queue, "crawl_url", return_value=result):
+                self.assertEqual(run_job(job, f"worker-{i}", writer), JobStatus.STORING)
+        self.assertEqual(db.session.scalar(db.select(db.func.count(Price.id))), 0)
+        # Stored jobs don't count against the concurrency of their host
+        self.assertIsNotNone(claim_job("worker-3"))
+
+        # The in-memory database has one connection, so it isn't shared with the workers
+        writer.start()
+        writer.stop()
+
+        self.assertEqual(writer.stored, 3)
+        db.session.expire_all()
+        self.assertEqual(sorted(db.session.scalars(db.select(Price.normal_price)).all()),
+                         [0.0, 1.0, 2.0])
+        self.assertEqual(
+            db.session.scalars(db.select(CrawlJob.status).where(CrawlJob.worker != "worker-3"))
+                .all(),
+            [JobStatus.DONE.value] * 3)
+
+    def test_result_writer_failure(self):
+        enqueue_due_offers()
+        writer = ResultWriter()
+        job = claim_job("worker-1")
+        result = CrawlResult(url=job.product_offer.url, product_name="Product",
+                             product_code="code", normal_price=1.0)
+        with mock.patch.object(crawl_queue, "crawl_url", return_value=result):
+            run_job(job, "worker-1", writer)
+
+        with mock.patch.object(crawl_queue, "store_crawl_results",
+                               side_effect=ValueError("bug")):
+            writer.start()
+            writer.stop()
+
+        self.assertEqual(writer.stored, 0)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(CrawlJob, job.id).status, JobStatus.PENDING.value)
+        self.assertEqual(db.session.scalar(db.select(db.func.count(Price.id))), 0)
+
+    def test_failed_job_is_retried(self):
+        enqueue_due_offers()
+        job = claim_job("worker-1")
+        with mock.patch.object(crawl_queue, "crawl_url", side_effect=CrawlerException()):
+            self.assertEqual(run_job(job, "worker-1"), JobStatus.PENDING)
+        self.assertGreater(db.session.get(CrawlJob, job.id).not_before, datetime.now())
+
+    def test_connection_error(self):
+        enqueue_due_offers()
+        job = claim_job("worker-1")
+        with mock.patch.object(crawl_queue, "crawl_url",
+                               side_effect=requests.ConnectionError("down")):
+            self.assertEqual(run_job(job, "worker-1"), JobStatus.PENDING)
+
+        # A bug in the crawler doesn't stop the worker either
+        job = claim_job("worker-1")
+        job.attempts = crawl_queue.MAX_ATTEMPTS
+        db.session.commit()
+        with mock.patch.object(crawl_queue, "crawl_url", side_effect=KeyError("price")):
+            self.assertEqual(run_job(job, "worker-1"), JobStatus.FAILED)
+
+    def test_abandoned_job_fails(self):
+        enqueue_due_offers()
+        job = claim_job("worker-1")
+        job.attempts = crawl_queue.MAX_ATTEMPTS
+        job.lease_expires = datetime.now() - timedelta(seconds=1)
+        db.session.commit()
+
+        claims = [claim_job("worker-2"), claim_job("worker-2")]
+        self.assertNotIn(job.id, [claim.id for claim in claims if claim is not None])
+        self.assertEqual(db.session.get(CrawlJob, job.id).status, JobStatus.FAILED.value)
+
+    def test_deferred_job_pauses_host(self):
+        enqueue_due_offers()
+        job = claim_job("worker-1")
+        with mock.patch.object(crawl_queue, "crawl_url", side_effect=CircuitOpenException("")):
+            self.assertEqual(run_job(job, "worker-1"), JobStatus.DEFERRED)
+
+        host = db.session.scalar(db.select(CrawlHost).where(CrawlHost.hostname == job.hostname))
+        self.assertGreater(host.next_request, datetime.now())
+        other = claim_job("worker-1")
+        self.assertNotEqual(other.hostname, job.hostname)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+    test_crawl_utils.py
+
+    Part of Argostimè
+    Test cases for crawler/crawl_utils.py
+"""
+
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import requests
+
+from argostime import crawl_metrics
+from argostime.crawler import crawl_utils
+from argostime.crawler.circuit_breaker import get_breaker, reset_breakers
+from argostime.crawler.crawl_url import crawl_urls, has_batch_crawler
+from argostime.crawler.crawl_utils import CrawlResult, enabled_shops
+from argostime.crawler.crawl_utils import register_batch_crawler, register_crawler
+from argostime.crawler.crawl_utils import PARSER_BACKENDS, get_parser_backend, parse_html
+from argostime.crawler.crawl_utils import parser_available
+from argostime.crawler.crawl_utils import parse_ean, parse_promotion, parse_promotional_message
+
+class ParseHTMLTestCases(unittest.TestCase):
+
+    def test_backends_find_same_elements(self):
+        markup = '<html><head><meta property="og:title" content="Thee"></head></html>'
+        for backend in PARSER_BACKENDS:
+            if not parser_available(backend):
+                continue
+            soup = parse_html(markup, "https://www.example.com/", backend)
+            self.assertEqual(soup.find("meta", property="og:title")["content"], "Thee")
+
+    def test_unknown_shop_uses_default_backend(self):
+        soup = parse_html("<p>Thee</p>", "https://www.example.com/")
+        self.assertEqual(soup.select_one("p").text, "Thee")
+
+    def test_fallback_logged_once(self):
+        crawl_utils._usable_backend.cache_clear()  # pylint: disable=W0212
+        self.addCleanup(crawl_utils._usable_backend.cache_clear)  # pylint: disable=W0212
+        with mock.patch("argostime.crawler.crawl_utils.parser_available", return_value=False):
+            with mock.patch.dict(enabled_shops["www.ah.nl"], parser="html5lib"):
+                with self.assertLogs(level="WARNING") as logs:
+                    for _ in range(3):
+                        self.assertEqual(get_parser_backend("https://www.ah.nl/producten/1"),
+                                         "html.parser")
+        self.assertEqual(len(logs.output), 1)
+
+class ParseEANTestCases(unittest.TestCase):
+
+    def test_parse_ean(self):
+        self.assertEqual(parse_ean(8711439123456), 8711439123456)
+        self.assertEqual(parse_ean(" 08711439123456"), 8711439123456)
+        self.assertEqual(parse_ean("87654321"), 87654321)
+        for value in (None, "", "1234", "87114391234A6", "00000000", "123456789012345"):
+            self.assertIsNone(parse_ean(value), value)
+
+class PromotionalMessageTestCases(unittest.TestCase):
+
+    def assertPromotion(self, message, effective_price, price=2.0):
+        self.assertAlmostEqual(parse_promotional_message(message, price), effective_price)
+
+    def test_n_plus_m_gratis(self):
+        self.assertPromotion("1 + 1 GRATIS", 1.0)
+        self.assertPromotion("2+1 gratis", 4 / 3)
+        self.assertPromotion("3 + 2 gratis", 1.2)
+        self.assertPromotion("1+1", 1.0)
+        self.assertPromotion("6=5", 5 / 3)
+
+    def test_nth_item(self):
+        self.assertPromotion("2e halve prijs", 1.5)
+        self.assertPromotion("3de halve prijs", 5 / 3)
+        self.assertPromotion("2e GRATIS", 1.0)
+        self.assertPromotion("2e artikel 50% korting", 1.5)
+        self.assertPromotion("2e voor €1", 1.5)
+
+    def test_percentage(self):
+        self.assertPromotion("15% KORTING", 1.7)
+        self.assertPromotion("12,5% korting", 1.75)
+
+    def test_fixed_price(self):
+        self.assertPromotion("2 voor 5", 2.5)
+        self.assertPromotion("2 VOOR € 3,99", 1.995)
+        self.assertPromotion("VOOR 2.49", 2.49)
+        self.assertPromotion("van 3.49 voor 2.79", 2.79, price=3.49)
+
+    def test_no_match(self):
+        with self.assertLogs(level="ERROR"):
+            self.assertEqual(parse_promotional_message("OP=OP", 2.0), -1)
+        self.assertEqual(parse_promotional_message("0+0 gratis", 2.0), -1)
+        self.assertEqual(parse_promotional_message("150% korting", 2.0), -1)
+
+    def test_cached_on_normalized_message(self):
+        parse_promotion.cache_clear()
+        parse_promotional_message("1 + 1 GRATIS", 2.0)
+        parse_promotional_message("1+1 gratis", 3.0)
+        self.assertEqual(parse_promotion.cache_info().hits, 1)
+
+class ShopRegistryTestCases(unittest.TestCase):
+
+    def run_python(self, code):
+        process = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        return process.stdout.split()
+
+    def test_shop_module_imported_on_lookup(self):
+        output = self.run_python(
+            "import sys\n"
+            "from argostime.crawler import enabled_shops\n"
+            "print('argostime.crawler.shop.ah' in sys.modules)\n"
+            "print(enabled_shops['www.ah.nl']['name'] == 'Albert Heijn')\n"
+            "print('argostime.crawler.shop.ah' in sys.modules)\n"
+            "print('argostime.crawler.shop.jumbo' in sys.modules)\n"
+        )
+        self.assertEqual(output, ["False", "True", "True", "False"])
+
+    def test_shop_modules_complete(self):
+        output = self.run_python(
+            "import importlib, pkgutil\n"
+            "from argostime.crawler import enabled_shops, shop\n"
+            "enabled_shops.load_all()\n"
+            "lazy = dict(enabled_shops)\n"
+            "modules = [module.name for module in pkgutil.iter_modules(shop.__path__)]\n"
+            "for module in modules:\n"
+            "    importlib.import_module(f'argostime.crawler.shop.{module}')\n"
+            "print(dict(enabled_shops).keys() == lazy.keys())\n"
+            "print(set(shop.SHOP_MODULES.values()) == set(modules))\n"
+            "print(all(info['crawler'].__module__ == 'argostime.crawler.shop.'\n"
+            "          + shop.SHOP_MODULES[hostname.removeprefix('www.')]\n"
+            "          for hostname, info in lazy.items()))\n"
+        )
+        self.assertEqual(output, ["True", "True", "True"])
+
+    def test_models_do_not_import_crawlers(self):
+        output = self.run_python(
+            "import sys\n"
+            "import argostime.models, argostime.graphs\n"
+            "print(any(module in sys.modules for module in ('argostime.crawler', 'bs4')))\n"
+        )
+        self.assertEqual(output, ["False"])
+
+    def test_unknown_host(self):
+        self.assertNotIn("www.example.com", enabled_shops)
+        self.assertIsNone(enabled_shops.get("www.example.com"))
+        with self.assertRaises(KeyError):
+            enabled_shops["www.example.com"]  # pylint: disable=W0104
+
+class BatchCrawlerTestCases(unittest.TestCase):
+
+    def setUp(self):
+        register_crawler("Batch test", "batch.test")(self.crawl)
+        register_batch_crawler("batch.test")(self.crawl_batch)
+        self.batches = []
+
+    def tearDown(self):
+        del enabled_shops["batch.test"]
+        del enabled_shops["www.batch.test"]
+
+    @staticmethod
+    def crawl(url):
+        return CrawlResult(url=url, product_name="Thee", product_code=url[-1], normal_price=1.0)
+
+    def crawl_batch(self, urls):
+        self.batches.append(urls)
+        # Leave out the last URL, as if it could not be found
+        return {url: self.crawl(url) for url in urls[:-1]}
+
+    def test_batch_crawler_is_used(self):
+        urls = [f"https://www.batch.test/product/{i}" for i in range(3)]
+        self.assertTrue(has_batch_crawler(urls[0]))
+        results = crawl_urls(urls)
+        self.assertEqual(self.batches, [urls])
+        self.assertEqual(list(results.keys()), urls[:-1])
+
+    def test_failed_batch(self):
+        crawl_metrics.reset_metrics()
+        urls = [f"https://www.batch.test/product/{i}" for i in range(3)]
+        other_url = "https://www.batch-other.test/product/1"
+        register_crawler("Other", "batch-other.test")(self.crawl)
+        self.addCleanup(enabled_shops.pop, "batch-other.test")
+        self.addCleanup(enabled_shops.pop, "www.batch-other.test")
+
+        def fail(urls):
+            raise requests.ConnectionError("down")
+        enabled_shops["batch.test"]["batch_crawler"] = fail
+
+        # The other shop is still crawled
+        self.assertEqual(list(crawl_urls(urls + [other_url]).keys()), [other_url])
+        outcomes = crawl_metrics.summary()["shops"]["batch.test"]["outcomes"]
+        self.assertEqual(outcomes, {crawl_metrics.Outcome.ERROR.value: 3})
+
+    def test_open_breaker_defers_batch(self):
+        reset_breakers()
+        self.addCleanup(reset_breakers)
+        urls = [f"https://www.batch.test/product/{i}" for i in range(3)]
+        breaker = get_breaker(urls[0])
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+        self.assertEqual(crawl_urls(urls), {})
+        self.assertEqual(self.batches, [])
+        self.assertEqual(breaker.deferred, urls)
@@ -3,16 +3,106 @@
     test_crawler.py
 
     Part of Argostimè
-    Test cases for crawler.py
+    Test cases for the crawlers, using the responses recorded in tests/corpus
 """
 
+import locale
+import os.path
 import unittest
 
-from argostime.crawler import ParseProduct
+from argostime.crawler import crawl_url
+from argostime.crawler.fetch import use_network, use_replay
 import argostime.exceptions
 
-class ParseProductTestCases(unittest.TestCase):
+CORPUS = os.path.join(os.path.dirname(__file__), "corpus")
+
+class CrawlURLTestCases(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        use_replay(CORPUS)
+
+    @classmethod
+    def tearDownClass(cls):
+        use_network()
+
+    def assertCrawlResult(self, url, product_code, normal_price=-1.0, discount_price=-1.0):
+        result = crawl_url(url)
+        self.assertEqual(result.product_code, product_code)
+        self.assertAlmostEqual(result.normal_price, normal_price)
+        self.assertAlmostEqual(result.discount_price, discount_price)
+        self.assertEqual(result.on_sale, discount_price > 0)
+        return result
 
     def test_not_implemented_website(self):
         with self.assertRaises(argostime.exceptions.WebsiteNotImplementedException):
-            ParseProduct("https://example.com")
+            crawl_url("https://example.com")
+
+    def test_not_in_corpus(self):
+        # Answered with a 404, like replay_server.py does
+        with self.assertRaises(argostime.exceptions.PageNotFoundException):
+            crawl_url("https://www.ah.nl/producten/product/wi0/niet-opgenomen")
+
+    def test_ah(self):
+        result = self.assertCrawlResult(
+            "https://www.ah.nl/producten/product/wi1525/ah-halfvolle-melk", "wi1525", 1.19)
+        self.assertEqual(result.product_name, "AH Halfvolle melk")
+
+    def test_brandzaak(self):
+        self.assertCrawlResult("https://www.brandzaak.nl/heren/jas-blauw", "Blauwe-winterjas", 89.95)
+
+    def test_ekoplaza(self):
+        result = self.assertCrawlResult(
+            "https://www.ekoplaza.nl/product/rode-linzen", "8711521921106", 2.49, 1.99)
+        self.assertEqual(result.product_name, "Rode Linzen")
+
+    def test_etos(self):
+        self.assertCrawlResult(
+            "https://www.etos.nl/producten/etos-handzeep-120101.html",
+            "120101", discount_price=2/3 * 1.99)
+
+    def test_hema(self):
+        self.assertCrawlResult(
+            "https://www.hema.nl/eten-drinken/rookworst-25200026.html", "25200026", 3.50)
+
+    def test_ikea(self):
+        result = self.assertCrawlResult(
+            "https://www.ikea.com/nl/nl/p/billy-boekenkast-wit-00263850/", "002.638.50", 59.99)
+        self.assertEqual(result.product_description, "Boekenkast, wit, 80x28x202 cm")
+
+    def test_gamma(self):
+        result = self.assertCrawlResult(
+            "https://www.gamma.nl/assortiment/klauwhamer/p/B123456", "B123456", 14.99)
+        self.assertEqual(result.ean, 8711439123456)
+
+    def test_karwei(self):
+        self.assertCrawlResult(
+            "https://www.karwei.nl/assortiment/handzaag/p/B654321", "B654321",
+            discount_price=12.49)
+
+    def test_jumbo(self):
+        result = self.assertCrawlResult(
+            "https://www.jumbo.com/producten/jumbo-jong-belegen-kaas-123456PAK",
+            "123456PAK", 4.99, 3.99)
+        self.assertEqual(result.ean, 8718452123456)
+
+    def test_pipashop(self):
+        self.assertCrawlResult("https://www.pipa-shop.nl/product/42/pijp-van-kersenhout", "42", 24.95)
+
+    def test_praxis(self):
+        result = self.assertCrawlResult(
+            "https://www.praxis.nl/gereedschap/boormachines/accuboormachine/1234567",
+            "1234567", 79.99)
+        self.assertEqual(result.ean, 8711111234567)
+
+    def test_simonlevelt(self):
+        try:
+            locale.setlocale(locale.LC_NUMERIC, "nl_NL.UTF-8")
+        except locale.Error:
+            self.skipTest("The nl_NL.UTF-8 locale is not available")
+        finally:
+            locale.setlocale(locale.LC_NUMERIC, "")
+        self.assertCrawlResult("https://www.simonlevelt.nl/earl-grey-thee", "Earl_Grey_thee", 7.95)
+
+    def test_steam(self):
+        self.assertCrawlResult("https://store.steampowered.com/app/620/Portal_2/", "7877", 9.99)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+    test_database.py
+
+    Part of Argostimè
+    Test cases for database.py
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import create_engine
+
+from argostime import database, db
+from argostime.models import Product, ProductOffer, Webshop
+from argostime.products import ProductOfferAddResult, add_product_offer_from_url
+
+class ReplicaRoutingTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        database.init_app(self.app, db.engines, "sqlite://")
+        self.replica = self.app.extensions[database.REPLICA]
+
+        db.create_all()
+        db.metadata.create_all(self.replica)
+        db.session.add(Webshop(name="primary", hostname="primary.test"))
+        db.session.commit()
+        with self.replica.begin() as connection:
+            connection.execute(db.insert(Webshop).values(name="replica", hostname="replica.test"))
+
+        patcher = mock.patch.object(database, "_replica_health", database._ReplicaHealth())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.replica.dispose()
+        self.context.pop()
+
+    def shop_name(self, method: str = "GET") -> str:
+        with self.app.test_request_context("/", method=method):
+            name = db.session.scalar(db.select(Webshop.name))
+            db.session.remove()
+            return name
+
+    def test_routing(self):
+        self.assertEqual(self.shop_name("GET"), "replica")
+        self.assertEqual(self.shop_name("POST"), "primary")
+        # Crawls and scripts run outside of a request
+        self.assertEqual(db.session.scalar(db.select(Webshop.name)), "primary")
+
+    def test_read_own_writes(self):
+        with self.app.test_request_context("/", method="GET"):
+            db.session.add(Webshop(name="new", hostname="new.test"))
+            db.session.flush()
+            self.assertEqual(
+                db.session.scalars(db.select(Webshop.name).order_by(Webshop.id)).all(),
+                ["primary", "new"])
+            db.session.rollback()
+            db.session.remove()
+
+    def test_add_product_on_primary(self):
+        url = "https://www.ah.nl/producten/product/wi1525/ah-halfvolle-melk"
+        shop = Webshop(name="Albert Heijn", hostname="ah.nl")
+        product = Product(name="AH Halfvolle melk", product_code="wi1525")
+        db.session.add_all([shop, product])
+        db.session.commit()
+        db.session.add(ProductOffer(product_id=product.id, shop_id=shop.id, url=url))
+        db.session.commit()
+        db.session.remove()
+
+        # Not replicated yet
+        with self.app.test_request_context("/add_url", method="GET"):
+            database.use_primary()
+            result, offer = add_product_offer_from_url(url)
+            self.assertEqual(result, ProductOfferAddResult.ALREADY_EXISTS)
+            self.assertEqual(offer.url, url)
+            db.session.remove()
+        self.assertEqual(len(db.session.scalars(db.select(Webshop)).all()), 2)
+
+    def test_lagging_replica(self):
+        fallbacks = database._replica_fallbacks
+        with mock.patch.object(database, "replica_lag", return_value=60):
+            self.assertEqual(self.shop_name(), "primary")
+        self.assertEqual(database._replica_fallbacks, fallbacks + 1)
+
+    def test_query_metrics(self):
+        self.shop_name()
+        metrics = database.render_prometheus()
+        self.assertIn('argostime_db_queries_total{bind="replica"}', metrics)
+        self.assertIn('argostime_db_queries_total{bind="primary"}', metrics)
+
+
+class SQLitePragmasTestCases(unittest.TestCase):
+
+    def test_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'test.db')}")
+            database.use_sqlite_pragmas(engine, database.DEFAULT_SQLITE_PRAGMAS)
+            with engine.connect() as connection:
+                self.assertEqual(connection.exec_driver_sql("PRAGMA journal_mode").scalar(), "wal")
+                self.assertEqual(connection.exec_driver_sql("PRAGMA busy_timeout").scalar(), 10000)
+                # NORMAL
+                self.assertEqual(connection.exec_driver_sql("PRAGMA synchronous").scalar(), 1)
+            engine.dispose()
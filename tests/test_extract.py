@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+    test_extract.py
+
+    Part of Argostimè
+    Test cases for crawler/extract.py
+"""
+
+import unittest
+
+from argostime.crawler.extract import PageExtractor, extract_page_data
+
+PAGE = """<html><head>
+<meta property="og:title" content="Earl Grey &amp; citroen">
+<meta name="title" content="Earl Grey">
+<script type="application/ld+json">{"@type": "BreadcrumbList"}</script>
+<script type="application/ld+json" data-n-head="ssr">{"@type": "Product", "sku": "123"}</script>
+<script>
+var other = 1;
+var gtmDataObj = JSON.parse('{"a": 1}');
+</script>
+</head><body><p>Rest of the page</p></body></html>"""
+
+class ExtractTestCases(unittest.TestCase):
+
+    def test_json_ld_with_attributes(self):
+        data = extract_page_data(PAGE, json_ld=1, json_ld_attrs={"data-n-head": "ssr"})
+        self.assertEqual(data.json_ld, [{"@type": "Product", "sku": "123"}])
+
+    def test_meta(self):
+        data = extract_page_data(PAGE, meta=("og:title", "title", "product:price"))
+        self.assertEqual(data.meta, {"og:title": "Earl Grey & citroen", "title": "Earl Grey"})
+
+    def test_script_variables(self):
+        data = extract_page_data(PAGE, script_variables=("gtmDataObj",))
+        self.assertEqual(data.script_variables["gtmDataObj"], "JSON.parse('{\"a\": 1}')")
+
+    def test_stops_when_done(self):
+        extractor = PageExtractor(meta=("og:title",))
+        self.assertTrue(extractor.feed(PAGE[:PAGE.index("<script")]))
+        self.assertTrue(extractor.done)
+
+    def test_chunked_feed(self):
+        extractor = PageExtractor(json_ld=2)
+        for i in range(0, len(PAGE), 7):
+            extractor.feed(PAGE[i:i + 7])
+        self.assertEqual(len(extractor.data.json_ld), 2)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+    test_fetch.py
+
+    Part of Argostimè
+    Test cases for crawler/fetch.py
+"""
+
+import io
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from argostime.crawler.extract import PageExtractor
+from argostime.crawler.fetch import fetch, session
+from argostime.crawler.replay import Corpus, RecordedResponse, RecordingAdapter
+
+PAGE = ('<html><head><meta property="og:title" content="Thee"></head><body>'
+        + "<p>filler</p>" * 10000 + "</body></html>").encode("utf-8")
+
+class PageStream(io.BytesIO):
+
+    bytes_read: int = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+class PageAdapter(BaseAdapter):
+
+    def __init__(self):
+        super().__init__()
+        self.stream = PageStream(PAGE)
+
+    def send(self, request, **kwargs):
+        self.stream = PageStream(PAGE)
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response.encoding = "utf-8"
+        response.raw = self.stream
+        return response
+
+    def close(self):
+        pass
+
+class FetchTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.adapter = PageAdapter()
+        session.mount("https://fetch.test/", self.adapter)
+
+    def tearDown(self):
+        del session.adapters["https://fetch.test/"]
+
+    def test_full_download(self):
+        response = fetch("https://fetch.test/page")
+        self.assertEqual(response.content, PAGE)
+
+    def test_stop_at(self):
+        response = fetch("https://fetch.test/page", stop_at="</head>")
+        self.assertTrue(response.text.endswith("</head>"))
+        self.assertLess(self.adapter.stream.bytes_read, len(PAGE))
+
+    def test_max_bytes(self):
+        response = fetch("https://fetch.test/page", max_bytes=100)
+        self.assertEqual(len(response.content), 100)
+
+    def test_extractor(self):
+        extractor = PageExtractor(meta=("og:title",))
+        fetch("https://fetch.test/page", extractor=extractor)
+        self.assertEqual(extractor.data.meta["og:title"], "Thee")
+        self.assertLess(self.adapter.stream.bytes_read, len(PAGE))
+
+class RecordingTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.corpus = Corpus(self.directory.name)
+        self.corpus.save(RecordedResponse("https://record.test/page", 200, body=PAGE))
+        session.mount("https://record.test/", RecordingAdapter(self.corpus))
+
+    def tearDown(self):
+        del session.adapters["https://record.test/"]
+        self.directory.cleanup()
+
+    def send(self, status_code, body=b""):
+        def respond(adapter, request, *args, **kwargs):
+            return RecordedResponse(request.url, status_code, body=body).to_response(request)
+        return mock.patch.object(HTTPAdapter, "send", respond)
+
+    def test_not_modified_not_recorded(self):
+        with self.send(304):
+            session.get("https://record.test/page", headers={"If-None-Match": '"v1"'})
+        self.assertEqual(self.corpus.load("https://record.test/page").body, PAGE)
+
+    def test_modified_recorded(self):
+        with self.send(200, b"<html></html>"):
+            session.get("https://record.test/page", headers={"If-None-Match": '"v1"'})
+        self.assertEqual(self.corpus.load("https://record.test/page").body, b"<html></html>")
+
+    def test_decoded_headers_dropped(self):
+        response = requests.Response()
+        response.url = "https://record.test/page"
+        response.status_code = 200
+        response.headers = requests.structures.CaseInsensitiveDict({
+            "content-encoding": "gzip", "Content-Length": "42", "Content-Type": "text/html"})
+        response._content = PAGE  # pylint: disable=W0212
+        self.assertEqual(RecordedResponse.from_response(response).headers,
+                         {"Content-Type": "text/html"})
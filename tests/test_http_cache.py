@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+    test_http_cache.py
+
+    Part of Argostimè
+    Test cases for crawler/http_cache.py
+"""
+
+from datetime import datetime
+import os.path
+import tempfile
+import unittest
+
+import requests
+
+from argostime.crawler.crawl_utils import CrawlResult
+from argostime.crawler.http_cache import HTTPCache
+from argostime.exceptions import NotModifiedException
+
+def make_response(status_code: int, body: bytes = b"", etag: str = "") -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body  # pylint: disable=W0212
+    if etag:
+        response.headers["ETag"] = etag
+    return response
+
+class HTTPCacheTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = HTTPCache(os.path.join(self.directory.name, "cache.sqlite"), 4096)
+        self.result = CrawlResult(
+            url="https://example.com/p/1", product_name="Thee", product_code="1",
+            normal_price=2.5)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def crawl(self, response: requests.Response) -> CrawlResult:
+        with self.cache.crawl(self.result.url, "example.com") as entry:
+            try:
+                entry.conditional_headers(self.result.url)
+                entry.check_response(self.result.url, response)
+            except NotModifiedException as exception:
+                return self.cache.record_hit(entry, exception)
+            self.cache.record_miss(entry, self.result)
+            return self.result
+
+    def test_conditional_headers(self):
+        self.crawl(make_response(200, b"<html></html>", etag='"abc"'))
+        entry = self.cache.get(self.result.url, "example.com")
+        self.assertEqual(entry.conditional_headers(self.result.url), {"If-None-Match": '"abc"'})
+        self.assertEqual(entry.conditional_headers("https://example.com/other"), {})
+
+    def test_not_modified(self):
+        self.crawl(make_response(200, b"<html></html>"))
+        result = self.crawl(make_response(304))
+        self.assertEqual(result.normal_price, 2.5)
+        statistics = self.cache.statistics["example.com"]
+        self.assertEqual((statistics.hits, statistics.misses), (1, 1))
+        self.assertEqual(statistics.bytes_saved, len(b"<html></html>"))
+
+    def test_identical_body(self):
+        self.crawl(make_response(200, b"<html></html>"))
+        self.crawl(make_response(200, b"<html></html>"))
+        self.assertEqual(self.cache.statistics["example.com"].hits, 1)
+        self.crawl(make_response(200, b"<html>changed</html>"))
+        self.assertEqual(self.cache.statistics["example.com"].misses, 2)
+
+    def test_valid_until(self):
+        self.result.valid_until = datetime(2023, 6, 5)
+        self.crawl(make_response(200, b"<html></html>"))
+        result = self.crawl(make_response(304))
+        self.assertEqual(result.valid_until, datetime(2023, 6, 5))
+
+    def test_lru_eviction(self):
+        for i in range(100):
+            self.result.url = f"https://example.com/p/{i}"
+            self.crawl(make_response(200, b"<html></html>"))
+        self.assertIsNone(self.cache.get("https://example.com/p/0", "example.com").result)
+        self.assertIsNotNone(self.cache.get("https://example.com/p/99", "example.com").result)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+    test_log.py
+
+    Part of Argostimè
+    Test cases for log.py
+"""
+
+import logging
+import queue
+import unittest
+
+from flask import Flask
+from sqlalchemy import event
+
+from argostime import db
+from argostime.log import ModuleLevelFilter, TruncatingQueueHandler, parse_level
+from argostime.models import Product, ProductOffer, Webshop
+
+def make_record(module: str, level: int, msg: str, *args) -> logging.LogRecord:
+    return logging.LogRecord("root", level, f"/argostime/{module}.py", 1, msg, args, None)
+
+class LogTestCases(unittest.TestCase):
+
+    def test_module_levels(self):
+        module_filter = ModuleLevelFilter({"ah": logging.INFO})
+        self.assertFalse(module_filter.filter(make_record("ah", logging.DEBUG, "dump")))
+        self.assertTrue(module_filter.filter(make_record("ah", logging.ERROR, "error")))
+        self.assertTrue(module_filter.filter(make_record("fetch", logging.DEBUG, "debug")))
+
+    def test_long_messages_are_truncated(self):
+        handler = TruncatingQueueHandler(queue.SimpleQueue(), 100)
+        handler.handle(make_record("ah", logging.DEBUG, "Product JSON %s", "x" * 1000))
+        handler.handle(make_record("ah", logging.DEBUG, "Short %s", "message"))
+
+        record = handler.queue.get_nowait()
+        self.assertEqual(len(record.getMessage()), 100 + len("... (913 characters truncated)"))
+        self.assertTrue(record.getMessage().startswith("Product JSON xxx"))
+        self.assertEqual(handler.queue.get_nowait().getMessage(), "Short message")
+
+    def test_parse_level(self):
+        self.assertEqual(parse_level("ah", " info"), logging.INFO)
+        self.assertIsNone(parse_level("ah", "FOO"))
+        self.assertEqual(parse_level("level", "verbose", logging.DEBUG), logging.DEBUG)
+
+
+class ModelStrTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        shop = Webshop(name="Shop", hostname="shop.test")
+        product = Product(name="Product", product_code="code")
+        db.session.add_all((shop, product))
+        db.session.commit()
+        db.session.add(ProductOffer(product_id=product.id, shop_id=shop.id,
+                                    url="https://shop.test/product"))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def test_str_does_not_query(self):
+        product = db.session.scalar(db.select(Product))
+        offer = db.session.scalar(db.select(ProductOffer))
+        db.session.expire(offer)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            self.assertEqual(
+                str(product),
+                "Product(id=1, name=Product, description=None, ean=None, product_code=code)")
+            self.assertEqual(str(offer),
+                             "ProductOffer(id=?, product_id=?, shop_id=?, url=?, time_added=?)")
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        self.assertEqual(statements, [])
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+    test_migrations.py
+
+    Part of Argostimè
+    Test cases for migrations.py
+"""
+
+from datetime import datetime
+import unittest
+
+from flask import Flask
+
+from argostime import db
+from argostime.migrations import MIGRATIONS, SchemaOperations, applied_versions
+from argostime.migrations import check_indexes, migrate
+from argostime.models import Price, Product, ProductOffer, Webshop
+
+# Tables as they were created before the columns and indexes were added
+OLD_SCHEMA = (
+    'CREATE TABLE "Webshop" (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(512) NOT NULL UNIQUE, '
+    'hostname VARCHAR(512) NOT NULL UNIQUE)',
+    'CREATE TABLE "Product" (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(512) NOT NULL, '
+    'description VARCHAR(1024), ean INTEGER, product_code VARCHAR(512) UNIQUE)',
+    'CREATE TABLE "ProductOffer" (id INTEGER NOT NULL PRIMARY KEY, product_id INTEGER NOT NULL, '
+    'shop_id INTEGER NOT NULL, url VARCHAR(1024) NOT NULL UNIQUE, time_added DATETIME)',
+    'CREATE TABLE "Price" (id INTEGER NOT NULL PRIMARY KEY, normal_price FLOAT, '
+    'discount_price FLOAT, on_sale BOOLEAN, datetime DATETIME, product_offer_id INTEGER NOT NULL)',
+    'CREATE INDEX "idx_Price_product_offer" ON "Price" (product_offer_id)',
+)
+
+class MigrationsTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def create_old_schema(self):
+        with db.engine.begin() as connection:
+            for statement in OLD_SCHEMA:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(
+                "INSERT INTO \"Webshop\" VALUES (1, 'Shop', 'shop.test')")
+            connection.exec_driver_sql(
+                "INSERT INTO \"Product\" VALUES (1, 'Product', NULL, NULL, 'code')")
+            connection.exec_driver_sql(
+                "INSERT INTO \"ProductOffer\" VALUES (1, 1, 1, 'https://shop.test/1', ?)",
+                (datetime(2023, 1, 1),))
+            for i, price in enumerate((2.0, 1.0, 3.0)):
+                connection.exec_driver_sql(
+                    "INSERT INTO \"Price\" VALUES (?, ?, NULL, 0, ?, 1)",
+                    (i + 1, price, datetime(2023, 1, 2 + i)))
+
+    def test_new_database(self):
+        applied = migrate()
+        self.assertEqual([migration.version for migration in applied], [1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
+        self.assertEqual(applied_versions(), {1, 2, 3, 4, 5, 6, 7, 8, 9, 10})
+        self.assertEqual(migrate(), [])
+
+        operations = SchemaOperations()
+        for table in db.metadata.sorted_tables:
+            self.assertEqual(operations.columns(table.name), set(table.c.keys()), table.name)
+        ean = [column for column in db.inspect(db.engine).get_columns("Product")
+               if column["name"] == "ean"][0]
+        self.assertEqual(str(ean["type"]), "BIGINT")
+        report = check_indexes()
+        self.assertTrue(report.ok(), report)
+        self.assertEqual(report.unused, [])
+
+    def test_old_database(self):
+        self.create_old_schema()
+        migrate()
+
+        offer = db.session.scalar(db.select(ProductOffer))
+        self.assertEqual(offer.average_price, 2.0)
+        self.assertEqual(offer.minimum_price, 1.0)
+        self.assertEqual(offer.maximum_price, 3.0)
+        self.assertIsNotNone(offer.next_crawl)
+
+        report = check_indexes()
+        self.assertTrue(report.ok(), report)
+        # Superseded by idx_Price_product_offer_id_datetime
+        self.assertEqual(report.unused, ["idx_Price_product_offer"])
+
+    def test_first_migration(self):
+        MIGRATIONS[0].apply(SchemaOperations())
+
+        operations = SchemaOperations()
+        self.assertEqual(set(db.inspect(db.engine).get_table_names()),
+                         {"Webshop", "Product", "ProductOffer", "Price"})
+        self.assertNotIn("next_crawl", operations.columns("ProductOffer"))
+        self.assertEqual(operations.indexes("Price"), set())
+
+    def test_rebuild_table(self):
+        self.create_old_schema()
+        db.create_all()
+
+        SchemaOperations(batch_size=2).rebuild_table("Price")
+
+        operations = SchemaOperations()
+        self.assertIn("idx_Price_datetime", operations.indexes("Price"))
+        self.assertNotIn("idx_Price_product_offer", operations.indexes("Price"))
+        prices = db.session.scalars(db.select(Price).order_by(Price.id)).all()
+        self.assertEqual([price.normal_price for price in prices], [2.0, 1.0, 3.0])
+        self.assertEqual(prices[2].datetime, datetime(2023, 1, 4))
+        self.assertEqual(db.session.scalar(db.select(Product)).product_code, "code")
+        self.assertEqual(db.session.scalar(db.select(Webshop)).hostname, "shop.test")
+
+    def test_writes_during_rebuild(self):
+        self.create_old_schema()
+        db.create_all()
+
+        class WritingOperations(SchemaOperations):
+            def _copy_batch(self, connection, statement, start):
+                super()._copy_batch(connection, statement, start)
+                if start == 1:
+                    # Another connection writes between the batches
+                    connection.exec_driver_sql(
+                        'UPDATE "Price" SET normal_price = 1.5 WHERE id IN (1, 3)')
+                    connection.exec_driver_sql('DELETE FROM "Price" WHERE id = 2')
+                    connection.exec_driver_sql(
+                        "INSERT INTO \"Price\" VALUES (4, 4.0, NULL, 0, ?, 1)",
+                        (datetime(2023, 1, 5),))
+
+        WritingOperations(batch_size=2).rebuild_table("Price")
+
+        self.assertEqual(
+            db.session.execute(db.select(Price.id, Price.normal_price).order_by(Price.id)).all(),
+            [(1, 1.5), (3, 1.5), (4, 4.0)])
+        self.assertEqual(
+            db.session.scalar(db.text("SELECT count(*) FROM sqlite_master WHERE type = 'trigger'")),
+            0)
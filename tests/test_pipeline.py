@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+    test_pipeline.py
+
+    Part of Argostimè
+    Test cases for crawler/pipeline.py, using the responses recorded in tests/corpus
+"""
+
+import os.path
+import threading
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from argostime.crawler import crawl_url
+from argostime.crawler.circuit_breaker import reset_breakers
+from argostime.crawler.fetch import use_network, use_replay
+from argostime.crawler.pipeline import CrawlPipeline, _FetchQueue, _Job
+
+CORPUS = os.path.join(os.path.dirname(__file__), "corpus")
+
+URLS = [
+    "https://www.ah.nl/producten/product/wi1525/ah-halfvolle-melk",
+    "https://www.brandzaak.nl/heren/jas-blauw",
+    "https://www.hema.nl/eten-drinken/rookworst-25200026.html",
+    "https://www.jumbo.com/producten/jumbo-jong-belegen-kaas-123456PAK",
+    "https://www.pipa-shop.nl/product/42/pijp-van-kersenhout",
+]
+
+class CrawlPipelineTestCases(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        use_replay(CORPUS)
+
+    @classmethod
+    def tearDownClass(cls):
+        use_network()
+        reset_breakers()
+
+    def run_pipeline(self, urls, **kwargs):
+        batches = []
+        pipeline = CrawlPipeline(fetch_workers=2, parse_workers=2, **kwargs)
+        results = pipeline.run(urls, batches.append)
+        return pipeline, results, batches
+
+    def test_same_results_as_crawl_url(self):
+        pipeline, results, _ = self.run_pipeline(URLS)
+        self.assertEqual(set(results), set(URLS))
+        for url in URLS:
+            expected = crawl_url(url)
+            self.assertEqual(results[url].product_code, expected.product_code)
+            self.assertAlmostEqual(results[url].normal_price, expected.normal_price)
+            self.assertAlmostEqual(results[url].discount_price, expected.discount_price)
+        self.assertEqual(pipeline.metrics["parse"].processed, len(URLS))
+        self.assertEqual(pipeline.failed, {})
+
+    def test_batches(self):
+        pipeline, _, batches = self.run_pipeline(URLS, batch_size=2)
+        self.assertEqual(sum(len(batch) for batch in batches), len(URLS))
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        self.assertEqual(pipeline.metrics["persist"].processed, len(batches))
+
+    def test_failures(self):
+        urls = [
+            "https://example.com/product",
+            "https://www.ah.nl/producten/product/wi0/niet-opgenomen",
+        ]
+        pipeline, results, batches = self.run_pipeline(URLS[:1] + urls)
+        self.assertEqual(list(results), URLS[:1])
+        self.assertEqual(set(pipeline.failed), set(urls))
+        self.assertEqual(len(batches), 1)
+
+    def test_stage_failure(self):
+        def fail(_executor):
+            raise BrokenProcessPool("A process in the pool was terminated")
+        with mock.patch.object(CrawlPipeline, "_parse_stage", side_effect=fail):
+            with self.assertLogs(level="ERROR"), self.assertRaises(BrokenProcessPool):
+                self.run_pipeline(URLS)
+
+    def test_fetch_queue(self):
+        fetch_queue = _FetchQueue(concurrency=1, delay_min=60, delay_max=60)
+        for url in ("https://www.ah.nl/1", "https://www.ah.nl/2", "https://www.jumbo.com/1"):
+            fetch_queue.put(_Job(url))
+        self.assertEqual(fetch_queue.get()[0], "www.ah.nl")
+        self.assertEqual(fetch_queue.get()[0], "www.jumbo.com")
+        self.assertIsNone(fetch_queue.get(timeout=0.01))
+        fetch_queue.release("www.ah.nl")
+        # Still waiting for the delay
+        self.assertIsNone(fetch_queue.get(timeout=0.01))
+
+        # Waits for www.ah.nl until the queue is closed
+        waiting = threading.Thread(target=fetch_queue.get)
+        waiting.start()
+        fetch_queue.close()
+        waiting.join(timeout=1)
+        self.assertFalse(waiting.is_alive())
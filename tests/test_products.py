@@ -6,13 +6,170 @@
     Test cases for products.py
 """
 
+from datetime import datetime, timedelta
 import unittest
+from unittest import mock
+
+from flask import Flask
 
 import argostime.products
 import argostime.exceptions
+from argostime import db
+from argostime.crawler import CrawlResult
+from argostime.models import CheapestOffer, Price, Product, ProductOffer, Watch
 
 class ProductsTestCases(unittest.TestCase):
 
     def test_not_implemented_website(self):
         with self.assertRaises(argostime.exceptions.WebsiteNotImplementedException):
             argostime.products.add_product_offer_from_url("https://example.com")
+
+
+class EANTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        shops = {
+            hostname: {"name": hostname, "hostname": hostname, "crawler": None,
+                       "batch_crawler": None, "cacheable": True, "parser": "html.parser"}
+            for hostname in ("shop-a.test", "shop-b.test")
+        }
+        patcher = mock.patch.dict(argostime.products.enabled_shops, shops)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def add(self, url: str, product_code: str, ean=None):
+        result = CrawlResult(url=url, product_name="Product", product_code=product_code,
+                             normal_price=1.0, ean=ean)
+        with mock.patch.object(argostime.products, "crawl_url", return_value=result):
+            return argostime.products.add_product_offer_from_url(url)[1]
+
+    def test_match_on_add(self):
+        offer_a = self.add("https://shop-a.test/1", "a-1", 8711439123456)
+        offer_b = self.add("https://shop-b.test/1", "b-1", 8711439123456)
+        offer_c = self.add("https://shop-b.test/2", "b-2", None)
+
+        self.assertEqual(offer_a.product_id, offer_b.product_id)
+        self.assertNotEqual(offer_a.product_id, offer_c.product_id)
+        self.assertEqual(offer_a.product.ean, 8711439123456)
+
+    def test_backfill(self):
+        offer_a = self.add("https://shop-a.test/1", "a-1")
+        offer_b = self.add("https://shop-b.test/1", "b-1")
+        self.add("https://shop-b.test/2", "b-2")
+        product_id = offer_a.product_id
+
+        eans = {"https://shop-a.test/1": 8711439123456, "https://shop-b.test/1": 8711439123456}
+
+        def crawl(url):
+            return CrawlResult(url=url, product_name="Product", product_code="code",
+                               normal_price=2.0, ean=eans.get(url))
+
+        with mock.patch.object(argostime.products, "crawl_url", side_effect=crawl):
+            self.assertEqual(argostime.products.backfill_eans(delay=0), 2)
+
+        self.assertEqual(db.session.get(ProductOffer, offer_b.id).product_id, product_id)
+        self.assertEqual(db.session.scalar(db.select(db.func.count(Product.id))), 2)
+        self.assertEqual(db.session.get(Product, product_id).ean, 8711439123456)
+        self.assertEqual(db.session.get(ProductOffer, offer_b.id).get_current_price().normal_price,
+                         2.0)
+
+    def test_merge_keeps_watches(self):
+        offer_a = self.add("https://shop-a.test/1", "a-1")
+        offer_b = self.add("https://shop-b.test/1", "b-1")
+        watch = Watch(product_id=offer_b.product_id, kind="sale", contact="a@example.com",
+                      created=datetime.now())
+        db.session.add(watch)
+        db.session.commit()
+
+        product = argostime.products.merge_products([offer_a.product, offer_b.product])
+        self.assertEqual(db.session.get(Watch, watch.id).product_id, product.id)
+        self.assertEqual(product.id, offer_a.product_id)
+
+    def test_cheapest_offer(self):
+        offer_a = self.add("https://shop-a.test/1", "a-1", 8711439123456)
+        cheapest = db.session.get(CheapestOffer, offer_a.product_id)
+        self.assertEqual((cheapest.price, cheapest.savings, cheapest.offers), (1.0, 0.0, 1))
+
+        offer_b = self.add("https://shop-b.test/1", "b-1", 8711439123456)
+        offer_b.add_crawl_result(CrawlResult(url=offer_b.url, product_name="Product",
+                                             product_code="b-1", normal_price=0.5))
+        cheapest = db.session.get(CheapestOffer, offer_a.product_id)
+        self.assertEqual(cheapest.product_offer_id, offer_b.id)
+        self.assertEqual((cheapest.price, cheapest.maximum_price), (0.5, 1.0))
+        self.assertEqual((cheapest.savings, cheapest.offers), (0.5, 2))
+
+        # Prices stored in one batch
+        argostime.products.store_crawl_results([
+            (offer_a, CrawlResult(url=offer_a.url, normal_price=0.4)),
+            (offer_b, CrawlResult(url=offer_b.url, normal_price=3.0)),
+        ])
+        db.session.commit()
+        cheapest = db.session.get(CheapestOffer, offer_a.product_id)
+        self.assertEqual((cheapest.product_offer_id, cheapest.savings), (offer_a.id, 2.6))
+
+    def test_cheapest_offer_price_rises(self):
+        offer_a = self.add("https://shop-a.test/1", "a-1", 8711439123456)
+        offer_b = self.add("https://shop-b.test/1", "b-1", 8711439123456)
+        offer_b.add_crawl_result(CrawlResult(url=offer_b.url, normal_price=0.5))
+        offer_b.add_crawl_result(CrawlResult(url=offer_b.url, normal_price=2.0))
+
+        cheapest = db.session.get(CheapestOffer, offer_a.product_id)
+        self.assertEqual(cheapest.product_offer_id, offer_a.id)
+        self.assertEqual((cheapest.price, cheapest.maximum_price, cheapest.offers), (1.0, 2.0, 2))
+
+    def test_cheapest_offer_ignores_stale_prices(self):
+        offer_a = self.add("https://shop-a.test/1", "a-1")
+        stale = ProductOffer(product_id=offer_a.product_id, shop_id=offer_a.shop_id,
+                             url="https://shop-a.test/2", time_added=datetime.now())
+        db.session.add(stale)
+        db.session.commit()
+        db.session.add(Price(normal_price=0.1, discount_price=-1, on_sale=False,
+                             datetime=datetime.now() - timedelta(days=365),
+                             product_offer_id=stale.id))
+        db.session.commit()
+
+        offer_a.product.update_cheapest_offer()
+        cheapest = db.session.get(CheapestOffer, offer_a.product_id)
+        self.assertEqual((cheapest.product_offer_id, cheapest.offers), (offer_a.id, 1))
+
+    def test_cheapest_offer_queries(self):
+        offer_a = self.add("https://shop-a.test/1", "a-1")
+
+        def add_offers(first, count):
+            for i in range(first, first + count):
+                offer = ProductOffer(product_id=offer_a.product_id, shop_id=offer_a.shop_id,
+                                     url=f"https://shop-a.test/other/{i}",
+                                     time_added=datetime.now())
+                db.session.add(offer)
+                db.session.commit()
+                offer.add_crawl_result(CrawlResult(url=offer.url, normal_price=2.0 + i))
+
+        def queries(price):
+            statements = []
+            def count(connection, cursor, statement, *args):
+                statements.append(statement)
+            db.event.listen(db.engine, "before_cursor_execute", count)
+            offer_a.add_crawl_result(CrawlResult(url=offer_a.url, normal_price=price))
+            db.event.remove(db.engine, "before_cursor_execute", count)
+            return len(statements)
+
+        add_offers(0, 1)
+        before = queries(0.9)
+        # No query for the current price of every other offer
+        add_offers(1, 9)
+        self.assertEqual(queries(0.8), before)
+
+        cheapest = db.session.get(CheapestOffer, offer_a.product_id)
+        self.assertEqual((cheapest.price, cheapest.maximum_price, cheapest.offers), (0.8, 11.0, 11))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+    test_profiling.py
+
+    Part of Argostimè
+    Test cases for profiling.py
+"""
+
+from collections import Counter
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+from argostime import profiling
+from argostime.profiling import SamplingProfiler, profile_crawl, profile_signature
+
+def busy_loop(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+class ProfilingTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = patch.object(profiling, "DIRECTORY", self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def profiles(self):
+        return sorted(os.listdir(self.directory.name))
+
+    def test_sampler(self):
+        profiler = SamplingProfiler(threading.get_ident(), interval=0.001)
+        profiler.start()
+        busy_loop(0.1)
+        stacks = profiler.stop()
+        self.assertTrue(any("busy_loop (test_profiling.py:" in stack for stack in stacks))
+
+    def test_profile_crawl_disabled(self):
+        with patch.object(profiling, "ENABLED", False):
+            with profile_crawl("ah.nl"):
+                busy_loop(0.02)
+        self.assertEqual(self.profiles(), [])
+
+    def test_profile_crawl(self):
+        with patch.object(profiling, "ENABLED", True), \
+                patch.object(profiling, "INTERVAL", 0.001):
+            with profile_crawl("www.ah.nl"):
+                busy_loop(0.05)
+        profiles = self.profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].endswith("-crawl-www.ah.nl.collapsed"))
+        with open(os.path.join(self.directory.name, profiles[0]), encoding="utf-8") as file:
+            stack, count = file.readline().rsplit(" ", 1)
+        self.assertIn("busy_loop", stack)
+        self.assertGreater(int(count), 0)
+
+    def test_directory_is_bounded(self):
+        with patch.object(profiling, "MAX_FILES", 3):
+            for i in range(5):
+                profiling.write_profile("crawl", f"shop{i}", Counter({"main": 1}))
+        profiles = self.profiles()
+        self.assertEqual(len(profiles), 3)
+        self.assertTrue(profiles[0].endswith("-crawl-shop2.collapsed"))
+
+    def test_signed_request(self):
+        app = Flask(__name__)
+
+        @app.route("/slow")
+        def slow():
+            busy_loop(0.05)
+            return "ok"
+
+        with patch.object(profiling, "SECRET", "secret"), \
+                patch.object(profiling, "INTERVAL", 0.001):
+            profiling.init_app(app)
+            client = app.test_client()
+            client.get("/slow")
+            client.get("/slow?profile=invalid")
+            self.assertEqual(self.profiles(), [])
+
+            client.get(f"/slow?profile={profile_signature('/slow')}")
+            profiles = self.profiles()
+            self.assertEqual(len(profiles), 1)
+            self.assertTrue(profiles[0].endswith("-request-slow.collapsed"))
+
+    def test_no_hooks_when_off(self):
+        app = Flask(__name__)
+        with patch.object(profiling, "ENABLED", False), patch.object(profiling, "SECRET", ""):
+            profiling.init_app(app)
+        self.assertEqual(app.before_request_funcs, {})
+        self.assertEqual(app.teardown_request_funcs, {})
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+    test_scheduler.py
+
+    Part of Argostimè
+    Test cases for scheduler.py
+"""
+
+from datetime import datetime, timedelta
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from argostime import db, scheduler
+from argostime.models import Price, Product, ProductOffer, Webshop, get_budget_factor
+from argostime.models import load_price_histories
+from argostime.products import carry_valid_prices_forward, schedule_all_offers
+from argostime.scheduler import MAX_INTERVAL, MIN_INTERVAL, PriceHistory, plan_interval
+from argostime.scheduler import respect_valid_until
+
+NOW = datetime(2023, 6, 1, 12)
+
+def daily_prices(effective_prices, on_sale=()):
+    """Return Price objects of one crawl per day, ending yesterday."""
+    start = NOW - timedelta(days=len(effective_prices))
+    prices = []
+    for i, price in enumerate(effective_prices):
+        if i in on_sale:
+            prices.append(Price(normal_price=price * 2, discount_price=price, on_sale=True,
+                                datetime=start + timedelta(days=i)))
+        else:
+            prices.append(Price(normal_price=price, discount_price=-1, on_sale=False,
+                                datetime=start + timedelta(days=i)))
+    return prices
+
+class SchedulerTestCases(unittest.TestCase):
+
+    def test_history(self):
+        history = PriceHistory.from_prices(daily_prices([1, 1, 2, 2, 1], on_sale=(4,)), NOW)
+        self.assertEqual(history.observations, 5)
+        self.assertEqual(history.changes, 2)
+        self.assertEqual(history.sales, 1)
+        self.assertEqual(history.since_last_change, timedelta(days=1))
+        self.assertAlmostEqual(history.days, 5)
+
+    def test_new_offer(self):
+        self.assertEqual(plan_interval(PriceHistory()), scheduler.DEFAULT_INTERVAL)
+
+    def test_static_offer_weekly(self):
+        history = PriceHistory.from_prices(daily_prices([5.0] * 365), NOW)
+        self.assertEqual(plan_interval(history), MAX_INTERVAL)
+
+    def test_fast_mover_several_times_a_day(self):
+        history = PriceHistory.from_prices(daily_prices([1, 2] * 30), NOW)
+        self.assertLess(plan_interval(history), timedelta(hours=12))
+        self.assertGreaterEqual(plan_interval(history), MIN_INTERVAL)
+
+    def test_weekly_sales_between(self):
+        sales = [i for i in range(90) if i % 7 == 0]
+        history = PriceHistory.from_prices(daily_prices([3.0] * 90, on_sale=sales), NOW)
+        self.assertLess(plan_interval(history), MAX_INTERVAL)
+        self.assertGreater(plan_interval(history), MIN_INTERVAL)
+
+    def test_budget_stretches_intervals(self):
+        intervals = [timedelta(hours=6)] * 10
+        with mock.patch.object(scheduler, "DAILY_BUDGET", 20):
+            self.assertAlmostEqual(scheduler.budget_factor(intervals), 2)
+        self.assertEqual(scheduler.budgeted_interval(PriceHistory(), 2), 2 * scheduler.DEFAULT_INTERVAL)
+
+    def test_no_budget(self):
+        self.assertEqual(scheduler.budget_factor([timedelta(hours=4)] * 1000), 1)
+
+    def test_valid_until_postpones(self):
+        with mock.patch.object(scheduler, "VALID_UNTIL_RECHECK", timedelta(0)):
+            self.assertEqual(
+                respect_valid_until(NOW + timedelta(hours=6), NOW + timedelta(days=5), NOW),
+                NOW + timedelta(days=5))
+
+    def test_valid_until_recheck(self):
+        with mock.patch.object(scheduler, "VALID_UNTIL_RECHECK", timedelta(days=2)):
+            self.assertEqual(
+                respect_valid_until(NOW + timedelta(hours=6), NOW + timedelta(days=5), NOW),
+                NOW + timedelta(days=2))
+
+    def test_valid_until_ends_before_next_crawl(self):
+        self.assertEqual(
+            respect_valid_until(NOW + timedelta(days=7), NOW + timedelta(days=1), NOW),
+            NOW + timedelta(days=1))
+        self.assertEqual(respect_valid_until(NOW, None, NOW), NOW)
+
+
+class PriceHistoriesTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        shop = Webshop(name="Shop", hostname="shop.test")
+        db.session.add(shop)
+        db.session.commit()
+        self.offers = []
+        for i in range(3):
+            product = Product(name=f"Product {i}", product_code=f"code-{i}")
+            db.session.add(product)
+            db.session.commit()
+            offer = ProductOffer(product_id=product.id, shop_id=shop.id,
+                                 url=f"https://shop.test/{i}", time_added=NOW)
+            db.session.add(offer)
+            db.session.commit()
+            self.offers.append(offer)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def test_same_as_from_prices(self):
+        prices = {
+            self.offers[0].id: daily_prices([1, 1, 2, 2, 1], on_sale=(4,)),
+            self.offers[1].id: daily_prices([1, 2] * 30),
+        }
+        for offer_id, offer_prices in prices.items():
+            for price in offer_prices:
+                price.product_offer_id = offer_id
+            db.session.add_all(offer_prices)
+        db.session.commit()
+
+        with mock.patch("argostime.models.HISTORY_BATCH_SIZE", 7):
+            histories = list(load_price_histories(NOW - scheduler.HISTORY, NOW))
+        self.assertEqual(histories, [
+            (offer_id, PriceHistory.from_prices(offer_prices, NOW), offer_prices[-1].datetime)
+            for offer_id, offer_prices in prices.items()
+        ])
+
+    def test_schedule_all_offers(self):
+        # No prices in the history of the first offer
+        old_price = daily_prices([1.0])[0]
+        old_price.product_offer_id = self.offers[0].id
+        db.session.add(old_price)
+        last = datetime.now() - timedelta(days=1)
+        db.session.add_all(
+            Price(normal_price=5.0, discount_price=-1, on_sale=False,
+                  datetime=last - timedelta(days=day), product_offer_id=self.offers[1].id)
+            for day in range(30)
+        )
+        db.session.commit()
+
+        schedule_all_offers()
+        self.assertLessEqual(self.offers[0].next_crawl, datetime.now())
+        self.assertEqual(self.offers[1].next_crawl, last + MAX_INTERVAL)
+        self.assertLessEqual(self.offers[2].next_crawl, datetime.now())
+
+    def test_budget_used_by_workers(self):
+        self.assertEqual(get_budget_factor(), 1.0)
+        with mock.patch.object(scheduler, "DAILY_BUDGET", 1):
+            schedule_all_offers()
+        factor = get_budget_factor()
+        self.assertGreater(factor, 1.0)
+
+        # Another worker plans the next crawl with the stored factor
+        db.session.remove()
+        offer = db.session.get(ProductOffer, self.offers[0].id)
+        before = datetime.now()
+        offer.schedule_next_crawl()
+        self.assertGreaterEqual(offer.next_crawl, before + scheduler.DEFAULT_INTERVAL * factor)
+
+    def test_carry_valid_prices_forward(self):
+        now = datetime.now()
+        for offer, days in zip(self.offers, (1, 0, 1)):
+            offer.next_crawl = now + timedelta(days=2)
+            offer.price_valid_until = now + timedelta(days=3)
+            db.session.add(Price(normal_price=2.0, discount_price=1.0, on_sale=True,
+                                 datetime=now - timedelta(days=days), product_offer_id=offer.id))
+        # The guarantee ended
+        self.offers[2].price_valid_until = now - timedelta(hours=1)
+        db.session.commit()
+
+        self.assertEqual(carry_valid_prices_forward(), 1)
+        db.session.expire_all()
+        self.assertEqual([len(offer.prices) for offer in self.offers], [2, 1, 1])
+        self.assertEqual(self.offers[0].get_current_price().discount_price, 1.0)
+        self.assertEqual(self.offers[0].average_price, 1.0)
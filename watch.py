@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+    watch.py
+
+    Standalone script to add, list and remove price watches, and to send the
+    notifications of the triggered watches.
+
+    Copyright (c) 2023 Martijn <martijn [at] mrtijn.nl>
+
+    This file is part of Argostimè.
+
+    Argostimè is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Argostimè is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Argostimè. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+from datetime import datetime
+import sys
+
+from argostime.alerts import SINKS, WatchKind, deliver_notifications
+from argostime.models import Product, ProductOffer, Watch
+from argostime import create_app, db
+
+parser = argparse.ArgumentParser(description="Manage price watches.")
+commands = parser.add_subparsers(dest="command", required=True)
+
+add = commands.add_parser("add", help="watch an offer or all offers of a product")
+target = add.add_mutually_exclusive_group(required=True)
+target.add_argument("--offer", type=int, help="id of the offer")
+target.add_argument("--product", help="product code of the product")
+condition = add.add_mutually_exclusive_group(required=True)
+condition.add_argument("--below", type=float, metavar="PRICE",
+                       help="notify when the price drops below PRICE")
+condition.add_argument("--sale", action="store_true", help="notify when it goes on sale")
+condition.add_argument("--low", action="store_true",
+                       help="notify when the price is lower than ever before")
+add.add_argument("contact", help="e-mail address, or label for the file and webhook sinks")
+
+commands.add_parser("list", help="show all watches")
+
+remove = commands.add_parser("remove", help="remove a watch")
+remove.add_argument("id", type=int)
+
+send = commands.add_parser("send", help="send the notifications that have not been sent yet")
+send.add_argument("--sink", choices=list(SINKS),
+                  help="sink to send them with, by default the one in argostime.conf")
+
+args = parser.parse_args()
+
+app = create_app()
+app.app_context().push()
+
+if args.command == "add":
+    if args.offer is not None and db.session.get(ProductOffer, args.offer) is None:
+        sys.exit(f"No offer with id {args.offer}")
+    product_id = None
+    if args.product is not None:
+        product_id = db.session.scalar(
+            db.select(Product.id).where(Product.product_code == args.product))
+        if product_id is None:
+            sys.exit(f"No product with product code {args.product}")
+
+    kind: WatchKind = WatchKind.LOW
+    if args.below is not None:
+        kind = WatchKind.BELOW
+    elif args.sale:
+        kind = WatchKind.SALE
+
+    watch = Watch(product_offer_id=args.offer, product_id=product_id, kind=kind.value,
+                  threshold=args.below, contact=args.contact, created=datetime.now())
+    db.session.add(watch)
+    db.session.commit()
+    print(f"Added {watch}")
+elif args.command == "list":
+    for watch in db.session.scalars(db.select(Watch).order_by(Watch.id)).all():
+        print(watch)
+elif args.command == "remove":
+    watch = db.session.get(Watch, args.id)
+    if watch is None:
+        sys.exit(f"No watch with id {args.id}")
+    db.session.delete(watch)
+    db.session.commit()
+else:
+    sink = SINKS[args.sink]() if args.sink else None
+    print(f"Sent {deliver_notifications(sink)} notifications")